@@ -0,0 +1,169 @@
+"""
+Game start benchmark: cold page cache, cache warmed by the launcher
+(core.prefetch) and fully warm cache.
+
+Builds a synthetic client (or uses an existing one with --client), learns
+its startup profile from a stand-in game process that opens the files the
+way the client does, then times that start reading every profiled file:
+
+    python benchmarks/bench_prefetch.py --size-mb 1024 --files 600
+    python benchmarks/bench_prefetch.py --client "C:/Lineage II" --output results/prefetch.json
+
+The cold cache is obtained by evicting the client's files with
+posix_fadvise(DONTNEED), so the cold scenarios only run where it exists
+(Linux); elsewhere only the warmed and warm starts are measured.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from core.prefetch import Prefetcher, StartupProfile, learn, READ_BLOCK
+from bench_update import make_client, git_commit
+
+# Stand-in game: opens the files listed in argv[1] in order, reads them and
+# keeps them open, like the client loading its packages, then exits
+GAME = '''
+import sys, time
+files = []
+for path in open(sys.argv[1], encoding='utf-8').read().splitlines():
+    f = open(path, 'rb')
+    while f.read(1 << 20):
+        pass
+    files.append(f)
+    time.sleep(0.005)
+time.sleep(0.5)
+'''
+
+def evict(paths):
+    """Drop the files from the page cache."""
+    for path in paths:
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def game_start(paths) -> dict:
+    """Read the startup files in order, as the client does; returns seconds and MB/s."""
+    buffer = bytearray(READ_BLOCK)
+    view = memoryview(buffer)
+    total = 0
+    started = time.perf_counter()
+    for path in paths:
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                read = f.readinto(view)
+                if not read:
+                    break
+                total += read
+    seconds = time.perf_counter() - started
+    return {'seconds': round(seconds, 4), 'bytes': total,
+            'mb_per_s': round(total / 1024 ** 2 / seconds, 1) if seconds else None}
+
+def learn_profile(client: str, profile: StartupProfile, order) -> dict:
+    """Learn the profile from the stand-in game; reports whether the order was recovered."""
+    list_path = profile.path + '.order'
+    with open(list_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(order))
+    started = time.perf_counter()
+    game = subprocess.Popen([sys.executable, '-c', GAME, list_path])
+    learned = learn(game.pid, profile, seconds=120)
+    game.wait()
+    profile.save(learned, None)
+    expected = [profile.relative(path) for path in order]
+    return {'seconds': round(time.perf_counter() - started, 4), 'files': len(learned),
+            'expected_files': len(expected), 'same_order': learned == expected}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del arranque del juego con la caché precargada')
+    parser.add_argument('--size-mb', type=float, default=512, help='tamaño total del cliente sintético')
+    parser.add_argument('--files', type=int, default=300, help='número de archivos')
+    parser.add_argument('--client', help='carpeta de un cliente real (se usa su perfil aprendido)')
+    parser.add_argument('--memory-share', type=float, default=0.5, help='parte de la memoria libre a usar')
+    parser.add_argument('--idle', type=float, default=2.0,
+                        help='segundos entre la precarga y pulsar Jugar (el launcher en reposo)')
+    parser.add_argument('--output', help='archivo JSON de resultados')
+    parser.add_argument('--keep', action='store_true', help='no borrar la carpeta de trabajo')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='l2bench-')
+    results = {}
+    try:
+        if args.client:
+            client = args.client
+            profile = StartupProfile(client)
+        else:
+            client = os.path.join(work, 'client')
+            t = time.perf_counter()
+            make_client(client, int(args.size_mb * 1024 * 1024), args.files)
+            print(f'Cliente sintético: {args.size_mb:g} MB en {args.files} archivos ({time.perf_counter() - t:.1f}s)')
+            profile = StartupProfile(client, os.path.join(work, 'startup_files.json'))
+            order = sorted(os.path.join(root, name) for root, _, names in os.walk(client) for name in names)
+            random.Random(1).shuffle(order)
+            results['learn'] = learn_profile(client, profile, order)
+            print(f"Aprendizaje: {results['learn']['files']}/{results['learn']['expected_files']} archivos, "
+                  f"orden {'correcto' if results['learn']['same_order'] else 'distinto'}")
+        paths = profile.files()
+        for path in paths:
+            # Make sure nothing dirty stays in the cache
+            with open(path, 'rb') as f:
+                os.fsync(f.fileno())
+
+        prefetcher = Prefetcher(client, args.memory_share)
+        prefetcher.profile = profile
+        can_evict = hasattr(os, 'posix_fadvise')
+        if can_evict:
+            evict(paths)
+            results['cold'] = game_start(paths)
+            evict(paths)
+            started = time.perf_counter()
+            prefetcher.run()
+            results['prefetch'] = {'seconds': round(time.perf_counter() - started, 4), 'bytes': prefetcher.done}
+            time.sleep(args.idle)
+            results['warmed'] = game_start(paths)
+        else:
+            print('Sin posix_fadvise no se puede vaciar la caché: solo se mide el arranque en caliente')
+            started = time.perf_counter()
+            prefetcher.run()
+            results['prefetch'] = {'seconds': round(time.perf_counter() - started, 4), 'bytes': prefetcher.done}
+        results['warm'] = game_start(paths)
+
+        for name in ('cold', 'prefetch', 'warmed', 'warm'):
+            if name in results:
+                entry = results[name]
+                speed = f"  {entry['mb_per_s']:8.1f} MB/s" if entry.get('mb_per_s') else ''
+                print(f'{name:10} {entry["seconds"]:8.3f}s  {entry["bytes"] / 1024 ** 2:8.1f} MB{speed}')
+        if 'cold' in results and results['warmed']['seconds']:
+            print(f"Arranque {results['cold']['seconds'] / results['warmed']['seconds']:.1f}x más rápido con la precarga")
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {'size': int(args.size_mb * 1024 * 1024), 'files': len(paths), 'client': args.client,
+                       'memory_share': args.memory_share, 'idle': args.idle},
+            'results': results,
+        }
+    finally:
+        if args.keep:
+            print(f'Carpeta de trabajo: {work}')
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"{time.strftime('%Y%m%d-%H%M%S')}-prefetch-{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Resultados guardados en {output}')
+
+if __name__ == '__main__':
+    main()
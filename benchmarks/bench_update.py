@@ -0,0 +1,361 @@
+"""
+End-to-end update benchmark against a local stand-in update server.
+
+Builds a synthetic client (configurable size and file count), packs it in
+the published formats, serves version.json and the pack from a local HTTP
+server with Range/ETag support and drives the real Updater and
+SystemManager headlessly. Wall time and throughput of every phase are
+written as JSON so runs can be compared across commits:
+
+    python benchmarks/bench_update.py --size-mb 256 --files 400
+    python benchmarks/bench_update.py --compare results/a.json results/b.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import functools
+import http.server
+from contextlib import contextmanager, ExitStack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import core.http
+import core.paths
+import core.prestage
+import core.updater
+from core.updater import Updater, SYSTEM_PASSWORD, FORMAT_ZIP_AES, FORMAT_L2PACK
+from core.mirrors import mirror_urls
+from core.system import SystemManager
+from core.crypto import AesCtr, pack_key, protect_pack
+from core.pack import write_pack
+from core.progress import PHASE_DOWNLOAD, PHASE_EXTRACT
+from mega_standin import serve_mega
+
+# 'mega' is a plain zip published on the local Mega stand-in
+FORMATS = ('zip', 'zipcrypto', 'zip+aes', 'l2pack', 'mega')
+
+class _Handler(http.server.SimpleHTTPRequestHandler):
+    """Static files with single Range requests and strong ETags."""
+
+    def log_message(self, *args):
+        pass
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super().send_head()
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+        size = stat.st_size
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+        f = open(path, 'rb')
+        f.seek(start)
+        self._remaining = end - start + 1
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_remaining', None)
+        while remaining is None or remaining > 0:
+            data = source.read(min(1024 * 1024, remaining) if remaining is not None else 1024 * 1024)
+            if not data:
+                break
+            outputfile.write(data)
+            if remaining is not None:
+                remaining -= len(data)
+
+@contextmanager
+def serve(directory: str):
+    """Serve directory on a free local port; yields the base url."""
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_Handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}/'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def make_client(folder: str, size: int, files: int, seed: int = 1):
+    """
+    Synthetic client: system/ and Textures/ files of mixed sizes, half
+    incompressible and half compressible, totalling about size bytes.
+    """
+    rng = random.Random(seed)
+    weights = [rng.paretovariate(1.2) for _ in range(files)]
+    scale = size / sum(weights)
+    for index, weight in enumerate(weights):
+        folder_name = 'system' if index % 3 else 'Textures'
+        path = os.path.join(folder, folder_name, f'sub{index % 7}', f'file{index:05d}.dat')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        length = max(1, int(weight * scale))
+        with open(path, 'wb') as f:
+            if index % 2:
+                f.write(rng.randbytes(length))
+            else:
+                block = rng.randbytes(4096)
+                f.write((block * (length // 4096 + 1))[:length])
+
+def make_pack(client: str, target: str, pack_format: str) -> dict:
+    """Pack the client into a published system pack; returns extra version.json fields."""
+    zip_path = target if pack_format != FORMAT_ZIP_AES else target + '.zip'
+    if pack_format == 'zipcrypto':
+        if not shutil.which('zip'):
+            raise SystemExit('El formato zipcrypto necesita el comando "zip"')
+        subprocess.run(['zip', '-q', '-r', '-P', SYSTEM_PASSWORD.decode(), os.path.abspath(zip_path), '.'],
+                       cwd=client, check=True)
+        return {}
+    if pack_format == FORMAT_L2PACK:
+        write_pack(client, target, 'lzma')
+        return {'format': FORMAT_L2PACK}
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zip_ref:
+        for root, _, names in os.walk(client):
+            for name in sorted(names):
+                path = os.path.join(root, name)
+                zip_ref.write(path, os.path.relpath(path, client).replace(os.sep, '/'))
+    if pack_format == FORMAT_ZIP_AES:
+        nonce = protect_pack(zip_path, target, SYSTEM_PASSWORD)
+        os.remove(zip_path)
+        return {'format': FORMAT_ZIP_AES, 'nonce': nonce}
+    return {}
+
+class PhaseTimer:
+    """
+    Times every phase of check_updates from one phase change to the next:
+    a phase starts with the last ProgressEvent of the previous one and ends
+    with its own last event. Extraction reports once per batch and events
+    are throttled, so its first event comes long after it started.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.current = None
+        self.last = None
+
+    def __call__(self, event):
+        now = time.perf_counter()
+        if event.phase != self.current:
+            start = self.last if self.current else now
+            self.phases[event.phase] = {'start': start, 'end': now, 'bytes': 0}
+            self.current = event.phase
+        phase = self.phases[event.phase]
+        phase['end'] = now
+        phase['bytes'] = max(phase['bytes'], event.done)
+        self.last = now
+
+def result(seconds: float, nbytes: int = 0) -> dict:
+    entry = {'seconds': round(seconds, 4)}
+    if nbytes:
+        entry['bytes'] = nbytes
+        entry['mb_per_s'] = round(nbytes / (1024 * 1024) / seconds, 2) if seconds > 0 else None
+    return entry
+
+def use_base(base: str):
+    """Point the launcher at a scratch client folder."""
+    core.paths.get_base_path = lambda: base
+    core.updater.get_base_path = lambda: base
+    core.prestage.get_base_path = lambda: base
+    core.http._cache = None
+    os.makedirs(os.path.join(base, 'system'), exist_ok=True)
+
+def run_format(work: str, client: str, pack_format: str, args) -> dict:
+    pack_name = f'system-{pack_format.replace("+", "-")}.pack'
+    served = os.path.join(work, 'served')
+    os.makedirs(served, exist_ok=True)
+    pack_path = os.path.join(served, pack_name)
+    t = time.perf_counter()
+    extra = make_pack(client, pack_path, pack_format)
+    pack_size = os.path.getsize(pack_path)
+    results = {'pack': result(time.perf_counter() - t, pack_size)}
+    password = None if pack_format == FORMAT_ZIP_AES else SYSTEM_PASSWORD
+    cipher = None
+    if pack_format == FORMAT_ZIP_AES:
+        cipher = AesCtr(pack_key(SYSTEM_PASSWORD), bytes.fromhex(extra['nonce']))
+
+    with ExitStack() as stack:
+        base_url = stack.enter_context(serve(served))
+        pack_url = base_url + pack_name
+        config = {'VersionJsonUrl': base_url + 'version.json', 'LauncherVersion': '1.1',
+                  'DownloadConnections': args.connections, 'ExtractWorkers': args.workers}
+        if pack_format == 'mega':
+            standin = stack.enter_context(serve_mega(os.path.join(work, 'mega')))
+            os.makedirs(standin.directory, exist_ok=True)
+            pack_url = standin.publish(pack_path)
+            config['MegaApiUrl'] = standin.base_url
+        elif args.mirrors:
+            # Extra servers over the same folder, listed as mirrors of the pack
+            extra['mirrors'] = [stack.enter_context(serve(served)) + pack_name for _ in range(args.mirrors)]
+        version = {'launcher': {'version': '1.1', 'url': ''},
+                   'system': dict({'version': '2.0', 'url': pack_url}, **extra)}
+        with open(os.path.join(served, 'version.json'), 'w', encoding='utf-8') as f:
+            json.dump(version, f)
+
+        # 1. End-to-end check_updates into an empty client, phases from progress events
+        base = os.path.join(work, f'e2e-{pack_name}')
+        use_base(base)
+        timer = PhaseTimer()
+        messages = []
+        t = time.perf_counter()
+        performed = Updater(config).check_updates(messages.append, timer)
+        total = time.perf_counter() - t
+        if not performed:
+            raise SystemExit(f'check_updates falló: {messages[-3:]}')
+        results['check_updates'] = result(total, pack_size)
+        for phase in (PHASE_DOWNLOAD, PHASE_EXTRACT):
+            if phase in timer.phases:
+                data = timer.phases[phase]
+                results[f'check_updates.{phase}'] = result(data['end'] - data['start'], data['bytes'])
+
+        # 2. version.json fetch: cold, then revalidated (304)
+        updater = Updater(config)
+        updater.status = messages.append
+        shutil.rmtree(os.path.join(base, 'cache'), ignore_errors=True)
+        t = time.perf_counter()
+        updater._fetch_version_data()
+        results['fetch.cold'] = result(time.perf_counter() - t)
+        t = time.perf_counter()
+        updater._fetch_version_data()
+        results['fetch.revalidated'] = result(time.perf_counter() - t)
+
+        # 3. Download (decrypting 'zip+aes' on the fly) into a fresh folder
+        base = os.path.join(work, f'phases-{pack_name}')
+        use_base(base)
+        updater = Updater(config)
+        updater.status = messages.append
+        zip_path = os.path.join(base, 'downloads', 'system_update.zip')
+        t = time.perf_counter()
+        updater._download(mirror_urls(version['system']), zip_path, transform=cipher.transform() if cipher else None)
+        results['download'] = result(time.perf_counter() - t, pack_size)
+
+        # 4. Extraction: cold, then with every entry unchanged
+        manager = SystemManager(os.path.join(base, 'system'))
+        t = time.perf_counter()
+        if not manager.extract_system(zip_path, password=password, workers=args.workers):
+            raise SystemExit('extract_system falló')
+        results['extract.cold'] = result(time.perf_counter() - t, args.size)
+        manager = SystemManager(os.path.join(base, 'system'))
+        t = time.perf_counter()
+        manager.extract_system(zip_path, password=password, workers=args.workers)
+        results['extract.unchanged'] = result(time.perf_counter() - t, args.size)
+
+        # 5. AES-CTR decrypt throughput alone (done inline while downloading)
+        if cipher:
+            stream = cipher.cipher_at(0)
+            t = time.perf_counter()
+            with open(pack_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(4 * 1024 * 1024), b''):
+                    stream.decrypt(chunk)
+            results['decrypt'] = result(time.perf_counter() - t, pack_size)
+
+        t = time.perf_counter()
+        manager.set_version('2.0')
+        results['set_version'] = result(time.perf_counter() - t)
+
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def compare(old_path: str, new_path: str):
+    """Print the change of every timing between two result files."""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"{'':36} {old.get('commit') or 'old':>10} {new.get('commit') or 'new':>10}   cambio")
+    for fmt, results in new['results'].items():
+        for name, entry in results.items():
+            before = old['results'].get(fmt, {}).get(name)
+            if not before:
+                continue
+            change = (entry['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+            print(f"{fmt + ' ' + name:36} {before['seconds']:9.3f}s {entry['seconds']:9.3f}s {change:+7.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del proceso de actualización')
+    parser.add_argument('--size-mb', type=float, default=64, help='tamaño total del cliente sintético')
+    parser.add_argument('--files', type=int, default=200, help='número de archivos')
+    parser.add_argument('--format', action='append', choices=FORMATS,
+                        help='formato del paquete (repetible; por defecto zip y zip+aes)')
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--mirrors', type=int, default=0, help='servidores espejo adicionales del paquete')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output', help='archivo JSON de resultados')
+    parser.add_argument('--keep', action='store_true', help='no borrar la carpeta de trabajo')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='comparar dos resultados')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    args.size = int(args.size_mb * 1024 * 1024)
+    formats = args.format or ['zip', FORMAT_ZIP_AES]
+    work = tempfile.mkdtemp(prefix='l2bench-')
+    try:
+        client = os.path.join(work, 'client')
+        t = time.perf_counter()
+        make_client(client, args.size, args.files)
+        print(f'Cliente sintético: {args.size_mb:g} MB en {args.files} archivos ({time.perf_counter() - t:.1f}s)')
+
+        report = {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'params': {'size': args.size, 'files': args.files, 'connections': args.connections,
+                       'workers': args.workers, 'mirrors': args.mirrors},
+            'results': {},
+        }
+        for pack_format in formats:
+            results = run_format(work, client, pack_format, args)
+            report['results'][pack_format] = results
+            for name, entry in results.items():
+                speed = f"  {entry['mb_per_s']:8.1f} MB/s" if entry.get('mb_per_s') else ''
+                print(f'{pack_format:10} {name:26} {entry["seconds"]:8.3f}s{speed}')
+    finally:
+        if args.keep:
+            print(f'Carpeta de trabajo: {work}')
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'local'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f'Resultados guardados en {output}')
+
+if __name__ == '__main__':
+    main()
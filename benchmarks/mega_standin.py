@@ -0,0 +1,131 @@
+"""
+Local stand-in for the Mega.nz API and storage nodes.
+
+Serves files encrypted with core.mega.encrypt_file: POST /cs answers the
+'g' command with size, attributes and a download url, and /dl/<handle>/<a>-<b>
+returns the encrypted byte range like a storage node. Point the launcher at
+it with the MegaApiUrl config key; links keep the usual mega.nz form.
+
+    python benchmarks/mega_standin.py system.zip
+"""
+import os
+import sys
+import json
+import base64
+import shutil
+import tempfile
+import threading
+import http.server
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from core.mega import encrypt_file, encrypt_attributes, parse_link
+
+class MegaStandIn:
+    """Registry of published files plus the HTTP server that serves them."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files = {}
+        self.server = None
+        self.base_url = ''
+
+    def publish(self, path: str) -> str:
+        """Encrypt and publish a file; returns its public mega.nz link."""
+        handle = base64.urlsafe_b64encode(os.urandom(6)).decode('ascii')
+        encrypted = os.path.join(self.directory, handle)
+        key = encrypt_file(path, encrypted)
+        link = f'https://mega.nz/file/{handle}#{key}'
+        self.files[handle] = {'path': encrypted,
+                              'at': encrypt_attributes({'n': os.path.basename(path)}, parse_link(link)[1])}
+        return link
+
+    def start(self):
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes, content_type: str = 'application/json'):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                commands = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                replies = []
+                for command in commands:
+                    entry = standin.files.get(command.get('p'))
+                    if command.get('a') != 'g' or entry is None:
+                        replies.append(-9)  # ENOENT
+                        continue
+                    replies.append({'s': os.path.getsize(entry['path']), 'at': entry['at'],
+                                    'g': f"{standin.base_url}dl/{command['p']}"})
+                self._reply(200, json.dumps(replies).encode())
+
+            def do_GET(self):
+                parts = self.path.strip('/').split('/')
+                entry = standin.files.get(parts[1]) if len(parts) >= 2 and parts[0] == 'dl' else None
+                if entry is None:
+                    self._reply(404, b'')
+                    return
+                size = os.path.getsize(entry['path'])
+                start, end = 0, size - 1
+                if len(parts) == 3:
+                    first, _, last = parts[2].partition('-')
+                    start, end = int(first), min(int(last), size - 1)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(end - start + 1))
+                self.end_headers()
+                with open(entry['path'], 'rb') as f:
+                    f.seek(start)
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        data = f.read(min(1024 * 1024, remaining))
+                        if not data:
+                            break
+                        self.wfile.write(data)
+                        remaining -= len(data)
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_address[1]}/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+@contextmanager
+def serve_mega(directory: str):
+    """Yields a started MegaStandIn; its base_url is the MegaApiUrl to configure."""
+    standin = MegaStandIn(directory)
+    standin.start()
+    try:
+        yield standin
+    finally:
+        standin.stop()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Uso: python benchmarks/mega_standin.py <archivo> [<archivo> ...]')
+        sys.exit(1)
+    work = tempfile.mkdtemp(prefix='megastandin-')
+    try:
+        with serve_mega(work) as standin:
+            print(f'MegaApiUrl: {standin.base_url}')
+            for path in sys.argv[1:]:
+                print(f'{path}: {standin.publish(path)}')
+            print('Ctrl+C para terminar')
+            threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
@@ -98,6 +98,7 @@ def main():
         'PyQt5.QtWidgets',
         'requests',
         'mega_lite',
+        'Crypto.Cipher.AES',
         'google.auth',
         'google.oauth2',
         'google_auth_oauthlib',
@@ -105,13 +106,37 @@ def main():
         'googleapiclient',
         'core',
         'core.updater',
+        'core.downloader',
+        'core.progress',
+        'core.zipstream',
+        'core.fastzip',
+        'core.crypto',
+        'core.file_index',
+        'core.throttle',
+        'core.http',
+        'core.mega',
+        'core.mirrors',
+        'core.staging',
+        'core.patch',
+        'core.chunks',
+        'core.pack',
+        'core.prestage',
+        'core.peers',
+        'core.store',
+        'core.digest',
+        'core.prefetch',
+        'core.paths',
+        'core.tracing',
         'config',
         'config.config',
         'services',
         'services.news',
         'services.game',
+        'services.update_worker',
         'utils',
         'utils.locale',
+        'utils.timing',
+        'utils.pixmaps',
         'ui',
         'ui.launcher_ui'
     ]
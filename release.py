@@ -0,0 +1,193 @@
+"""
+Publica una versión del cliente como paquetes de fragmentos.
+
+Recorre una carpeta system/, divide cada archivo en fragmentos definidos por
+su contenido y guarda los fragmentos nuevos, comprimidos y sin duplicados, en
+paquetes de hasta 16 MB (los archivos pequeños quedan agrupados en el mismo
+paquete). Escribe el manifiesto y el version.json actualizado:
+
+    python release.py system/ publicar/ --version 1.0.3 --base-url https://host/l2/
+
+Si la carpeta de salida ya contiene la versión anterior, sus paquetes se
+reutilizan: solo se suben los fragmentos que han cambiado, y el lanzador
+descarga únicamente esos.
+"""
+import os
+import sys
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from core.chunks import chunk_file, pack_chunk
+from core.system import PROTECTED_FILES
+
+# Tamaño al que se cierra un paquete
+PACK_SIZE = 16 * 1024 * 1024
+MANIFEST_NAME = 'manifest.json'
+# Claves de system que describen el paquete completo de una versión (url, espejos, hashes y formato)
+ARCHIVE_KEYS = ('url', 'mirrors', 'size', 'sha256', 'block_size', 'blocks', 'format', 'nonce', 'streaming')
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def describe(path: str, previous: Optional[Dict]) -> Dict:
+    """
+    Manifest entry of a file with its chunks as (id, offset, length).
+    previous is its entry in the previous release when all of its chunks are
+    still published; that chunk list is reused if the file did not change.
+    """
+    entry = {'size': os.path.getsize(path), 'sha256': file_sha256(path)}
+    if previous and previous.get('sha256') == entry['sha256']:
+        entry['chunks'] = [(chunk_id, None, None) for chunk_id in previous['chunks']]
+    else:
+        entry['chunks'] = chunk_file(path)
+    return entry
+
+class PackWriter:
+    """Appends chunks to packs, naming each pack after its content once it is closed."""
+
+    def __init__(self, folder: str):
+        self.folder = folder
+        self.pending = []
+        self.file = None
+        self.hash = None
+        self.offset = 0
+        self.written = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def add(self, data: bytes) -> List:
+        """Store a chunk; returns its table record, completed with the pack name on close."""
+        if self.file is None:
+            self.file = open(os.path.join(self.folder, 'pack.tmp'), 'wb')
+            self.hash = hashlib.sha256()
+            self.offset = 0
+        stored = pack_chunk(data)
+        self.file.write(stored)
+        self.hash.update(stored)
+        record = [None, self.offset, len(stored), len(data)]
+        self.pending.append(record)
+        self.offset += len(stored)
+        self.written += len(stored)
+        if self.offset >= PACK_SIZE:
+            self.close()
+        return record
+
+    def close(self):
+        if self.file is None:
+            return
+        self.file.close()
+        name = f'{self.hash.hexdigest()[:32]}.pack'
+        os.replace(self.file.name, os.path.join(self.folder, name))
+        for record in self.pending:
+            record[0] = f'packs/{name}'
+        self.pending = []
+        self.file = None
+
+def load_json(path: str) -> Dict:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_json(path: str, data: Dict):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+def release(system_folder: str, out_folder: str, version: str, workers: Optional[int] = None, log=print) -> Dict:
+    """Write the packs and manifest of a system folder into out_folder; returns the manifest."""
+    previous = load_json(os.path.join(out_folder, MANIFEST_NAME))
+    # Chunks of the previous release whose pack is still there
+    known = {chunk_id: record for chunk_id, record in (previous.get('chunks') or {}).items()
+             if os.path.exists(os.path.join(out_folder, *record[0].split('/')))}
+    # Los procesos solo reciben las entradas reutilizables, nunca la tabla de fragmentos
+    previous_files = {entry['path']: entry for entry in previous.get('files', [])
+                      if all(chunk_id in known for chunk_id in entry.get('chunks', []))}
+
+    paths = []
+    for directory, dirs, names in os.walk(system_folder):
+        dirs.sort()
+        for name in sorted(names):
+            if name not in PROTECTED_FILES:
+                path = os.path.join(directory, name)
+                paths.append((os.path.relpath(path, system_folder).replace(os.sep, '/'), path))
+
+    # Partir en fragmentos es lo más lento: un proceso por núcleo
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        described = list(pool.map(describe, [path for _, path in paths],
+                                  [previous_files.get(rel_path) for rel_path, _ in paths], chunksize=4))
+
+    writer = PackWriter(os.path.join(out_folder, 'packs'))
+    table, files = {}, []
+    reused = 0
+    for (rel_path, path), entry in zip(paths, described):
+        with open(path, 'rb') as f:
+            for chunk_id, offset, length in entry['chunks']:
+                if chunk_id in table:
+                    continue
+                if chunk_id in known:
+                    table[chunk_id] = known[chunk_id]
+                    reused += 1
+                    continue
+                f.seek(offset)
+                table[chunk_id] = writer.add(f.read(length))
+        files.append({'path': rel_path, 'size': entry['size'], 'sha256': entry['sha256'],
+                      'chunks': [chunk_id for chunk_id, _, _ in entry['chunks']]})
+    writer.close()
+
+    manifest = {'version': version, 'chunks': table, 'files': files}
+    save_json(os.path.join(out_folder, MANIFEST_NAME), manifest)
+    total = sum(entry['size'] for entry in files)
+    log(f'{len(files)} archivos, {total / 1024 ** 2:.1f} MB en {len(table)} fragmentos '
+        f'({reused} ya publicados, {writer.written / 1024 ** 2:.1f} MB nuevos por subir)')
+    return manifest
+
+def update_version_json(template: str, target: str, version: str, manifest_url: str):
+    """
+    Write version.json with the new system version and manifest url. The
+    full archive of the template belongs to a previous version, so it is
+    dropped: a failed delta update must not fall back to it and install it
+    as this version.
+    """
+    data = load_json(template) or {'launcher': {'version': '', 'url': ''}, 'system': {}}
+    system = data.setdefault('system', {})
+    for key in ARCHIVE_KEYS:
+        system.pop(key, None)
+    system['version'] = version
+    system['manifest'] = manifest_url
+    save_json(target, data)
+
+def main():
+    parser = argparse.ArgumentParser(description='Publica system/ como paquetes de fragmentos')
+    parser.add_argument('system', help='carpeta system/ de la nueva versión')
+    parser.add_argument('output', help='carpeta a publicar (conserva los paquetes de versiones anteriores)')
+    parser.add_argument('--version', required=True, help='versión del sistema')
+    parser.add_argument('--base-url', help='url pública de la carpeta de salida, para version.json')
+    parser.add_argument('--version-json', default=os.path.join(ROOT, 'Updater', 'version.json'),
+                        help='version.json a actualizar (se escribe en la carpeta de salida)')
+    parser.add_argument('--workers', type=int, help='procesos para partir los archivos')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    release(args.system, args.output, args.version, args.workers)
+    if args.base_url:
+        base_url = args.base_url if args.base_url.endswith('/') else args.base_url + '/'
+        target = os.path.join(args.output, 'version.json')
+        update_version_json(args.version_json, target, args.version, base_url + MANIFEST_NAME)
+        print(f'version.json actualizado: {target}')
+    else:
+        print('Sin --base-url no se genera version.json')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import os
+import mmap
+import zlib
+import hashlib
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, quote
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from core import tracing
+from core.exceptions import DownloadError
+
+# Content-defined chunk sizes (FastCDC). Boundaries depend only on the bytes
+# around them, so an edit only changes the chunks it touches and the rest of
+# the file deduplicates against earlier versions.
+MIN_CHUNK = 64 * 1024
+AVG_CHUNK = 256 * 1024
+MAX_CHUNK = 1024 * 1024
+
+# Ranges of one pack closer than this are fetched with a single request
+MERGE_GAP = 256 * 1024
+# Largest single range request
+MAX_RANGE = 16 * 1024 * 1024
+
+_MASK_64 = (1 << 64) - 1
+# Fixed pseudo-random table of the gear hash; it must never change, or
+# chunks stop matching those already published.
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], 'little') for i in range(256)]
+
+def _top_mask(bits: int) -> int:
+    """Mask of the highest bits of the 64-bit hash, which depend on the last 64 bytes."""
+    return ((1 << bits) - 1) << (64 - bits)
+
+def chunk_boundaries(data, min_size: int = MIN_CHUNK, avg_size: int = AVG_CHUNK,
+                     max_size: int = MAX_CHUNK) -> List[Tuple[int, int]]:
+    """
+    Split data (bytes or mmap) into content-defined chunks.
+    Returns (offset, length) pairs covering data. Uses FastCDC normalized
+    chunking: a stricter mask before avg_size and a looser one after it.
+    """
+    bits = avg_size.bit_length() - 1
+    mask_strict, mask_loose = _top_mask(bits + 1), _top_mask(bits - 1)
+    gear = GEAR
+    chunks = []
+    start, end = 0, len(data)
+    while start < end:
+        if end - start <= min_size:
+            chunks.append((start, end - start))
+            break
+        limit = min(start + max_size, end)
+        normal = min(start + avg_size, limit)
+        cut = limit
+        h = 0
+        pos = start + min_size
+        found = False
+        for byte in data[pos:normal]:
+            h = ((h << 1) + gear[byte]) & _MASK_64
+            pos += 1
+            if not h & mask_strict:
+                found = True
+                break
+        if not found:
+            for byte in data[pos:limit]:
+                h = ((h << 1) + gear[byte]) & _MASK_64
+                pos += 1
+                if not h & mask_loose:
+                    found = True
+                    break
+        if found:
+            cut = pos
+        chunks.append((start, cut - start))
+        start = cut
+    return chunks
+
+def chunk_file(path: str) -> List[Tuple[str, int, int]]:
+    """Chunks of a file as (sha256 hex, offset, length)."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return [(hashlib.sha256(data[offset:offset + length]).hexdigest(), offset, length)
+                for offset, length in chunk_boundaries(data)]
+
+def pack_chunk(data: bytes) -> bytes:
+    """Compressed form of a chunk as stored in a pack; raw when compression does not help."""
+    packed = zlib.compress(data, 6)
+    return packed if len(packed) < len(data) else data
+
+def unpack_chunk(stored: bytes, size: int) -> bytes:
+    """Inverse of pack_chunk: entries stored at their full size are raw."""
+    return stored if len(stored) == size else zlib.decompress(stored)
+
+class ChunkSource:
+    """
+    Provides the chunks of a chunked manifest while installing an update.
+    Chunks found in files already on disk are copied from them; the rest are
+    fetched from LAN peers that hold them, then from the packs next to the
+    manifest, grouping neighbouring chunks of a pack into a single range
+    request, so chunks shared between versions are never downloaded again.
+
+    The manifest's 'chunks' table maps each chunk id (its SHA-256) to
+    [pack path, offset, stored length, size]; every file entry lists its
+    chunk ids in order.
+    """
+
+    def __init__(self, manifest: Dict, manifest_url: str, folder: str, session: requests.Session,
+                 connections: int = 4, control=None, timeout: int = 60, limiter=None, peers=None):
+        """
+        :param folder: Scratch folder for the fetched chunks.
+        :param control: Optional UpdateControl checked between requests.
+        :param limiter: Optional RateLimiter capping the download speed.
+        :param peers: Optional core.peers.Peer list tried before the packs.
+        """
+        self.table = manifest.get('chunks') or {}
+        self.base_url = manifest.get('packs_url') or manifest_url
+        self.folder = folder
+        self.session = session
+        self.connections = max(1, int(connections))
+        self.control = control
+        self.timeout = timeout
+        self.limiter = limiter
+        self.peers = list(peers or [])
+        self.local = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def add_local(self, path: str, chunk_ids: List[str], table: Optional[Dict] = None):
+        """
+        Offer the chunks of a file on disk, laid out as chunk_ids (checked when read).
+        :param table: Chunk table giving their sizes, e.g. that of the manifest
+                      the file was installed from (defaults to the current one).
+        """
+        table = self.table if table is None else table
+        offset = 0
+        for chunk_id in chunk_ids:
+            record = table.get(chunk_id)
+            if record is None:
+                return
+            self.local.setdefault(chunk_id, (path, offset, record[3]))
+            offset += record[3]
+
+    def missing(self, entries: Iterable[Dict]) -> List[str]:
+        """Chunk ids of entries that are neither on disk nor fetched yet."""
+        wanted = dict.fromkeys(chunk_id for entry in entries for chunk_id in entry.get('chunks', []))
+        return [chunk_id for chunk_id in wanted
+                if chunk_id not in self.local and not os.path.exists(self._path(chunk_id))]
+
+    def fetch(self, chunk_ids: List[str], progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Download chunks from their packs; returns the bytes transferred.
+        :param progress: Optional (done, total) callback in transferred bytes.
+        """
+        done = [0]
+        total = [sum(self.table[chunk_id][2] for chunk_id in chunk_ids if chunk_id in self.table)]
+
+        def report(received: int):
+            with self._lock:
+                done[0] += received
+                if progress:
+                    progress(done[0], max(total[0], done[0]))
+
+        with tracing.span('chunks.fetch', chunks=len(chunk_ids)) as span:
+            if self.peers:
+                chunk_ids = self._fetch_peers(chunk_ids, report)
+                span.set(from_peers=done[0])
+            requests_ = self._plan(chunk_ids)
+            # Ranges may span gaps between the chunks still wanted
+            total[0] = done[0] + sum(end - start for _, start, end, _ in requests_)
+
+            def run(request):
+                if self.control:
+                    self.control.checkpoint()
+                report(self._fetch_range(*request))
+
+            span.set(requests=len(requests_))
+            self._run(run, requests_)
+            span.add_bytes(done[0])
+        return done[0]
+
+    def _run(self, task: Callable, items: List):
+        if self.connections == 1 or len(items) <= 1:
+            for item in items:
+                task(item)
+        else:
+            with ThreadPoolExecutor(max_workers=self.connections) as pool:
+                list(pool.map(task, items))
+
+    def _fetch_peers(self, chunk_ids: List[str], report: Callable[[int], None]) -> List[str]:
+        """
+        Fetch chunks from the LAN peers, dropping a peer at its first failure.
+        Returns the chunk ids still missing.
+        """
+        missing = []
+
+        def run(chunk_id):
+            if self.control:
+                self.control.checkpoint()
+            for peer in list(self.peers):
+                try:
+                    # A peer on the LAN answers at once or not at all
+                    with self.session.get(peer.url(chunk_id), timeout=(5, self.timeout)) as r:
+                        r.raise_for_status()
+                        data = r.content
+                    if hashlib.sha256(data).hexdigest() != chunk_id:
+                        raise DownloadError(f'Fragmento corrupto de {peer.host}')
+                except (requests.RequestException, DownloadError):
+                    with self._lock:
+                        if peer in self.peers:
+                            self.peers.remove(peer)
+                    continue
+                if self.limiter:
+                    self.limiter.consume(len(data))
+                self._store(chunk_id, data)
+                # Counted as its stored size, like the pack ranges
+                report(self.table[chunk_id][2])
+                return
+            with self._lock:
+                missing.append(chunk_id)
+
+        self._run(run, chunk_ids)
+        return missing
+
+    def read(self, chunk_id: str) -> bytes:
+        """A chunk's data, from disk when possible, verified against its id."""
+        local = self.local.get(chunk_id)
+        if local:
+            path, offset, size = local
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read(size)
+                if hashlib.sha256(data).hexdigest() == chunk_id:
+                    return data
+            except OSError:
+                pass
+            # The local copy changed: fetch it instead
+            del self.local[chunk_id]
+        path = self._path(chunk_id)
+        if not os.path.exists(path):
+            self.fetch([chunk_id])
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def assemble(self, entry: Dict, target: str):
+        """Write the file of a manifest entry from its chunks and check its size and hash."""
+        h = hashlib.sha256()
+        size = 0
+        with open(target, 'wb') as out:
+            for chunk_id in entry.get('chunks', []):
+                if self.control:
+                    self.control.checkpoint()
+                data = self.read(chunk_id)
+                out.write(data)
+                h.update(data)
+                size += len(data)
+        if size != int(entry.get('size', size)) or h.hexdigest() != entry.get('sha256', '').lower():
+            raise DownloadError(f"Archivo corrupto: {entry['path']}")
+
+    def _path(self, chunk_id: str) -> str:
+        return os.path.join(self.folder, chunk_id)
+
+    def _plan(self, chunk_ids: List[str]) -> List[Tuple[str, int, int, List[str]]]:
+        """Range requests (pack, start, end, chunk ids) covering chunk_ids."""
+        by_pack = {}
+        for chunk_id in chunk_ids:
+            record = self.table.get(chunk_id)
+            if record is None:
+                raise DownloadError(f'Fragmento desconocido: {chunk_id}')
+            by_pack.setdefault(record[0], []).append(chunk_id)
+        plan = []
+        for pack, ids in by_pack.items():
+            ids.sort(key=lambda chunk_id: self.table[chunk_id][1])
+            current = None
+            for chunk_id in ids:
+                _, offset, length, _ = self.table[chunk_id]
+                if current and offset - current[2] <= MERGE_GAP and offset + length - current[1] <= MAX_RANGE:
+                    current[2] = max(current[2], offset + length)
+                    current[3].append(chunk_id)
+                else:
+                    current = [pack, offset, offset + length, [chunk_id]]
+                    plan.append(current)
+        return [tuple(request) for request in plan]
+
+    def _fetch_range(self, pack: str, start: int, end: int, chunk_ids: List[str]) -> int:
+        url = urljoin(self.base_url, quote(pack))
+        with self.session.get(url, headers={'Range': f'bytes={start}-{end - 1}'}, stream=True,
+                              timeout=self.timeout) as r:
+            r.raise_for_status()
+            data = bytearray()
+            for block in r.iter_content(chunk_size=256 * 1024):
+                if self.limiter:
+                    self.limiter.consume(len(block))
+                data += block
+            data = bytes(data)
+        if r.status_code != 206:
+            # Server without range support: the whole pack came back
+            data = data[start:end]
+        if len(data) != end - start:
+            raise DownloadError(f'Paquete incompleto: {pack}')
+        for chunk_id in chunk_ids:
+            _, offset, length, size = self.table[chunk_id]
+            chunk = unpack_chunk(data[offset - start:offset - start + length], size)
+            if hashlib.sha256(chunk).hexdigest() != chunk_id:
+                raise DownloadError(f'Fragmento corrupto en {pack}')
+            self._store(chunk_id, chunk)
+        return len(data)
+
+    def _store(self, chunk_id: str, data: bytes):
+        tmp_path = self._path(chunk_id) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(chunk_id))
@@ -0,0 +1,54 @@
+import os
+import sys
+import hashlib
+from typing import Callable
+
+class AesCtr:
+    """
+    Seekable AES-CTR keystream (8-byte nonce + 64-bit big-endian block counter).
+    Any byte offset can be decrypted independently, so ranges fetched out of
+    order or in parallel are decrypted as they arrive.
+    Uses pycryptodome, which runs at native speed.
+    """
+
+    def __init__(self, key: bytes, nonce: bytes):
+        from Crypto.Cipher import AES
+        self._aes = AES
+        self.key = key
+        self.nonce = nonce
+
+    def cipher_at(self, offset: int):
+        """Return a cipher positioned at a byte offset of the stream."""
+        cipher = self._aes.new(self.key, self._aes.MODE_CTR, nonce=self.nonce, initial_value=offset // 16)
+        if offset % 16:
+            # Skip the part of the keystream block before offset
+            cipher.decrypt(b'\0' * (offset % 16))
+        return cipher
+
+    def transform(self) -> Callable[[int, bytes], bytes]:
+        """(offset, data) -> data callable for Downloader.download."""
+        return lambda offset, data: self.cipher_at(offset).decrypt(data)
+
+def pack_key(password: bytes) -> bytes:
+    """AES-256 key of protected system packs, derived from the pack password."""
+    return hashlib.sha256(password).digest()
+
+def protect_pack(source: str, target: str, password: bytes, chunk_size: int = 4 * 1024 * 1024) -> str:
+    """
+    Encrypts a plain system.zip into the 'zip+aes' pack format.
+    Returns the hex nonce to publish in version.json.
+    """
+    nonce = os.urandom(8)
+    cipher = AesCtr(pack_key(password), nonce).cipher_at(0)
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        for chunk in iter(lambda: src.read(chunk_size), b''):
+            dst.write(cipher.encrypt(chunk))
+    return nonce.hex()
+
+if __name__ == '__main__':
+    # python -m core.crypto system.zip system.zip.aes
+    if len(sys.argv) != 3:
+        print('Uso: python -m core.crypto <system.zip> <system.pack>')
+        sys.exit(1)
+    from core.updater import SYSTEM_PASSWORD
+    print(protect_pack(sys.argv[1], sys.argv[2], SYSTEM_PASSWORD))
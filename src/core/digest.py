@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+from core.exceptions import DigestError
+
+# Size of the hashed blocks published by describe(): a corrupt block costs at
+# most this much to fetch again, and its hash is 64 bytes of version.json
+BLOCK_SIZE = 4 * 1024 * 1024
+
+_HASH_LENGTH = 64
+
+class Digest:
+    """
+    Size and hashes of a published artifact, as version.json gives them next
+    to its urls: 'size', 'sha256' of the whole file and optionally 'blocks',
+    the SHA-256 of every 'block_size' bytes, which let a download be checked
+    piece by piece while it is written (see describe()).
+    """
+    __slots__ = ('size', 'sha256', 'block_size', 'blocks')
+
+    def __init__(self, size: Optional[int] = None, sha256: str = '', block_size: int = 0,
+                 blocks: Optional[List[str]] = None):
+        self.size = size
+        self.sha256 = sha256.lower()
+        self.block_size = block_size if blocks else 0
+        self.blocks = [block.lower() for block in blocks or []]
+
+    @classmethod
+    def from_block(cls, block: Dict) -> Optional['Digest']:
+        """Digest of a version.json artifact block; None when it publishes neither size nor hash."""
+        try:
+            size = int(block['size']) if block.get('size') is not None else None
+            block_size = int(block.get('block_size') or 0)
+        except (TypeError, ValueError):
+            return None
+        sha256 = str(block.get('sha256') or '')
+        blocks = block.get('blocks') or []
+        if len(sha256) != _HASH_LENGTH:
+            sha256 = ''
+        if size is None or block_size <= 0 or not isinstance(blocks, list) \
+                or len(blocks) != -(-size // block_size) or any(len(str(b)) != _HASH_LENGTH for b in blocks):
+            # Block hashes are only usable with the size they split
+            block_size, blocks = 0, []
+        if size is None and not sha256:
+            return None
+        return cls(size, sha256, block_size, [str(b) for b in blocks])
+
+    def verifier(self, sequential: bool = False) -> Optional['BlockVerifier']:
+        """
+        A BlockVerifier checking a download of this artifact as it is written.
+        Without block hashes the whole file is one block, which can only be
+        hashed inline when it is written in order (sequential). None when
+        nothing can be checked inline.
+        """
+        if self.blocks:
+            return BlockVerifier(self.blocks, self.block_size, self.size)
+        if self.sha256 and sequential:
+            return BlockVerifier([self.sha256], None, self.size)
+        return None
+
+    def check_file(self, path: str):
+        """Check a file already on disk, in one read; raises DigestError if it does not match."""
+        verifier = BlockVerifier([self.sha256], None, self.size) if self.sha256 else self.verifier()
+        if verifier is None:
+            size = os.path.getsize(path)
+            if self.size is not None and size != self.size:
+                raise DigestError(f'El archivo descargado mide {size} bytes en lugar de {self.size}', 0)
+            return
+        size = 0
+        with open(path, 'rb') as f:
+            for data in iter(lambda: f.read(1024 * 1024), b''):
+                verifier.update(size, data)
+                size += len(data)
+        verifier.finish(size)
+
+class BlockVerifier:
+    """
+    Checks downloaded bytes against their published hashes as they are
+    written, with no second pass over the file. Blocks are independent, so
+    several connections can fill different blocks at once; the bytes of one
+    block must arrive in order, except that a piece coming before the one
+    that precedes it is held until it can be hashed (a range that starts in
+    the middle of a block). update() raises DigestError with the start of the
+    failing block as soon as that block is complete.
+    """
+
+    def __init__(self, hashes: List[str], block_size: Optional[int], size: Optional[int] = None):
+        """
+        :param block_size: Bytes per hash; None for a single hash of the whole file.
+        :param size: Expected size of the file, if known.
+        """
+        self.hashes = hashes
+        self.block_size = block_size
+        self.size = size
+        self.verified = set()
+        self.failed = None
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def block_start(self, offset: int) -> int:
+        """Start of the block holding offset."""
+        return offset - offset % self.block_size if self.block_size else 0
+
+    def _block_end(self, index: int) -> Optional[int]:
+        if not self.block_size:
+            return self.size
+        end = (index + 1) * self.block_size
+        return min(end, self.size) if self.size is not None else end
+
+    def update(self, offset: int, data: bytes):
+        """Feed the bytes written at offset; raises DigestError when a completed block does not match."""
+        if self.failed is not None:
+            raise self.failed
+        while data:
+            index = offset // self.block_size if self.block_size else 0
+            end = self._block_end(index)
+            piece = data if end is None else data[:end - offset]
+            if not piece:
+                raise self.fail(DigestError('El archivo descargado es mayor de lo publicado', offset))
+            self._feed(index, offset, piece)
+            offset += len(piece)
+            data = data[len(piece):]
+
+    def _feed(self, index: int, offset: int, data: bytes):
+        with self._lock:
+            if index in self.verified:
+                # Fetched again next to a missing piece: already checked
+                return
+            if index >= len(self.hashes):
+                raise self.fail(DigestError('El archivo descargado es mayor de lo publicado', offset))
+            block = self._blocks.get(index)
+            if block is None:
+                block = self._blocks[index] = {'hash': hashlib.sha256(), 'next': index * (self.block_size or 0),
+                                               'held': {}, 'lock': threading.Lock()}
+        with block['lock']:
+            if offset > block['next']:
+                block['held'][offset] = bytes(data)
+                return
+            data = data[block['next'] - offset:]
+            while True:
+                block['hash'].update(data)
+                block['next'] += len(data)
+                data = block['held'].pop(block['next'], None)
+                if data is None:
+                    break
+            if block['next'] == self._block_end(index):
+                self._check(index, block)
+
+    def _check(self, index: int, block: Dict):
+        with self._lock:
+            self._blocks.pop(index, None)
+            if block['hash'].hexdigest() != self.hashes[index]:
+                start = index * (self.block_size or 0)
+                raise DigestError(f'Datos corruptos en el byte {start} de la descarga', start)
+            self.verified.add(index)
+
+    def fail(self, error: DigestError) -> DigestError:
+        """Record a failure that no retry can fix, so the other connections stop as well."""
+        self.failed = error
+        return error
+
+    def skip(self, start: int, end: int):
+        """Count the blocks lying entirely in [start, end) as verified (checked by an earlier run)."""
+        if not self.block_size:
+            return
+        with self._lock:
+            for index in range(-(-start // self.block_size), len(self.hashes)):
+                if self._block_end(index) > end:
+                    break
+                self.verified.add(index)
+
+    def finish(self, total: int):
+        """Check a completed download of total bytes: every block must have verified."""
+        if self.failed is not None:
+            raise self.failed
+        if self.size is not None and total != self.size:
+            raise DigestError(f'El archivo descargado mide {total} bytes en lugar de {self.size}', 0)
+        if not self.block_size and 0 not in self.verified:
+            # Whole-file hash of a file of unknown size: its end is only known now
+            block = self._blocks.get(0)
+            if block is not None and block['next'] == total:
+                self._check(0, block)
+        missing = [index for index in range(len(self.hashes)) if index not in self.verified]
+        if missing:
+            start = missing[0] * (self.block_size or 0)
+            raise DigestError(f'Faltan datos verificados desde el byte {start}', start)
+
+    def stream(self, chunks: Iterable[bytes], hold: bool = True) -> Iterator[bytes]:
+        """
+        Feed a sequential download and pass its bytes on, e.g. to an
+        extractor. With hold, bytes are only passed on once their block
+        verified, so at most one block is buffered; without it they pass
+        at once and only the end of the stream is checked.
+        """
+        hold = hold and bool(self.block_size)
+        offset = 0
+        pending = bytearray()
+        for chunk in chunks:
+            self.update(offset, chunk)
+            offset += len(chunk)
+            if not hold:
+                yield chunk
+                continue
+            pending += chunk
+            ready = self.block_start(offset) - (offset - len(pending))
+            if ready > 0:
+                yield bytes(pending[:ready])
+                del pending[:ready]
+        self.finish(offset)
+        if pending:
+            yield bytes(pending)
+
+def describe(path: str, block_size: int = BLOCK_SIZE) -> Dict:
+    """The version.json fields of a file: size, sha256, block_size and blocks, in one read."""
+    whole = hashlib.sha256()
+    blocks = []
+    size = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), b''):
+            whole.update(data)
+            blocks.append(hashlib.sha256(data).hexdigest())
+            size += len(data)
+    return {'size': size, 'sha256': whole.hexdigest(), 'block_size': block_size, 'blocks': blocks}
+
+if __name__ == '__main__':
+    # python -m core.digest <archivo> [tamaño de bloque]
+    if len(sys.argv) not in (2, 3) or not os.path.isfile(sys.argv[1]):
+        print('Uso: python -m core.digest <archivo> [tamaño de bloque]')
+        sys.exit(1)
+    print(json.dumps(describe(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else BLOCK_SIZE), indent=2))
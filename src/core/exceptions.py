@@ -13,3 +13,19 @@ class DownloadError(LauncherError):
 class ExtractionError(LauncherError):
     """Raised when there's an error during file extraction"""
     pass
+
+class UpdateCancelled(LauncherError):
+    """Raised when the user cancels a running update"""
+    pass
+
+class PatchError(LauncherError):
+    """Raised when a binary patch cannot be applied or its result does not verify"""
+    pass
+
+class DigestError(DownloadError):
+    """Raised when downloaded data does not match the size or hashes published for it"""
+
+    def __init__(self, message: str, offset: int = 0):
+        super().__init__(message)
+        # Start of the first byte range that failed; the download resumes from there
+        self.offset = offset
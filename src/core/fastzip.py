@@ -0,0 +1,168 @@
+import os
+import zlib
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Collection, List, Optional
+from core.exceptions import ExtractionError
+from core.progress import UpdateControl
+from core.zipstream import ZipCryptoDecrypter, set_zip_mtime
+
+# Encrypted archives smaller than this are not worth starting worker processes for
+PROCESS_POOL_THRESHOLD = 32 * 1024 * 1024
+# Entries are handed to workers in batches of roughly this many compressed bytes
+BATCH_SIZE = 4 * 1024 * 1024
+READ_SIZE = 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+def safe_join(root: str, rel_path: str) -> Optional[str]:
+    """Join a '/' separated archive path to root; None if it would escape root."""
+    parts = [p for p in rel_path.replace('\\', '/').split('/') if p not in ('', '.')]
+    if not parts or '..' in parts or os.path.isabs(rel_path) or ':' in parts[0]:
+        return None
+    return os.path.join(root, *parts)
+
+def extract_member(archive, info: zipfile.ZipInfo, target: str, password: Optional[bytes] = None):
+    """
+    Extract one entry from an open archive file object to target.
+    Stored and deflated entries are decrypted and inflated here directly
+    (zlib releases the GIL); other methods go through zipfile.
+    Output is written to a temporary file and moved into place once the CRC
+    matches; the file keeps the archive timestamp.
+    """
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = target + '.tmp'
+    if info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        with zipfile.ZipFile(archive) as zip_ref, zip_ref.open(info, pwd=password) as src, open(tmp_path, 'wb') as dst:
+            for chunk in iter(lambda: src.read(READ_SIZE), b''):
+                dst.write(chunk)
+        set_zip_mtime(tmp_path, info)
+        os.replace(tmp_path, target)
+        return
+
+    archive.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(archive.read(_LOCAL_HEADER.size))
+    archive.seek(info.header_offset + _LOCAL_HEADER.size + header[9] + header[10])
+    remaining = info.compress_size
+
+    decrypter = None
+    if info.flag_bits & 0x01:
+        if not password:
+            raise ExtractionError(f'{info.filename} requiere contraseña')
+        decrypter = ZipCryptoDecrypter(password)
+        check = decrypter.decrypt(archive.read(12))[11]
+        remaining -= 12
+        if info.flag_bits & 0x08:
+            hour, minute, second = info.date_time[3:6]
+            expected = (((hour << 11) | (minute << 5) | (second // 2)) >> 8) & 0xFF
+        else:
+            expected = (info.CRC >> 24) & 0xFF
+        if check != expected:
+            raise ExtractionError('Contraseña incorrecta')
+
+    inflater = zlib.decompressobj(-15) if info.compress_type == zipfile.ZIP_DEFLATED else None
+    crc = 0
+    written = 0
+    try:
+        with open(tmp_path, 'wb') as dst:
+            while remaining > 0:
+                data = archive.read(min(READ_SIZE, remaining))
+                if not data:
+                    raise ExtractionError(f'{info.filename} está truncado')
+                remaining -= len(data)
+                if decrypter:
+                    data = decrypter.decrypt(data)
+                if inflater:
+                    data = inflater.decompress(data)
+                crc = zlib.crc32(data, crc)
+                written += len(data)
+                dst.write(data)
+            if inflater:
+                data = inflater.flush()
+                crc = zlib.crc32(data, crc)
+                written += len(data)
+                dst.write(data)
+        if crc != info.CRC or written != info.file_size:
+            raise ExtractionError(f'CRC incorrecto en {info.filename}')
+        set_zip_mtime(tmp_path, info)
+        os.replace(tmp_path, target)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _extract_batch(zip_path: str, root: str, names: List[str], password: Optional[bytes]) -> int:
+    """Worker entry point: extract a batch of entries, return the uncompressed bytes written."""
+    written = 0
+    with open(zip_path, 'rb') as archive, zipfile.ZipFile(archive) as zip_ref:
+        for name in names:
+            info = zip_ref.getinfo(name)
+            target = safe_join(root, name)
+            if target is None:
+                continue
+            if info.is_dir():
+                os.makedirs(target, exist_ok=True)
+            else:
+                extract_member(archive, info, target, password)
+            written += info.file_size
+    return written
+
+def _batches(members: List[zipfile.ZipInfo]) -> List[List[zipfile.ZipInfo]]:
+    """Group entries into batches of about BATCH_SIZE compressed bytes, largest first."""
+    batches, current, size = [], [], 0
+    for info in sorted(members, key=lambda m: m.compress_size, reverse=True):
+        current.append(info)
+        size += info.compress_size
+        if size >= BATCH_SIZE:
+            batches.append(current)
+            current, size = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+def extract_parallel(zip_path: str, root: str, password: Optional[bytes] = None,
+                     workers: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     control: Optional[UpdateControl] = None,
+                     only: Optional[Collection[str]] = None) -> List[zipfile.ZipInfo]:
+    """
+    Extract a zip archive into root using every core.
+    Plain archives are inflated on a thread pool; ZipCrypto archives, whose
+    decryption is pure Python, are spread over worker processes. The files
+    written are byte-identical to ZipFile.extractall(root).
+    :param only: Optional member names to extract; everything else is skipped.
+    Returns the extracted entries. Raises ExtractionError.
+    """
+    workers = workers or os.cpu_count() or 1
+    with zipfile.ZipFile(zip_path) as zip_ref:
+        members = zip_ref.infolist()
+    if only is not None:
+        members = [info for info in members if info.filename in only]
+    total = sum(info.file_size for info in members)
+    encrypted_bytes = sum(info.compress_size for info in members if info.flag_bits & 0x01)
+
+    if encrypted_bytes >= PROCESS_POOL_THRESHOLD and workers > 1:
+        # Imported here: it pulls in multiprocessing, which most updates never need
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+
+    done = 0
+    try:
+        pending = {executor.submit(_extract_batch, zip_path, root, [info.filename for info in batch], password)
+                   for batch in _batches(members)}
+        while pending:
+            finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            for future in finished:
+                done += future.result()
+                if progress:
+                    progress(done, total)
+            if control:
+                control.checkpoint()
+    except BaseException:
+        executor.shutdown(wait=True, cancel_futures=True)
+        raise
+    executor.shutdown(wait=True)
+    return members
@@ -0,0 +1,118 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from typing import Dict, Optional
+
+class FileIndex:
+    """
+    Persistent record of the client files the launcher has written or checked.
+    Keys are paths relative to the client folder ('/' separated); values keep
+    the size and mtime of the known-good file plus its checksums.
+    A checksum is trusted as long as the file's size and mtime still match,
+    so unchanged files never have to be re-read.
+    """
+
+    def __init__(self, path: str, root: str):
+        self.path = path
+        self.root = root
+        self.entries = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict]:
+        if self.entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (IOError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def save(self) -> bool:
+        """Atomically write the index to disk."""
+        if self.entries is None:
+            return True
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with self._lock, open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            return False
+
+    def key(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def lookup(self, path: str, stat: Optional[os.stat_result] = None) -> Optional[Dict]:
+        """Return the record for path if the file has not changed since it was recorded."""
+        try:
+            stat = stat or os.stat(path)
+        except OSError:
+            return None
+        record = self.load().get(self.key(path))
+        if record and record.get('size') == stat.st_size and record.get('mtime') == stat.st_mtime_ns:
+            return record
+        return None
+
+    def record(self, path: str, **checksums) -> Optional[Dict]:
+        """Store the current stat of path with the given checksums (e.g. crc32=...)."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = self.key(path)
+        with self._lock:
+            entries = self.load()
+            previous = entries.get(key)
+            record = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime_ns:
+                # Same file state: keep checksums computed earlier
+                record.update({k: v for k, v in previous.items() if k not in record})
+            record.update(checksums)
+            entries[key] = record
+        return record
+
+    def forget(self, path: str):
+        with self._lock:
+            self.load().pop(self.key(path), None)
+
+    def crc32(self, path: str, limiter=None) -> Optional[int]:
+        """CRC32 of a file, from the index when the file is unchanged since it was recorded."""
+        return self.checksum(path, 'crc32', limiter)
+
+    def sha256(self, path: str, limiter=None) -> Optional[str]:
+        """SHA-256 of a file, from the index when the file is unchanged since it was recorded."""
+        return self.checksum(path, 'sha256', limiter)
+
+    def checksum(self, path: str, algorithm: str, limiter=None, cached: bool = True,
+                 control=None, chunk_size: int = 1024 * 1024):
+        """
+        Return the 'crc32' or 'sha256' checksum of a file, None if it cannot be read.
+        Only known-good states are stored in the index, so a computed value is
+        not recorded here; callers record it once it matched a reference.
+        :param limiter: Optional RateLimiter capping the read throughput.
+        :param cached: Use the indexed value when the file is unchanged.
+        :param control: Optional UpdateControl checked between chunks.
+        """
+        record = self.lookup(path) if cached else None
+        if record and algorithm in record:
+            return record[algorithm]
+        crc = 0
+        h = hashlib.sha256() if algorithm == 'sha256' else None
+        try:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    if control:
+                        control.checkpoint()
+                    if limiter:
+                        limiter.consume(len(chunk))
+                    if h:
+                        h.update(chunk)
+                    else:
+                        crc = zlib.crc32(chunk, crc)
+        except OSError:
+            return None
+        return h.hexdigest() if h else crc
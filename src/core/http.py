@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional
+from core.paths import cache_dir
+
+# Connections kept alive per host; covers the parallel download segments
+POOL_MAXSIZE = 16
+# Responses larger than this are never written to the HTTP cache
+CACHE_MAX_BODY = 4 * 1024 * 1024
+
+_session = None
+_cache = None
+_lock = threading.RLock()
+
+def get_session() -> requests.Session:
+    """
+    The process-wide HTTP session.
+    Every service shares it, so TCP/TLS connections are kept alive and
+    reused between version checks, manifests, news and downloads.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+def get_cache() -> 'HttpCache':
+    """The shared on-disk HTTP cache (<base>/cache/http)."""
+    global _cache
+    with _lock:
+        if _cache is None:
+            _cache = HttpCache(os.path.join(cache_dir(), 'http'))
+        return _cache
+
+class CachedResponse:
+    """Body of a GET answered by the network or by HttpCache."""
+
+    def __init__(self, url: str, status_code: int, content: bytes, headers: Dict, from_cache: bool = False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        # True when the body came from disk (fresh entry or 304 Not Modified)
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8-sig', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error for url: {self.url}')
+
+class HttpCache:
+    """
+    Small on-disk cache for GET responses (version.json, manifests, news).
+    Honors Cache-Control (max-age, no-cache, no-store) and revalidates stale
+    entries with If-None-Match / If-Modified-Since, so an unchanged
+    resource costs a 304 with no body.
+    """
+
+    def __init__(self, directory: str, session: Optional[requests.Session] = None):
+        self.directory = directory
+        self.session = session or get_session()
+
+    def get(self, url: str, timeout: float = 10, revalidate: bool = False) -> CachedResponse:
+        """
+        GET url through the cache.
+        :param revalidate: Always ask the server (conditionally), even if the
+                           entry is still fresh. Used for version checks.
+        Raises requests.RequestException on network errors.
+        """
+        meta, body = self._load(url)
+        now = time.time()
+        if meta and not revalidate and not meta.get('no_cache') and now < meta.get('expires', 0):
+            return CachedResponse(url, 200, body, meta.get('headers', {}), from_cache=True)
+
+        headers = {}
+        if meta:
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+        r = self.session.get(url, headers=headers, timeout=timeout)
+        if r.status_code == 304 and meta:
+            # Not modified: refresh the freshness lifetime from the new headers
+            meta.update(self._freshness(r.headers, now))
+            self._store(url, meta, None)
+            return CachedResponse(url, 200, body, meta.get('headers', {}), from_cache=True)
+
+        response = CachedResponse(url, r.status_code, r.content, dict(r.headers))
+        if r.status_code == 200:
+            self._save(url, r, now)
+        return response
+
+    def _save(self, url: str, r: requests.Response, now: float):
+        cache_control = r.headers.get('Cache-Control', '').lower()
+        if 'no-store' in cache_control or len(r.content) > CACHE_MAX_BODY:
+            return
+        meta = {
+            'url': url,
+            'etag': r.headers.get('ETag'),
+            'last_modified': r.headers.get('Last-Modified'),
+            'headers': {k: v for k, v in r.headers.items() if k.lower() in ('content-type', 'etag', 'last-modified')},
+        }
+        meta.update(self._freshness(r.headers, now))
+        self._store(url, meta, r.content)
+
+    @staticmethod
+    def _freshness(headers, now: float) -> Dict:
+        """Expiry time and no-cache flag from Cache-Control."""
+        max_age = 0
+        no_cache = False
+        for directive in headers.get('Cache-Control', '').lower().split(','):
+            directive = directive.strip()
+            if directive.startswith('max-age='):
+                try:
+                    max_age = int(directive[8:])
+                except ValueError:
+                    max_age = 0
+            elif directive == 'no-cache':
+                no_cache = True
+        return {'stored': now, 'expires': now + max_age, 'no_cache': no_cache}
+
+    def _paths(self, url: str):
+        name = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+        base = os.path.join(self.directory, name)
+        return base + '.json', base + '.body'
+
+    def _load(self, url: str):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+        except (IOError, ValueError):
+            return None, None
+        if meta.get('url') != url:
+            return None, None
+        return meta, body
+
+    def _store(self, url: str, meta: Dict, body: Optional[bytes]):
+        """Atomically write an entry; body None keeps the stored body."""
+        meta_path, body_path = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if body is not None:
+                with open(body_path + '.tmp', 'wb') as f:
+                    f.write(body)
+                os.replace(body_path + '.tmp', body_path)
+            with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(meta_path + '.tmp', meta_path)
+        except OSError:
+            pass
@@ -3,7 +3,7 @@ import sys
 import tempfile
 import shutil
 from typing import Dict, Optional
-import requests
+from core.http import get_session
 from mega_downloader import download_mega_file
 
 class Launcher:
@@ -34,7 +34,7 @@ class Launcher:
                 shutil.move(new_launcher, new_launcher_path)
             else:
                 print(f"[INFO] Descargando launcher de URL directa: {update_url}")
-                r = requests.get(update_url, stream=True)
+                r = get_session().get(update_url, stream=True)
                 with open(new_launcher_path, 'wb') as f:
                     for chunk in r.iter_content(chunk_size=8192):
                         f.write(chunk)
@@ -0,0 +1,352 @@
+import os
+import re
+import json
+import base64
+import struct
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from core.downloader import Downloader
+from core.exceptions import DownloadError, DigestError, UpdateCancelled
+from core.progress import UpdateControl
+from core.crypto import AesCtr
+from core.digest import Digest, BlockVerifier
+from core import tracing
+
+MEGA_API_URL = 'https://g.api.mega.co.nz'
+# Consecutive Mega chunks fetched by one request
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+def _b64decode(data: str) -> bytes:
+    data = data.replace('-', '+').replace('_', '/').replace(',', '')
+    return base64.b64decode(data + '=' * (-len(data) % 4))
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('ascii').replace('+', '-').replace('/', '_').rstrip('=')
+
+def parse_link(url: str) -> Tuple[str, bytes]:
+    """(handle, 32-byte file key) of a public link: mega.nz/file/<h>#<key> or mega.nz/#!<h>!<key>."""
+    match = re.search(r'/file/([\w-]+)#([\w-]+)', url) or re.search(r'#!([\w-]+)!([\w-]+)', url)
+    if not match:
+        raise DownloadError(f'Enlace de Mega no válido: {url}')
+    key = _b64decode(match.group(2))
+    if len(key) != 32:
+        raise DownloadError('La clave del enlace de Mega no es válida')
+    return match.group(1), key
+
+def unpack_key(key: bytes) -> Tuple[bytes, bytes, bytes]:
+    """(AES key, CTR nonce, expected meta-MAC) from a 32-byte file key."""
+    k = struct.unpack('>8I', key)
+    aes_key = struct.pack('>4I', k[0] ^ k[4], k[1] ^ k[5], k[2] ^ k[6], k[3] ^ k[7])
+    return aes_key, struct.pack('>2I', k[4], k[5]), struct.pack('>2I', k[6], k[7])
+
+def chunk_bounds(size: int) -> List[Tuple[int, int]]:
+    """Mega MAC chunks: 128 KB, 256 KB, ... up to 1 MB, then 1 MB each. [(start, end), ...]"""
+    chunks, start, step = [], 0, 0x20000
+    while start < size:
+        end = min(start + step, size)
+        chunks.append((start, end))
+        start = end
+        if step < 0x100000:
+            step += 0x20000
+    return chunks
+
+class ChunkMac:
+    """
+    Mega file MAC: a CBC-MAC per chunk (IV = nonce twice), condensed in
+    chunk order with a zero-IV CBC-MAC. Chunk MACs can be computed in any
+    order; they are folded in as soon as the chunks before them are done.
+    """
+
+    def __init__(self, aes_key: bytes, nonce: bytes):
+        from Crypto.Cipher import AES
+        self._aes = AES
+        self.aes_key = aes_key
+        self.iv = nonce + nonce
+        self._ecb = AES.new(aes_key, AES.MODE_ECB)
+        self._macs = {}
+        self._next = 0
+        self._state = bytes(16)
+        self._lock = threading.Lock()
+
+    def chunk_mac(self, data: bytes) -> bytes:
+        if len(data) % 16:
+            data += bytes(16 - len(data) % 16)
+        return self._aes.new(self.aes_key, self._aes.MODE_CBC, self.iv).encrypt(data)[-16:]
+
+    def add(self, index: int, mac: bytes):
+        """Record the MAC of chunk index and fold every contiguous chunk into the file MAC."""
+        with self._lock:
+            self._macs[index] = mac
+            while self._next in self._macs:
+                self._state = self._ecb.encrypt(bytes(a ^ b for a, b in zip(self._state, self._macs[self._next])))
+                self._next += 1
+
+    @property
+    def folded(self) -> int:
+        """Number of leading chunks already folded into the file MAC."""
+        return self._next
+
+    def meta_mac(self) -> bytes:
+        m = struct.unpack('>4I', self._state)
+        return struct.pack('>2I', m[0] ^ m[1], m[2] ^ m[3])
+
+    def macs(self) -> Dict[str, str]:
+        with self._lock:
+            return {str(index): mac.hex() for index, mac in self._macs.items()}
+
+class MegaDownloader(Downloader):
+    """
+    Native Mega.nz backend for public file links.
+    The encrypted file is fetched in chunk-aligned ranges over several
+    connections, decrypted (AES-CTR) as it streams and written straight to
+    the target; chunk MACs are checked as chunks complete and the file MAC
+    at the end. Completed chunks and their MACs are persisted next to the
+    target ('<target>.part.json'), so an interrupted download resumes.
+    Published block hashes (Digest) are checked on the decrypted data as it
+    is written, so a wrong or corrupt file is given up at its first bad block
+    instead of at the end.
+    """
+
+    def __init__(self, connections: int = 4, api_url: str = MEGA_API_URL, segment_size: int = SEGMENT_SIZE,
+                 **kwargs):
+        super().__init__(connections=connections, **kwargs)
+        self.api_url = api_url.rstrip('/')
+        self.segment_size = segment_size
+        self._sequence = 0
+
+    def file_info(self, handle: str, aes_key: bytes) -> Dict:
+        """Ask the Mega API for size, name and temporary download url of a public file."""
+        self._sequence += 1
+        try:
+            r = self.session.post(f'{self.api_url}/cs', params={'id': self._sequence},
+                                  data=json.dumps([{'a': 'g', 'g': 1, 'p': handle}]), timeout=self.timeout)
+            r.raise_for_status()
+            reply = r.json()
+        except (requests.RequestException, ValueError) as e:
+            raise DownloadError(f'No se pudo consultar Mega: {e}')
+        if isinstance(reply, int) or not isinstance(reply[0], dict):
+            raise DownloadError(f'Mega respondió con el error {reply if isinstance(reply, int) else reply[0]}')
+        info = reply[0]
+        if 'g' not in info:
+            raise DownloadError('Mega no ofrece enlace de descarga para este archivo')
+        return {'size': int(info['s']), 'url': info['g'], 'name': self._attribute_name(info.get('at', ''), aes_key)}
+
+    @staticmethod
+    def _attribute_name(at: str, aes_key: bytes) -> Optional[str]:
+        from Crypto.Cipher import AES
+        try:
+            data = AES.new(aes_key, AES.MODE_CBC, bytes(16)).decrypt(_b64decode(at))
+            if data.startswith(b'MEGA'):
+                return json.loads(data[4:].rstrip(b'\0').decode('utf-8')).get('n')
+        except (ValueError, UnicodeDecodeError):
+            pass
+        return None
+
+    def download(self, url: str, target: str, progress: Optional[Callable[[int, int], None]] = None,
+                 control: Optional[UpdateControl] = None,
+                 transform: Optional[Callable[[int, bytes], bytes]] = None,
+                 digest: Optional[Digest] = None) -> str:
+        """
+        Download a public Mega link into target, resuming a previous partial download.
+        :param transform: Optional (offset, data) -> data applied to the
+                          decrypted (and MAC-checked) data before writing.
+        :param digest: Optional published size and hashes of the decrypted file.
+        Raises DownloadError on failure or MAC mismatch (DigestError when the
+        file does not match digest), UpdateCancelled when cancelled.
+        """
+        with tracing.span('download.mega', target=os.path.basename(target)) as span:
+            if tracing.enabled():
+                progress = self._traced_progress(progress, span)
+            return self._download_mega(url, target, progress, control, transform, digest)
+
+    def _download_mega(self, url: str, target: str, progress: Optional[Callable[[int, int], None]],
+                       control: Optional[UpdateControl],
+                       transform: Optional[Callable[[int, bytes], bytes]],
+                       digest: Optional[Digest] = None) -> str:
+        handle, key = parse_link(url)
+        aes_key, nonce, expected_mac = unpack_key(key)
+        info = self.file_info(handle, aes_key)
+        total = info['size']
+        if digest and digest.size is not None and total != digest.size:
+            raise DigestError(f'El archivo de Mega no mide {digest.size} bytes como indica version.json')
+
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        part_path = target + '.part'
+        state_path = part_path + '.json'
+        chunks = chunk_bounds(total)
+        mac = ChunkMac(aes_key, nonce)
+
+        # Chunks are fetched in parallel runs, so only block hashes can be checked inline
+        verifier = digest.verifier() if digest else None
+        state = self._load_state(state_path, handle, total, key.hex())
+        if state is not None and verifier and 'verified' not in state:
+            state = None
+        if state is None or not os.path.exists(part_path):
+            state = {'url': handle, 'size': total, 'validator': key.hex(), 'macs': {}}
+            if verifier:
+                state['verified'] = []
+            with open(part_path, 'wb') as f:
+                f.truncate(total)
+            self._save_state(state_path, state)
+        if verifier:
+            # Chunks of a block left unverified by the interruption are fetched again with it
+            verifier.verified.update(state['verified'])
+            state['macs'] = {index: value for index, value in state['macs'].items()
+                             if self._chunk_verified(chunks[int(index)], verifier)}
+        for index, value in state.get('macs', {}).items():
+            mac.add(int(index), bytes.fromhex(value))
+
+        done = [sum(chunks[int(index)][1] - chunks[int(index)][0] for index in state['macs'])]
+        if progress:
+            progress(done[0], total)
+
+        def on_chunk(index: int, chunk_mac: bytes):
+            mac.add(index, chunk_mac)
+            with self._lock:
+                done[0] += chunks[index][1] - chunks[index][0]
+                current = done[0]
+                state['macs'] = mac.macs()
+                if verifier:
+                    state['verified'] = sorted(verifier.verified)
+                state_due = current - state.get('saved', 0) >= 4 * 1024 * 1024
+                if state_due:
+                    state['saved'] = current
+            if state_due:
+                self._save_state(state_path, state)
+            if progress:
+                progress(current, total)
+
+        cipher = AesCtr(aes_key, nonce)
+        pending = self._plan_chunk_segments(chunks, {int(index) for index in state['macs']})
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.connections, len(pending))) as pool:
+                futures = [pool.submit(self._fetch_chunks, info['url'], part_path, chunks, segment, cipher, mac,
+                                       on_chunk, control, transform, verifier)
+                           for segment in pending]
+                errors = [f.exception() for f in futures if f.exception()]
+            state['macs'] = mac.macs()
+            if verifier:
+                state['verified'] = sorted(verifier.verified)
+            self._save_state(state_path, state)
+            for error in errors:
+                if isinstance(error, UpdateCancelled):
+                    raise error
+            if verifier and verifier.failed:
+                self._discard_state(part_path, state_path)
+                raise verifier.failed
+            if errors:
+                raise DownloadError(f'Descarga interrumpida: {errors[0]}')
+
+        if mac.folded != len(chunks) or mac.meta_mac() != expected_mac:
+            # Corrupt or tampered data: do not resume from it
+            self._discard_state(part_path, state_path)
+            raise DownloadError('El archivo descargado de Mega no supera la verificación MAC')
+        if digest and (verifier or not transform):
+            # Without block hashes a transformed file cannot be hashed on disk: the MAC stands in
+            self._verify(digest, verifier, part_path, state_path, total)
+        os.replace(part_path, target)
+        self._discard_state(None, state_path)
+        return target
+
+    @staticmethod
+    def _chunk_verified(bounds: Tuple[int, int], verifier: BlockVerifier) -> bool:
+        """Whether every block a chunk overlaps was verified."""
+        first, last = bounds[0] // verifier.block_size, (bounds[1] - 1) // verifier.block_size
+        return all(index in verifier.verified for index in range(first, last + 1))
+
+    def _plan_chunk_segments(self, chunks: List[Tuple[int, int]], completed: set) -> List[List[int]]:
+        """Group consecutive missing chunks into runs of about segment_size bytes."""
+        segments, current, size = [], [], 0
+        for index, (start, end) in enumerate(chunks):
+            if index in completed:
+                if current:
+                    segments.append(current)
+                current, size = [], 0
+                continue
+            current.append(index)
+            size += end - start
+            if size >= self.segment_size:
+                segments.append(current)
+                current, size = [], 0
+        if current:
+            segments.append(current)
+        return segments
+
+    def _fetch_chunks(self, url: str, part_path: str, chunks: List[Tuple[int, int]], indexes: List[int],
+                      cipher: AesCtr, mac: ChunkMac, on_chunk: Callable[[int, bytes], None],
+                      control: Optional[UpdateControl], transform: Optional[Callable[[int, bytes], bytes]],
+                      verifier: Optional[BlockVerifier] = None):
+        """
+        Fetch a run of chunks with one ranged request, retrying from the first
+        unfinished chunk. A block that fails its hash stops the whole download,
+        which is discarded rather than resumed.
+        """
+        attempt = 0
+        remaining = list(indexes)
+        while remaining:
+            if attempt > self.retries:
+                raise DownloadError('La conexión con Mega se cerró antes de completar el rango')
+            start, end = chunks[remaining[0]][0], chunks[remaining[-1]][1]
+            progressed = False
+            try:
+                # Mega takes the range as a path suffix: <url>/<first>-<last>
+                with self.session.get(f'{url}/{start}-{end - 1}', stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    buffer = bytearray()
+                    with open(part_path, 'r+b', buffering=0) as f:
+                        for data in r.iter_content(chunk_size=self.chunk_size):
+                            if control:
+                                control.checkpoint()
+                            if self.limiter:
+                                self.limiter.consume(len(data))
+                            buffer += data
+                            while remaining:
+                                chunk_start, chunk_end = chunks[remaining[0]]
+                                if len(buffer) < chunk_end - chunk_start:
+                                    break
+                                encrypted = bytes(buffer[:chunk_end - chunk_start])
+                                del buffer[:chunk_end - chunk_start]
+                                plain = cipher.cipher_at(chunk_start).decrypt(encrypted)
+                                if verifier:
+                                    try:
+                                        verifier.update(chunk_start, plain)
+                                    except DigestError as e:
+                                        raise verifier.fail(e)
+                                f.seek(chunk_start)
+                                f.write(transform(chunk_start, plain) if transform else plain)
+                                on_chunk(remaining.pop(0), mac.chunk_mac(plain))
+                                progressed = True
+                attempt = 0 if progressed else attempt + 1
+            except requests.RequestException as e:
+                attempt += 1
+                if attempt > self.retries:
+                    raise DownloadError(f'Error de red: {e}')
+
+def encrypt_file(source: str, target: str) -> str:
+    """
+    Encrypt a file the way Mega stores uploads (AES-CTR plus chunk MACs).
+    Returns the base64 file key that goes after '#' in the public link.
+    Used to publish to a Mega-compatible mirror and by local stand-ins.
+    """
+    aes_key, nonce = os.urandom(16), os.urandom(8)
+    size = os.path.getsize(source)
+    mac = ChunkMac(aes_key, nonce)
+    cipher = AesCtr(aes_key, nonce)
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        for index, (start, end) in enumerate(chunk_bounds(size)):
+            plain = src.read(end - start)
+            mac.add(index, mac.chunk_mac(plain))
+            dst.write(cipher.cipher_at(start).encrypt(plain))
+    a = struct.unpack('>4I', aes_key)
+    n = struct.unpack('>2I', nonce)
+    m = struct.unpack('>2I', mac.meta_mac())
+    return _b64encode(struct.pack('>8I', a[0] ^ n[0], a[1] ^ n[1], a[2] ^ m[0], a[3] ^ m[1], n[0], n[1], m[0], m[1]))
+
+def encrypt_attributes(attributes: Dict, key: bytes) -> str:
+    """Encrypted 'at' field for the file attributes (e.g. {'n': name}) under a 32-byte file key."""
+    from Crypto.Cipher import AES
+    data = b'MEGA' + json.dumps(attributes).encode('utf-8')
+    data += bytes(-len(data) % 16)
+    return _b64encode(AES.new(unpack_key(key)[0], AES.MODE_CBC, bytes(16)).encrypt(data))
@@ -0,0 +1,131 @@
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from core import tracing
+
+# Bytes read from every mirror to measure its throughput when ranking several
+PROBE_SIZE = 256 * 1024
+# Failed or stalled requests after which a mirror is not used again
+MAX_FAILURES = 2
+# Assumed throughput (bytes/s) of a mirror that could not be measured yet
+UNKNOWN_RATE = 512 * 1024
+
+def mirror_urls(block: Dict) -> List[str]:
+    """
+    Download urls of a version.json artifact: 'url' first, then its 'mirrors',
+    without duplicates or empty entries.
+    """
+    urls = []
+    for url in [block.get('url', '')] + list(block.get('mirrors') or []):
+        url = (url or '').strip()
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+class Mirror:
+    """One source of a file with the figures used to rank it."""
+    __slots__ = ('url', 'latency', 'throughput', 'total', 'validator', 'ranges', 'failures', 'active', 'error')
+
+    def __init__(self, url: str):
+        self.url = url
+        self.latency = None
+        self.throughput = None
+        self.total = None
+        self.validator = ''
+        self.ranges = False
+        self.failures = 0
+        self.active = 0
+        self.error = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.failures < MAX_FAILURES
+
+    def cost(self, amount: int) -> float:
+        """Expected seconds to fetch amount more bytes, given the requests it already serves."""
+        rate = self.throughput or UNKNOWN_RATE
+        return (self.latency or 1.0) + amount * (self.active + 1) / rate
+
+class MirrorPool:
+    """
+    Mirrors of the same file, ranked by measured latency and throughput.
+    probe() measures every mirror concurrently; while downloading, acquire()
+    hands each segment the mirror expected to finish it first, so fast
+    mirrors serve several segments at once, and release() feeds the
+    observed throughput back. Mirrors that fail or stall are dropped.
+    """
+
+    def __init__(self, urls: List[str], session: requests.Session, timeout: int = 10):
+        self.mirrors = [Mirror(url) for url in urls]
+        self.session = session
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.mirrors)
+
+    def probe(self, size: int = PROBE_SIZE) -> List[Mirror]:
+        """Measure every mirror concurrently; returns the reachable ones, best first."""
+        with tracing.span('mirrors.probe', mirrors=len(self.mirrors)) as span:
+            if len(self.mirrors) == 1:
+                self._probe(self.mirrors[0], size)
+            else:
+                with ThreadPoolExecutor(max_workers=len(self.mirrors)) as pool:
+                    list(pool.map(lambda mirror: self._probe(mirror, size), self.mirrors))
+            ranked = self.ranked()
+            span.set(reachable=len(ranked))
+        return ranked
+
+    def ranked(self) -> List[Mirror]:
+        """Healthy mirrors, cheapest first for a probe-sized request."""
+        with self._lock:
+            return sorted((m for m in self.mirrors if m.healthy), key=lambda m: m.cost(PROBE_SIZE))
+
+    def acquire(self, amount: int) -> Optional[Mirror]:
+        """The healthy mirror expected to deliver amount bytes soonest (None if none is left)."""
+        with self._lock:
+            candidates = [m for m in self.mirrors if m.healthy and m.ranges]
+            if not candidates:
+                return None
+            mirror = min(candidates, key=lambda m: m.cost(amount))
+            mirror.active += 1
+            return mirror
+
+    def release(self, mirror: Mirror, received: int, elapsed: float, failed: bool = False):
+        """Return a mirror, updating its throughput with what the request achieved."""
+        with self._lock:
+            mirror.active -= 1
+            if received > 0 and elapsed > 0:
+                rate = received / elapsed
+                mirror.throughput = rate if mirror.throughput is None else 0.5 * mirror.throughput + 0.5 * rate
+            if failed:
+                mirror.failures += 1
+
+    def _probe(self, mirror: Mirror, size: int):
+        start = time.perf_counter()
+        try:
+            with self.session.get(mirror.url, headers={'Range': f'bytes=0-{size - 1}'}, stream=True,
+                                  timeout=self.timeout) as r:
+                r.raise_for_status()
+                mirror.latency = time.perf_counter() - start
+                received = 0
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    received += len(chunk)
+                    if received >= size:
+                        break
+                elapsed = time.perf_counter() - start - mirror.latency
+                if received > 1 and elapsed > 0:
+                    mirror.throughput = received / elapsed
+                content_range = r.headers.get('Content-Range', '')
+                total = content_range.rsplit('/', 1)[1].strip() if '/' in content_range else ''
+                mirror.ranges = r.status_code == 206 and total.isdigit()
+                if mirror.ranges:
+                    mirror.total = int(total)
+                elif (r.headers.get('Content-Length') or '').isdigit():
+                    mirror.total = int(r.headers['Content-Length'])
+                mirror.validator = r.headers.get('ETag') or r.headers.get('Last-Modified') or ''
+        except requests.RequestException as e:
+            mirror.error = e
+            mirror.failures = MAX_FAILURES
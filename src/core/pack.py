@@ -0,0 +1,329 @@
+import io
+import os
+import sys
+import mmap
+import lzma
+import zlib
+import time
+import shutil
+import struct
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import BinaryIO, Callable, Collection, List, Optional, Union
+from core.exceptions import ExtractionError
+from core.fastzip import safe_join
+from core.progress import UpdateControl
+
+# l2pack layout:
+#   header   64 bytes at offset 0: magic, entry count, offsets of the index and names
+#   data     the entries, each compressed on its own
+#   index    entry count * 48-byte records (offset, sizes, mtime, name, crc32, method)
+#   names    UTF-8 names the records point into
+# The index has a fixed record size at a known offset, so it is read with a
+# single mmap (or Range request) and any entry can be extracted on its own.
+MAGIC = b'L2PACK01'
+_HEADER = struct.Struct('<8sIIQQQ24x')
+_ENTRY = struct.Struct('<QQQqIIIB3x')
+
+METHOD_STORE = 0
+METHOD_ZLIB = 1
+METHOD_LZMA = 2
+METHOD_ZSTD = 3
+METHODS = {'store': METHOD_STORE, 'zlib': METHOD_ZLIB, 'lzma': METHOD_LZMA, 'zstd': METHOD_ZSTD}
+
+# Already compressed formats are stored as they are
+STORED_EXTENSIONS = ('.ogg', '.mp3', '.bik', '.png', '.jpg', '.jpeg', '.zip', '.7z', '.rar', '.gz', '.xz')
+# Entries whose first megabyte does not shrink below this ratio are stored too
+STORE_RATIO = 0.95
+READ_SIZE = 1024 * 1024
+# Entries are handed to workers in batches of roughly this many stored bytes
+BATCH_SIZE = 4 * 1024 * 1024
+
+def is_pack(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise ExtractionError('El paquete usa zstd y falta el módulo zstandard')
+    return zstandard
+
+def _compressor(method: int, level: Optional[int]):
+    if method == METHOD_ZLIB:
+        return zlib.compressobj(6 if level is None else level)
+    if method == METHOD_LZMA:
+        return lzma.LZMACompressor(preset=6 if level is None else level)
+    if method == METHOD_ZSTD:
+        return _zstd().ZstdCompressor(level=19 if level is None else level).compressobj()
+    return None
+
+def _decompressor(method: int):
+    if method == METHOD_ZLIB:
+        return zlib.decompressobj()
+    if method == METHOD_LZMA:
+        return lzma.LZMADecompressor()
+    if method == METHOD_ZSTD:
+        return _zstd().ZstdDecompressor().decompressobj()
+    if method == METHOD_STORE:
+        return None
+    raise ExtractionError(f'Método de compresión desconocido: {method}')
+
+class PackEntry:
+    """One file of a pack. Mirrors the zipfile.ZipInfo attributes SystemManager relies on."""
+    __slots__ = ('filename', 'offset', 'compress_size', 'file_size', 'mtime', 'CRC', 'method')
+
+    def __init__(self, filename: str, offset: int, compress_size: int, file_size: int,
+                 mtime: int, crc: int, method: int):
+        self.filename = filename
+        self.offset = offset
+        self.compress_size = compress_size
+        self.file_size = file_size
+        self.mtime = mtime
+        self.CRC = crc
+        self.method = method
+
+    def is_dir(self) -> bool:
+        return False
+
+class PackReader:
+    """
+    Random access to the entries of a pack, given its path (memory-mapped)
+    or any seekable file object, e.g. a RemoteFile over Range requests.
+    """
+
+    def __init__(self, source: Union[str, BinaryIO]):
+        self._file = open(source, 'rb') if isinstance(source, str) else source
+        self._owned = isinstance(source, str)
+        self._map = None
+        if self._owned and os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, _, index_offset, names_offset, names_size = _HEADER.unpack(self._read(0, _HEADER.size))
+        if magic != MAGIC:
+            raise ExtractionError('No es un paquete l2pack')
+        index = self._read(index_offset, count * _ENTRY.size)
+        names = self._read(names_offset, names_size)
+        self.entries = []
+        for record in _ENTRY.iter_unpack(index):
+            offset, stored, size, mtime, name_offset, name_size, crc, method = record
+            name = bytes(names[name_offset:name_offset + name_size]).decode('utf-8')
+            self.entries.append(PackEntry(name, offset, stored, size, mtime, crc, method))
+        self._by_name = {entry.filename: entry for entry in self.entries}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._owned:
+            self._file.close()
+
+    def infolist(self) -> List[PackEntry]:
+        return list(self.entries)
+
+    def getinfo(self, name: str) -> PackEntry:
+        return self._by_name[name]
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._map is not None:
+            data = self._map[offset:offset + size]
+        else:
+            self._file.seek(offset)
+            data = self._file.read(size)
+        if len(data) != size:
+            raise ExtractionError('El paquete está truncado')
+        return data
+
+    def extract(self, entry: PackEntry, target: str):
+        """
+        Extract one entry to target through a temporary file, checking its
+        CRC32 and size; the file keeps the packed timestamp.
+        """
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = target + '.tmp'
+        decompressor = _decompressor(entry.method)
+        crc = 0
+        written = 0
+        try:
+            with open(tmp_path, 'wb') as dst:
+                position, remaining = entry.offset, entry.compress_size
+                while remaining > 0:
+                    data = self._read(position, min(READ_SIZE, remaining))
+                    position += len(data)
+                    remaining -= len(data)
+                    if decompressor:
+                        data = decompressor.decompress(data)
+                    crc = zlib.crc32(data, crc)
+                    written += len(data)
+                    dst.write(data)
+                if entry.method == METHOD_ZLIB:
+                    data = decompressor.flush()
+                    crc = zlib.crc32(data, crc)
+                    written += len(data)
+                    dst.write(data)
+            if crc != entry.CRC or written != entry.file_size:
+                raise ExtractionError(f'CRC incorrecto en {entry.filename}')
+            os.utime(tmp_path, (entry.mtime, entry.mtime))
+            os.replace(tmp_path, target)
+        except (lzma.LZMAError, zlib.error) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise ExtractionError(f'{entry.filename} está dañado: {e}')
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+def _batches(entries: List[PackEntry]) -> List[List[PackEntry]]:
+    """Group entries into batches of about BATCH_SIZE stored bytes, largest first."""
+    batches, current, size = [], [], 0
+    for entry in sorted(entries, key=lambda e: e.compress_size, reverse=True):
+        current.append(entry)
+        size += entry.compress_size
+        if size >= BATCH_SIZE:
+            batches.append(current)
+            current, size = [], 0
+    if current:
+        batches.append(current)
+    return batches
+
+def extract_parallel(pack_path: str, root: str, workers: Optional[int] = None,
+                     progress: Optional[Callable[[int, int], None]] = None,
+                     control: Optional[UpdateControl] = None,
+                     only: Optional[Collection[str]] = None) -> List[PackEntry]:
+    """
+    Extract a pack into root using every core; like fastzip.extract_parallel.
+    The pack is memory-mapped once and shared by the worker threads (zlib,
+    lzma and zstd release the GIL while decompressing).
+    :param only: Optional entry names to extract; everything else is skipped.
+    Returns the extracted entries. Raises ExtractionError.
+    """
+    workers = workers or os.cpu_count() or 1
+    with PackReader(pack_path) as reader:
+        entries = reader.infolist()
+        if only is not None:
+            entries = [entry for entry in entries if entry.filename in only]
+        total = sum(entry.file_size for entry in entries)
+
+        def extract_batch(batch: List[PackEntry]) -> int:
+            written = 0
+            for entry in batch:
+                target = safe_join(root, entry.filename)
+                if target is not None:
+                    reader.extract(entry, target)
+                written += entry.file_size
+            return written
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                pending = {executor.submit(extract_batch, batch) for batch in _batches(entries)}
+                while pending:
+                    finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done += future.result()
+                        if progress:
+                            progress(done, total)
+                    if control:
+                        control.checkpoint()
+            except BaseException:
+                executor.shutdown(wait=True, cancel_futures=True)
+                raise
+    return entries
+
+def _choose_method(path: str, method: int, level: Optional[int]) -> int:
+    """Store entries that would not shrink: known compressed formats, or a poor first megabyte."""
+    if method == METHOD_STORE or path.lower().endswith(STORED_EXTENSIONS):
+        return METHOD_STORE
+    with open(path, 'rb') as f:
+        sample = f.read(READ_SIZE)
+    if not sample:
+        return METHOD_STORE
+    compressor = _compressor(method, level)
+    packed = compressor.compress(sample) + compressor.flush()
+    return method if len(packed) < len(sample) * STORE_RATIO else METHOD_STORE
+
+def _compress_entry(path: str, target: str, method: int, level: Optional[int]) -> tuple:
+    """Compress one file to target; returns (method used, size, crc32)."""
+    method = _choose_method(path, method, level)
+    compressor = _compressor(method, level)
+    crc = 0
+    size = 0
+    with open(path, 'rb') as src, open(target, 'wb') as out:
+        for data in iter(lambda: src.read(READ_SIZE), b''):
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            out.write(compressor.compress(data) if compressor else data)
+        if compressor:
+            out.write(compressor.flush())
+    return method, size, crc
+
+def write_pack(root: str, target: str, method: Union[int, str] = METHOD_LZMA, level: Optional[int] = None,
+               names: Optional[List[str]] = None, workers: Optional[int] = None,
+               log: Optional[Callable[[str], None]] = None) -> int:
+    """
+    Build a pack from the files under root, named by their '/' separated
+    path relative to root (e.g. 'system/l2.exe', like the zip entries).
+    Entries are compressed in parallel, each to a temporary file, and
+    appended in order.
+    :param method: 'zstd', 'lzma', 'zlib' or 'store' for compressible entries.
+    :param names: Optional subset of relative paths to pack.
+    Returns the number of entries written.
+    """
+    method = METHODS[method] if isinstance(method, str) else method
+    if method == METHOD_ZSTD:
+        _zstd()
+    if names is None:
+        names = []
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            for name in sorted(files):
+                names.append(os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/'))
+    records = []
+    name_table = io.BytesIO()
+    tmp_path = target + '.tmp'
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(target))) as work, \
+            ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool, open(tmp_path, 'wb') as out:
+        paths = [os.path.join(root, *name.split('/')) for name in names]
+        parts = [os.path.join(work, str(i)) for i in range(len(names))]
+        futures = [pool.submit(_compress_entry, path, part, method, level) for path, part in zip(paths, parts)]
+        out.write(b'\0' * _HEADER.size)
+        for name, path, part, future in zip(names, paths, parts, futures):
+            entry_method, size, crc = future.result()
+            offset = out.tell()
+            with open(part, 'rb') as src:
+                shutil.copyfileobj(src, out, READ_SIZE)
+            os.remove(part)
+            encoded = name.encode('utf-8')
+            records.append(_ENTRY.pack(offset, out.tell() - offset, size, int(os.path.getmtime(path)),
+                                       name_table.tell(), len(encoded), crc, entry_method))
+            name_table.write(encoded)
+            if log:
+                log(f'{name}: {size} -> {out.tell() - offset}')
+        index_offset = out.tell()
+        for record in records:
+            out.write(record)
+        names_offset = out.tell()
+        out.write(name_table.getvalue())
+        out.seek(0)
+        out.write(_HEADER.pack(MAGIC, len(records), 0, index_offset, names_offset, name_table.tell()))
+    os.replace(tmp_path, target)
+    return len(records)
+
+if __name__ == '__main__':
+    # python -m core.pack <carpeta del cliente> system.l2pack [zstd|lzma|zlib|store]
+    if len(sys.argv) < 3:
+        print('Uso: python -m core.pack <carpeta del cliente> <paquete> [zstd|lzma|zlib|store]')
+        sys.exit(1)
+    start = time.perf_counter()
+    count = write_pack(sys.argv[1], sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else 'lzma')
+    print(f'{count} archivos empaquetados en {time.perf_counter() - start:.1f} s')
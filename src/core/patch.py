@@ -0,0 +1,276 @@
+import os
+import sys
+import json
+import lzma
+import mmap
+import zlib
+import struct
+import shutil
+import hashlib
+from typing import BinaryIO, Dict, List, Optional, Union
+from core.exceptions import PatchError
+
+# Patch file: an LZMA stream holding a header and a list of operations that
+# rebuild the new file from the old one:
+#   'C' offset length  copy length bytes of the old file from offset
+#   'A' length data    add literal bytes
+#   'E'                end
+MAGIC = b'L2PATCH1'
+_HEADER = struct.Struct('<8sQQ32s32s')
+_COPY = struct.Struct('<QQ')
+_ADD = struct.Struct('<Q')
+
+# Blocks of the old file matched in the new one
+BLOCK_SIZE = 4096
+# Patches of files smaller than this are not worth publishing
+MIN_FILE_SIZE = 1024 * 1024
+# A patch is only kept when its literal data stays below this share of the new file
+MAX_LITERAL_RATIO = 0.5
+CHUNK_SIZE = 1024 * 1024
+
+_ADLER_MOD = 65521
+
+def make_patch(old_path: str, new_path: str, patch_path: str, block_size: int = BLOCK_SIZE,
+               max_literal_ratio: float = MAX_LITERAL_RATIO) -> Optional[int]:
+    """
+    Write a patch turning old_path into new_path.
+    Blocks of the old file are indexed by their Adler-32 and searched in the
+    new file with a rolling checksum, so changed records, insertions and
+    shifted data all reuse the old bytes. Returns the patch size, or None if
+    the files differ too much for a patch to pay off.
+    """
+    old_size, new_size = os.path.getsize(old_path), os.path.getsize(new_path)
+    with open(old_path, 'rb') as old_file, open(new_path, 'rb') as new_file:
+        old = mmap.mmap(old_file.fileno(), 0, access=mmap.ACCESS_READ) if old_size else b''
+        new = mmap.mmap(new_file.fileno(), 0, access=mmap.ACCESS_READ) if new_size else b''
+        try:
+            ops = _diff(old, new, block_size, int(new_size * max_literal_ratio))
+            if ops is None:
+                return None
+            header = _HEADER.pack(MAGIC, old_size, new_size, _sha256(old), _sha256(new))
+            with lzma.open(patch_path, 'wb', preset=6) as out:
+                out.write(header)
+                for op in ops:
+                    if op[0] == 'C':
+                        out.write(b'C' + _COPY.pack(op[1], op[2]))
+                    else:
+                        out.write(b'A' + _ADD.pack(op[2] - op[1]))
+                        out.write(new[op[1]:op[2]])
+                out.write(b'E')
+        finally:
+            for view in (old, new):
+                if isinstance(view, mmap.mmap):
+                    view.close()
+    return os.path.getsize(patch_path)
+
+def _sha256(data) -> bytes:
+    h = hashlib.sha256()
+    for offset in range(0, len(data), CHUNK_SIZE):
+        h.update(data[offset:offset + CHUNK_SIZE])
+    return h.digest()
+
+def _diff(old, new, block_size: int, max_literal: int) -> Optional[List[tuple]]:
+    """
+    Operations rebuilding new from old: ('C', old_offset, length) and
+    ('A', new_start, new_end). None once the literal bytes exceed max_literal.
+    """
+    index = {}
+    for offset in range(0, len(old) - block_size + 1, block_size):
+        index.setdefault(zlib.adler32(old[offset:offset + block_size]), offset)
+
+    ops = []
+    literal_start = 0
+    literal_total = 0
+    pos = 0
+    end = len(new)
+    weak = None
+    while pos + block_size <= end:
+        if weak is None:
+            weak = zlib.adler32(new[pos:pos + block_size])
+        match = index.get(weak)
+        if match is not None and old[match:match + block_size] == new[pos:pos + block_size]:
+            start, source = pos, match
+            # Grow the match backwards into the pending literal bytes
+            while start > literal_start and source > 0 and old[source - 1] == new[start - 1]:
+                start -= 1
+                source -= 1
+            length = _match_length(old, new, source, start)
+            if start > literal_start:
+                ops.append(('A', literal_start, start))
+            ops.append(('C', source, length))
+            pos = literal_start = start + length
+            weak = None
+            continue
+        # No match here: roll the checksum one byte forward
+        if pos + block_size >= end:
+            break
+        out_byte, in_byte = new[pos], new[pos + block_size]
+        a = weak & 0xFFFF
+        b = weak >> 16
+        a = (a - out_byte + in_byte) % _ADLER_MOD
+        b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+        weak = (b << 16) | a
+        pos += 1
+        if pos - literal_start + literal_total > max_literal:
+            return None
+        if pos - literal_start >= CHUNK_SIZE:
+            # Keep literal operations bounded for the applier
+            ops.append(('A', literal_start, pos))
+            literal_total += pos - literal_start
+            literal_start = pos
+    if literal_start < end:
+        literal_total += end - literal_start
+        if literal_total > max_literal:
+            return None
+        ops.append(('A', literal_start, end))
+    return ops
+
+def _match_length(old, new, source: int, start: int) -> int:
+    """Length of the common run of old[source:] and new[start:], compared a chunk at a time."""
+    length = 0
+    step = 64 * 1024
+    limit = min(len(old) - source, len(new) - start)
+    while length < limit:
+        size = min(step, limit - length)
+        if old[source + length:source + length + size] == new[start + length:start + length + size]:
+            length += size
+            continue
+        if size <= 64:
+            while length < limit and old[source + length] == new[start + length]:
+                length += 1
+            break
+        step = max(64, size // 8)
+    return length
+
+def apply_patch(old_path: str, patch: Union[str, BinaryIO], target: str, expected_sha256: Optional[str] = None,
+                control=None) -> str:
+    """
+    Rebuild a file from its previous version and a patch.
+    The patch (a path or a readable stream, e.g. an HTTP response body) is
+    decompressed and applied as it is read, so memory use stays at one chunk
+    whatever the file size. The result must match the hash in the patch and,
+    if given, expected_sha256; otherwise PatchError is raised and target removed.
+    :param control: Optional UpdateControl checked between operations.
+    Returns the hex SHA-256 of the rebuilt file.
+    """
+    try:
+        with lzma.open(patch, 'rb') as src, open(old_path, 'rb') as old, open(target, 'wb') as out:
+            magic, old_size, new_size, _, new_hash = _HEADER.unpack(_read_exact(src, _HEADER.size))
+            if magic != MAGIC:
+                raise PatchError('Formato de parche desconocido')
+            if os.fstat(old.fileno()).st_size != old_size:
+                raise PatchError('El parche no corresponde a este archivo')
+            h = hashlib.sha256()
+            written = 0
+            while True:
+                if control:
+                    control.checkpoint()
+                op = src.read(1)
+                if op == b'C':
+                    offset, length = _COPY.unpack(_read_exact(src, _COPY.size))
+                    old.seek(offset)
+                    source = old
+                elif op == b'A':
+                    length, = _ADD.unpack(_read_exact(src, _ADD.size))
+                    source = src
+                elif op == b'E':
+                    break
+                else:
+                    raise PatchError('Parche dañado')
+                while length > 0:
+                    data = _read_exact(source, min(CHUNK_SIZE, length))
+                    out.write(data)
+                    h.update(data)
+                    written += len(data)
+                    length -= len(data)
+        digest = h.hexdigest()
+        if written != new_size or digest != new_hash.hex() or \
+                (expected_sha256 and digest != expected_sha256.lower()):
+            raise PatchError('El archivo parcheado no supera la verificación')
+        return digest
+    except (lzma.LZMAError, EOFError, struct.error) as e:
+        _remove(target)
+        raise PatchError(f'Parche dañado: {e}')
+    except BaseException:
+        _remove(target)
+        raise
+
+def _read_exact(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise PatchError('El parche está truncado')
+    return data
+
+def _remove(path: str):
+    if os.path.exists(path):
+        os.remove(path)
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _tree(folder: str) -> Dict[str, str]:
+    """Manifest path ('/' separated) -> file path of every file under folder."""
+    files = {}
+    for directory, _, names in os.walk(folder):
+        for name in names:
+            path = os.path.join(directory, name)
+            files[os.path.relpath(path, folder).replace(os.sep, '/')] = path
+    return files
+
+def build_release(new_folder: str, out_folder: str, version: str, previous: Dict[str, str],
+                  min_size: int = MIN_FILE_SIZE, log=print) -> Dict:
+    """
+    Publish a system/ tree as a manifest with binary patches.
+    Writes out_folder/manifest.json, the full files under out_folder/files/
+    and, for every changed file of at least min_size, a patch from each
+    previous tree ({version: system folder}) under out_folder/patches/<version>/.
+    """
+    from core.system import PROTECTED_FILES
+    new_files = _tree(new_folder)
+    old_trees = {old_version: _tree(folder) for old_version, folder in previous.items()}
+    entries = []
+    for rel_path, path in sorted(new_files.items()):
+        if os.path.basename(path) in PROTECTED_FILES:
+            continue
+        target = os.path.join(out_folder, 'files', *rel_path.split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(path, target)
+        entry = {'path': rel_path, 'size': os.path.getsize(path), 'sha256': _hash_file(path)}
+        patches = []
+        for old_version, old_files in old_trees.items():
+            old_path = old_files.get(rel_path)
+            if not old_path or entry['size'] < min_size:
+                continue
+            old_hash = _hash_file(old_path)
+            if old_hash == entry['sha256']:
+                continue
+            patch_rel = f'patches/{old_version}/{rel_path}.patch'
+            patch_path = os.path.join(out_folder, *patch_rel.split('/'))
+            os.makedirs(os.path.dirname(patch_path), exist_ok=True)
+            size = make_patch(old_path, path, patch_path)
+            if size is None or size >= entry['size'] * MAX_LITERAL_RATIO:
+                _remove(patch_path)
+                log(f'{rel_path} ({old_version}): sin parche, cambia demasiado')
+                continue
+            patches.append({'version': old_version, 'from': old_hash, 'path': patch_rel, 'size': size})
+            log(f"{rel_path} ({old_version}): parche de {size / 1024:.0f} KB para {entry['size'] / 1024:.0f} KB")
+        if patches:
+            entry['patches'] = patches
+        entries.append(entry)
+    manifest = {'version': version, 'files': entries}
+    with open(os.path.join(out_folder, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+if __name__ == '__main__':
+    # python -m core.patch <system nuevo> <salida> <versión> [<versión anterior>=<system anterior> ...]
+    if len(sys.argv) < 4:
+        print('Uso: python -m core.patch <system/ nuevo> <carpeta de salida> <versión> '
+              '[<versión anterior>=<system/ anterior> ...]')
+        sys.exit(1)
+    previous = dict(arg.split('=', 1) for arg in sys.argv[4:])
+    build_release(sys.argv[1], sys.argv[2], sys.argv[3], previous)
@@ -0,0 +1,18 @@
+import os
+import sys
+
+def get_base_path():
+    """Get the base path for the application."""
+    if os.environ.get('L2_BASE_PATH'):
+        # Another client folder, e.g. for the headless updater (python -m core.updater --client)
+        return os.path.abspath(os.environ['L2_BASE_PATH'])
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable
+        return os.path.dirname(sys.executable)
+    else:
+        # Running as a script
+        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def cache_dir() -> str:
+    """Folder of the launcher caches (<base>/cache)."""
+    return os.path.join(get_base_path(), 'cache')
@@ -0,0 +1,356 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import socket
+import struct
+import threading
+import ipaddress
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import List, Optional, Tuple
+from core.system import SystemManager
+from core import tracing
+
+# Launchers of the same network find each other on this multicast group
+GROUP = '239.255.76.50'
+DISCOVERY_PORT = 47650
+# Seconds a discovery waits for answers
+DISCOVERY_TIMEOUT = 0.5
+MAGIC = 'l2peer/1'
+# Hashes asked for in a single discovery datagram
+MAX_WANT = 16
+# Last installed system archive, kept for the peers as downloads/shared/<sha256>
+SHARED_FOLDER = 'shared'
+BLOCK_SIZE = 256 * 1024
+
+_HASH = re.compile(r'[0-9a-f]{64}')
+_PATH = re.compile(r'/sha256/([0-9a-f]{64})')
+_RANGE = re.compile(r'bytes=(\d*)-(\d*)')
+
+def lan_address() -> Optional[str]:
+    """
+    Address of this machine on the interface multicast goes out of (no packet
+    is sent); None without one or when it is a public address, where sharing
+    would reach beyond a local network.
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.connect((GROUP, DISCOVERY_PORT))
+            address = sock.getsockname()[0]
+    except OSError:
+        return None
+    ip = ipaddress.ip_address(address)
+    if ip.is_unspecified or not (ip.is_private or ip.is_loopback):
+        return None
+    return address
+
+class Peer:
+    """Another launcher of the LAN, as found by discover()."""
+    __slots__ = ('host', 'port', 'id', 'version', 'has')
+
+    def __init__(self, host: str, port: int, peer_id: str, version: Optional[str], has: List[str]):
+        self.host = host
+        self.port = port
+        self.id = peer_id
+        self.version = version
+        self.has = has
+
+    def url(self, sha256: str) -> str:
+        return f'http://{self.host}:{self.port}/sha256/{sha256}'
+
+class PeerContent:
+    """
+    What a launcher can give its peers, addressed by SHA-256: the last
+    system archive it installed, the files of its installed manifest and
+    their chunks. Peers verify everything they receive, so only sizes are
+    checked here.
+    """
+
+    def __init__(self, client_folder: str):
+        self.manager = SystemManager(os.path.join(client_folder, 'system'))
+        self.shared_folder = os.path.join(client_folder, 'downloads', SHARED_FOLDER)
+        self._lock = threading.Lock()
+        self._stamp = None
+        # sha256 -> (path, offset, length, size of the whole file)
+        self._content = {}
+
+    def version(self) -> Optional[str]:
+        return self.manager.get_local_version()
+
+    def resolve(self, sha256: str) -> Optional[Tuple[str, int, int]]:
+        """(path, offset, length) of the content with this hash, None if it is not here."""
+        if not _HASH.fullmatch(sha256):
+            return None
+        archive = os.path.join(self.shared_folder, sha256)
+        if os.path.isfile(archive):
+            return archive, 0, os.path.getsize(archive)
+        with self._lock:
+            self._refresh()
+            found = self._content.get(sha256)
+        if found is None:
+            return None
+        path, offset, length, size = found
+        try:
+            if os.path.getsize(path) != size:
+                return None
+        except OSError:
+            return None
+        return path, offset, length
+
+    def has(self, wanted: List[str]) -> List[str]:
+        return [sha256 for sha256 in wanted if self.resolve(sha256)]
+
+    def _refresh(self):
+        """Map the installed manifest again when it changed."""
+        try:
+            stamp = os.stat(self.manager.manifest_file).st_mtime_ns
+        except OSError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._content = {}
+        manifest = self.manager.load_manifest() or {}
+        table = manifest.get('chunks') or {}
+        for entry in manifest.get('files', []):
+            path = self.manager.local_path(entry.get('path', ''))
+            try:
+                size = int(entry.get('size', -1))
+            except (TypeError, ValueError):
+                continue
+            if not path or size < 0:
+                continue
+            if entry.get('sha256'):
+                self._content[entry['sha256'].lower()] = (path, 0, size, size)
+            offset = 0
+            for chunk_id in entry.get('chunks', []):
+                record = table.get(chunk_id)
+                if record is None:
+                    break
+                self._content.setdefault(chunk_id, (path, offset, record[3], size))
+                offset += record[3]
+
+def share_archive(path: str, sha256: str) -> str:
+    """
+    Keep an installed system archive for the peers as
+    downloads/shared/<sha256>, replacing the previously shared one.
+    """
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), SHARED_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    for name in os.listdir(folder):
+        if name != sha256:
+            try:
+                os.remove(os.path.join(folder, name))
+            except OSError:
+                # Still being served; replaced next time
+                pass
+    target = os.path.join(folder, sha256)
+    os.replace(path, target)
+    return target
+
+class _Handler(BaseHTTPRequestHandler):
+    """GET/HEAD /sha256/<hash>, with single Range support."""
+    server_version = 'L2Peer/1'
+
+    def do_GET(self):
+        self._send(body=True)
+
+    def do_HEAD(self):
+        self._send(body=False)
+
+    def _send(self, body: bool):
+        match = _PATH.fullmatch(self.path)
+        found = self.server.content.resolve(match.group(1)) if match else None
+        if found is None:
+            self.send_error(404)
+            return
+        path, offset, length = found
+        start, end, status = 0, length - 1, 200
+        requested = _RANGE.fullmatch((self.headers.get('Range') or '').strip())
+        if requested and (requested.group(1) or requested.group(2)):
+            if requested.group(1):
+                start = int(requested.group(1))
+                end = min(int(requested.group(2)), length - 1) if requested.group(2) else length - 1
+            else:
+                start = max(0, length - int(requested.group(2)))
+            if start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{length}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{match.group(1)}"')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{length}')
+        self.end_headers()
+        if not body:
+            return
+        try:
+            with tracing.span('peers.serve', bytes=end + 1 - start), open(path, 'rb') as f:
+                f.seek(offset + start)
+                remaining = end + 1 - start
+                while remaining > 0:
+                    data = f.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+        except (OSError, ConnectionError):
+            # Peer gone or file replaced meanwhile: the peer verifies and goes elsewhere
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+class PeerServer:
+    """
+    Serves the PeerContent of a client folder to the other launchers of the
+    LAN: files over HTTP (any free port) and answers to discovery queries
+    on the multicast group, both only on the LAN interface at address.
+    """
+
+    def __init__(self, client_folder: str, address: str, port: int = 0):
+        self.id = uuid.uuid4().hex
+        self.address = address
+        self.content = PeerContent(client_folder)
+        self.httpd = ThreadingHTTPServer((address, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.content = self.content
+        self.port = self.httpd.server_address[1]
+        self._socket = None
+
+    def start(self) -> 'PeerServer':
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        try:
+            self._socket = self._listen(self.address)
+            threading.Thread(target=self._answer, daemon=True).start()
+        except OSError:
+            # No multicast here: still reachable by the peers that know the port
+            self._socket = None
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._socket:
+            self._socket.close()
+
+    @staticmethod
+    def _listen(address: str) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        # Several launchers on the same host share the discovery port
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', DISCOVERY_PORT))
+        # Queries are only received from the LAN interface
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        struct.pack('4s4s', socket.inet_aton(GROUP), socket.inet_aton(address)))
+        return sock
+
+    def _answer(self):
+        while True:
+            try:
+                data, sender = self._socket.recvfrom(65536)
+            except OSError:
+                return
+            try:
+                query = json.loads(data.decode('utf-8'))
+                if query.get('magic') != MAGIC or query.get('id') == self.id:
+                    continue
+                wanted = [str(sha256).lower() for sha256 in (query.get('want') or [])[:MAX_WANT]]
+                reply = {'magic': MAGIC, 'id': self.id, 'port': self.port, 'version': self.content.version(),
+                         'has': self.content.has(wanted)}
+                self._socket.sendto(json.dumps(reply).encode('utf-8'), sender)
+            except (ValueError, AttributeError, OSError):
+                continue
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_server(client_folder: str, port: int = 0) -> Optional[PeerServer]:
+    """
+    Start sharing client_folder with the LAN (once per process); None if
+    there is no LAN interface (see lan_address) or the port is unavailable.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            address = lan_address()
+            if address is None:
+                return None
+            try:
+                _server = PeerServer(client_folder, address, port).start()
+            except OSError:
+                return None
+        return _server
+
+def discover(want: List[str], timeout: float = DISCOVERY_TIMEOUT) -> List[Peer]:
+    """
+    Ask the launchers of the LAN which of the wanted hashes they hold.
+    Returns every peer that answered within timeout (this process excluded);
+    Peer.has lists the wanted hashes it can serve.
+    """
+    own = _server.id if _server else None
+    query = json.dumps({'magic': MAGIC, 'id': own or '', 'want': [sha256.lower() for sha256 in want[:MAX_WANT]]})
+    peers = {}
+    with tracing.span('peers.discover', want=len(want)) as span:
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP) as sock:
+                # Never beyond the local network
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+                address = lan_address()
+                if address:
+                    # Out of the interface the servers listen on
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(address))
+                sock.sendto(query.encode('utf-8'), (GROUP, DISCOVERY_PORT))
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    sock.settimeout(remaining)
+                    try:
+                        data, sender = sock.recvfrom(65536)
+                    except socket.timeout:
+                        break
+                    try:
+                        reply = json.loads(data.decode('utf-8'))
+                        if reply.get('magic') != MAGIC or reply.get('id') in (own, None) or reply['id'] in peers:
+                            continue
+                        peers[reply['id']] = Peer(sender[0], int(reply['port']), reply['id'], reply.get('version'),
+                                                  [str(sha256) for sha256 in reply.get('has') or []])
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except OSError:
+            # No network or multicast: no peers
+            pass
+        span.set(peers=len(peers))
+    return list(peers.values())
+
+if __name__ == '__main__':
+    # python -m core.peers serve <carpeta del cliente> | python -m core.peers find [<sha256> ...]
+    if len(sys.argv) >= 3 and sys.argv[1] == 'serve':
+        server = start_server(os.path.abspath(sys.argv[2]))
+        if server is None:
+            print('No se pudo compartir: sin red local o puerto ocupado')
+            sys.exit(1)
+        print(f'Compartiendo {sys.argv[2]} (versión {server.content.version()}) en {server.address}:{server.port}',
+              flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.stop()
+    elif len(sys.argv) >= 2 and sys.argv[1] == 'find':
+        for peer in discover(sys.argv[2:], timeout=1.0):
+            print(f'{peer.host}:{peer.port}  versión {peer.version}  tiene {len(peer.has)}/{len(sys.argv) - 2}')
+    else:
+        print('Uso: python -m core.peers serve <carpeta del cliente> | python -m core.peers find [<sha256> ...]')
+        sys.exit(1)
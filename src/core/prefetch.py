@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+from core.paths import get_base_path, cache_dir
+from core import tracing
+
+# Game data read while the client starts: scripts, textures, meshes, sounds, maps and .dat tables
+PREFETCH_EXTENSIONS = ('.u', '.int', '.dat', '.ukx', '.usx', '.utx', '.uax', '.unr')
+# Share of the available memory the warmup may fill
+MEMORY_SHARE = 0.5
+# Used when the available memory cannot be read
+DEFAULT_BUDGET = 512 * 1024 * 1024
+READ_BLOCK = 1024 * 1024
+# Learning: how long the client is watched, how often, and how long without new files ends it
+LEARN_SECONDS = 120
+LEARN_INTERVAL = 0.1
+LEARN_QUIET = 20
+# Seconds the learner waits for the client process to appear
+FIND_TIMEOUT = 30
+
+PROFILE_NAME = 'startup_files.json'
+
+def available_memory() -> Optional[int]:
+    """Physical memory that can be used without swapping (bytes), None if unknown."""
+    if sys.platform == 'win32':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class StartupProfile:
+    """
+    The game files the client read while starting, in the order it opened
+    them, as learned by watching it (learn()). Kept in cache/startup_files.json
+    with the system version it was learned on.
+    """
+
+    def __init__(self, client_folder: str, path: Optional[str] = None):
+        self.client_folder = client_folder
+        self.path = path or os.path.join(cache_dir(), PROFILE_NAME)
+
+    def load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def save(self, files: List[str], version: Optional[str]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': version, 'learned': time.time(), 'files': files}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def stale(self, version: Optional[str]) -> bool:
+        """Whether the client should be watched again: never learned, or learned on another version."""
+        profile = self.load()
+        return not profile.get('files') or profile.get('version') != version
+
+    def files(self) -> List[str]:
+        """
+        Absolute paths to warm up, in reading order: the learned ones, or
+        before any learning, the game data of the client by extension.
+        """
+        learned = self.load().get('files', [])
+        if learned:
+            paths = [os.path.join(self.client_folder, *rel_path.split('/')) for rel_path in learned]
+            return [path for path in paths if os.path.isfile(path)]
+        found = []
+        for root, dirs, names in os.walk(self.client_folder):
+            # Launcher folders hold no game data
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in ('cache', 'downloads')]
+            found += [os.path.join(root, name) for name in names if name.lower().endswith(PREFETCH_EXTENSIONS)]
+        rank = {extension: index for index, extension in enumerate(PREFETCH_EXTENSIONS)}
+        return sorted(found, key=lambda path: (rank[os.path.splitext(path)[1].lower()], path.lower()))
+
+    def relative(self, path: str) -> Optional[str]:
+        """Client-relative '/' path of a game data file, None for anything else."""
+        try:
+            rel_path = os.path.relpath(os.path.realpath(path), os.path.realpath(self.client_folder))
+        except ValueError:
+            # Another drive
+            return None
+        if rel_path.startswith('..') or not rel_path.lower().endswith(PREFETCH_EXTENSIONS):
+            return None
+        return rel_path.replace(os.sep, '/')
+
+def _prefetch_file(path: str, budget: int, stop: threading.Event) -> int:
+    """Bring up to budget bytes of a file into the page cache; returns the bytes requested."""
+    with open(path, 'rb', buffering=0) as f:
+        size = min(os.fstat(f.fileno()).st_size, budget)
+        if hasattr(os, 'posix_fadvise'):
+            # The kernel reads ahead asynchronously; nothing is copied into this process
+            os.posix_fadvise(f.fileno(), 0, size, os.POSIX_FADV_WILLNEED)
+            return size
+        # Windows: reading the file is what fills its standby cache
+        buffer = bytearray(READ_BLOCK)
+        view = memoryview(buffer)
+        done = 0
+        while done < size and not stop.is_set():
+            read = f.readinto(view[:min(READ_BLOCK, size - done)])
+            if not read:
+                break
+            done += read
+        return done
+
+class Prefetcher:
+    """
+    Warms the OS page cache with the files the client reads at startup while
+    the launcher sits idle, so pressing Play starts the game from memory.
+    Files go in the learned reading order until MEMORY_SHARE of the available
+    memory is used.
+    """
+
+    def __init__(self, client_folder: Optional[str] = None, memory_share: float = MEMORY_SHARE):
+        self.profile = StartupProfile(client_folder or get_base_path())
+        self.memory_share = memory_share
+        self.done = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def budget(self) -> int:
+        available = available_memory()
+        return int(available * self.memory_share) if available is not None else DEFAULT_BUDGET
+
+    def run(self) -> int:
+        """Prefetch in the calling thread; returns the bytes brought in."""
+        budget = self.budget()
+        with tracing.span('prefetch', budget=budget) as span:
+            files = 0
+            for path in self.profile.files():
+                if self._stop.is_set() or budget - self.done <= 0:
+                    break
+                try:
+                    self.done += _prefetch_file(path, budget - self.done, self._stop)
+                except OSError:
+                    continue
+                files += 1
+            span.set(files=files)
+            span.add_bytes(self.done)
+        return self.done
+
+    def start(self) -> 'Prefetcher':
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        """Stop, e.g. before an update rewrites the files."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+def _open_files(pid: int) -> Optional[List[str]]:
+    """Files a process has open; None once it has exited."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil:
+        try:
+            return [f.path for f in psutil.Process(pid).open_files()]
+        except psutil.NoSuchProcess:
+            return None
+        except psutil.Error:
+            return []
+    folder = f'/proc/{pid}/fd'
+    if not os.path.isdir(folder):
+        return None
+    paths = []
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    for name in names:
+        try:
+            paths.append(os.readlink(os.path.join(folder, name)))
+        except OSError:
+            continue
+    return paths
+
+def _find_process(exe_name: str) -> Optional[int]:
+    """Pid of the running client (its executable, or a Wine command line naming it)."""
+    exe_name = exe_name.lower()
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil:
+        for process in psutil.process_iter(['pid', 'name', 'cmdline']):
+            cmdline = process.info.get('cmdline') or []
+            if (process.info.get('name') or '').lower() == exe_name \
+                    or any(os.path.basename(arg.replace('\\', '/')).lower() == exe_name for arg in cmdline[:2]):
+                return process.info['pid']
+        return None
+    if not os.path.isdir('/proc'):
+        return None
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit() or int(entry) == os.getpid():
+            continue
+        try:
+            with open(f'/proc/{entry}/cmdline', 'rb') as f:
+                args = f.read().split(b'\0')[:2]
+        except OSError:
+            continue
+        if any(os.path.basename(arg.decode('utf-8', 'replace').replace('\\', '/')).lower() == exe_name
+               for arg in args):
+            return int(entry)
+    return None
+
+def learn(pid: int, profile: StartupProfile, seconds: float = LEARN_SECONDS) -> List[str]:
+    """
+    Watch the files the client opens while it starts and return them
+    (client-relative) in the order they were first seen. Unreal packages stay
+    open once loaded, so sampling the open files misses almost nothing.
+    """
+    seen = {}
+    started = last_new = time.monotonic()
+    with tracing.span('prefetch.learn', pid=pid) as span:
+        while time.monotonic() - started < seconds:
+            opened = _open_files(pid)
+            if opened is None:
+                break
+            now = time.monotonic()
+            for path in opened:
+                rel_path = profile.relative(path)
+                if rel_path and rel_path not in seen:
+                    seen[rel_path] = now
+                    last_new = now
+            if seen and now - last_new > LEARN_QUIET:
+                break
+            time.sleep(LEARN_INTERVAL)
+        span.set(files=len(seen))
+    return list(seen)
+
+def _local_version(client_folder: str) -> Optional[str]:
+    from core.system import SystemManager
+    return SystemManager(os.path.join(client_folder, 'system')).get_local_version()
+
+def needs_learning() -> bool:
+    """Whether the startup of the installed client still has to be learned."""
+    return StartupProfile(get_base_path()).stale(_local_version(get_base_path()))
+
+def run_learner(config: Dict) -> int:
+    """
+    Entry point of the helper process started with the game (launcher
+    --learn-startup): watch the client start at low priority and save what it read.
+    """
+    from core.throttle import background_priority
+    background_priority()
+    base_path = get_base_path()
+    exe_name = config.get('StartFile', 'l2.exe')
+    deadline = time.monotonic() + FIND_TIMEOUT
+    pid = _find_process(exe_name)
+    while pid is None and time.monotonic() < deadline:
+        time.sleep(0.2)
+        pid = _find_process(exe_name)
+    if pid is None:
+        return 1
+    profile = StartupProfile(base_path)
+    files = learn(pid, profile)
+    if not files:
+        return 1
+    profile.save(files, _local_version(base_path))
+    return 0
+
+if __name__ == '__main__':
+    # python -m core.prefetch warm | learn <pid>
+    if len(sys.argv) == 2 and sys.argv[1] == 'warm':
+        prefetcher = Prefetcher()
+        started = time.perf_counter()
+        done = prefetcher.run()
+        print(f'{done / 1024 ** 2:.1f} MB en caché en {time.perf_counter() - started:.2f} s')
+    elif len(sys.argv) == 3 and sys.argv[1] == 'learn' and sys.argv[2].isdigit():
+        profile = StartupProfile(get_base_path())
+        files = learn(int(sys.argv[2]), profile)
+        profile.save(files, _local_version(get_base_path()))
+        print(f'{len(files)} archivos aprendidos en {profile.path}')
+    else:
+        print('Uso: python -m core.prefetch warm | python -m core.prefetch learn <pid>')
+        sys.exit(1)
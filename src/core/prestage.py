@@ -0,0 +1,177 @@
+import os
+import sys
+import time
+import threading
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from core.paths import get_base_path
+from core.staging import UPDATE_FOLDER
+
+# Keys of an upcoming release block that describe its window rather than its files
+WINDOW_KEYS = ('available_from', 'release_at')
+
+WINDOW_WAITING = 'waiting'
+WINDOW_OPEN = 'open'
+WINDOW_RELEASED = 'released'
+
+# Default bandwidth cap of background pre-downloads (bytes per second)
+PRESTAGE_RATE = 2 * 1024 * 1024
+
+def parse_time(value) -> Optional[float]:
+    """Epoch seconds of an ISO 8601 date ('2026-10-22T10:00:00Z', UTC when no offset) or a number."""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        moment = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def upcoming_release(system: Dict) -> Optional[Dict]:
+    """
+    The release announced in version.json under system.upcoming: a complete
+    system block (version, url, mirrors, manifest, format...) plus its window,
+    'available_from' (pre-downloads may start) and 'release_at' (it goes live).
+    """
+    upcoming = system.get('upcoming')
+    if not isinstance(upcoming, dict) or not upcoming.get('version'):
+        return None
+    return upcoming
+
+def window_state(upcoming: Dict, now: Optional[float] = None) -> str:
+    now = time.time() if now is None else now
+    available_from = parse_time(upcoming.get('available_from'))
+    release_at = parse_time(upcoming.get('release_at'))
+    if release_at is not None and now >= release_at:
+        return WINDOW_RELEASED
+    if available_from is not None and now < available_from:
+        return WINDOW_WAITING
+    return WINDOW_OPEN
+
+def release_block(upcoming: Dict) -> Dict:
+    """The upcoming release as a plain system block."""
+    return {key: value for key, value in upcoming.items() if key not in WINDOW_KEYS}
+
+class PrestageLock:
+    """
+    Exclusive lock of the pre-download, held by the launcher or by the helper
+    process. The operating system drops it if its holder dies.
+    """
+
+    def __init__(self, folder: Optional[str] = None):
+        self.folder = folder or os.path.join(get_base_path(), UPDATE_FOLDER)
+        self.path = os.path.join(self.folder, 'prestage.lock')
+        self.stop_path = os.path.join(self.folder, 'prestage.stop')
+        self._file = None
+
+    def acquire(self) -> bool:
+        """Take the lock without waiting; False if someone else holds it."""
+        os.makedirs(self.folder, exist_ok=True)
+        f = open(self.path, 'a+b')
+        try:
+            if sys.platform == 'win32':
+                import msvcrt
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if sys.platform == 'win32':
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def stop_requested(self) -> bool:
+        return os.path.exists(self.stop_path)
+
+    def stop(self, timeout: float = 15.0) -> bool:
+        """
+        Ask a running pre-download to stop and wait for it to release the lock,
+        so the caller can use the staging folder. True once nobody holds it.
+        """
+        if self.acquire():
+            self.release()
+            return True
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.stop_path, 'w'):
+            pass
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline:
+                time.sleep(0.2)
+                if self.acquire():
+                    self.release()
+                    return True
+            return False
+        finally:
+            if os.path.exists(self.stop_path):
+                os.remove(self.stop_path)
+
+def watch_stop(lock: PrestageLock, control, interval: float = 1.0) -> threading.Event:
+    """Cancel control when someone calls lock.stop(); set the returned event to end the watch."""
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(interval):
+            if lock.stop_requested():
+                control.cancel()
+                return
+
+    threading.Thread(target=watch, daemon=True).start()
+    return done
+
+def spawn_helper(mode: str = '--prestage') -> bool:
+    """
+    Start the launcher as a detached background process that exits when done:
+    --prestage pre-downloads the upcoming release, --learn-startup watches
+    the client start (core.prefetch).
+    """
+    if getattr(sys, 'frozen', False):
+        args = [sys.executable, mode]
+    else:
+        args = [sys.executable, os.path.join(get_base_path(), 'main.py'), mode]
+    options = {'cwd': get_base_path(), 'stdin': subprocess.DEVNULL, 'stdout': subprocess.DEVNULL,
+               'stderr': subprocess.DEVNULL, 'close_fds': True}
+    if sys.platform == 'win32':
+        # DETACHED_PROCESS | CREATE_NEW_PROCESS_GROUP | CREATE_NO_WINDOW
+        options['creationflags'] = 0x00000008 | 0x00000200 | 0x08000000
+    else:
+        options['start_new_session'] = True
+    try:
+        subprocess.Popen(args, **options)
+        return True
+    except OSError:
+        return False
+
+def run_helper(config: Dict) -> int:
+    """Entry point of the helper process: pre-download at low priority, then exit."""
+    from core.throttle import background_priority
+    from core.updater import Updater
+    background_priority()
+    if config.get('LanPeers', False):
+        # Other launchers of the LAN can fetch from this one while it runs
+        from core.peers import start_server
+        start_server(get_base_path(), int(config.get('LanPeersPort', 0)))
+    staged = Updater(config).prestage(print, rate_limit=float(config.get('PrestageRate', PRESTAGE_RATE)))
+    return 0 if staged else 1
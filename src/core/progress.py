@@ -0,0 +1,106 @@
+import math
+import time
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional
+from core.exceptions import UpdateCancelled
+
+# Update pipeline phases reported in ProgressEvent.phase
+PHASE_CHECK = 'check'
+PHASE_DOWNLOAD = 'download'
+PHASE_EXTRACT = 'extract'
+PHASE_INSTALL = 'install'
+PHASE_VERIFY = 'verify'
+
+@dataclass
+class ProgressEvent:
+    """A progress report from the update pipeline."""
+    phase: str
+    done: int
+    total: int
+    speed: float = 0.0  # bytes (or items) per second, smoothed
+    eta: Optional[float] = None  # seconds left at the current speed, None if unknown
+
+    @property
+    def percent(self) -> float:
+        return self.done * 100.0 / self.total if self.total else 0.0
+
+class UpdateControl:
+    """
+    Pause/cancel switch shared between the UI and the update worker.
+    Long running loops call checkpoint() between chunks.
+    """
+
+    def __init__(self):
+        self._running = threading.Event()
+        self._running.set()
+        self._cancelled = threading.Event()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wake up a paused worker so it can notice the cancellation
+        self._running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def checkpoint(self):
+        """Block while paused; raise UpdateCancelled once cancelled."""
+        if not self._running.is_set():
+            self._running.wait()
+        if self._cancelled.is_set():
+            raise UpdateCancelled('Actualización cancelada')
+
+class ProgressTracker:
+    """
+    Turns raw (done, total) counters into ProgressEvents.
+    Updates are coalesced to at most one every interval seconds, so a fast
+    download loop can report every chunk without flooding the UI. Speed is
+    an exponentially weighted moving average (time constant smoothing
+    seconds), which keeps the ETA steady on bursty connections.
+    """
+
+    def __init__(self, callback: Optional[Callable[[ProgressEvent], None]], phase: str,
+                 interval: float = 0.1, smoothing: float = 3.0):
+        self.callback = callback
+        self.phase = phase
+        self.interval = interval
+        self.smoothing = smoothing
+        self.speed = 0.0
+        self._last_emit = 0.0
+        self._last_done = None
+        self._lock = threading.Lock()
+
+    def update(self, done: int, total: int, force: bool = False):
+        if not self.callback:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._last_done is None:
+                # Bytes resumed from a previous run do not count towards the speed
+                self._last_done = done
+                self._last_emit = now
+            elif not force and now - self._last_emit < self.interval and done < total:
+                return
+            elapsed = now - self._last_emit
+            if elapsed > 0:
+                current = (done - self._last_done) / elapsed
+                # First sample seeds the average; later ones are weighted by elapsed time
+                weight = 1.0 - math.exp(-elapsed / self.smoothing) if self.speed else 1.0
+                self.speed += weight * (current - self.speed)
+            self._last_emit = now
+            self._last_done = done
+            eta = (total - done) / self.speed if self.speed > 0 and total >= done else None
+            event = ProgressEvent(self.phase, done, total, self.speed, eta)
+        self.callback(event)
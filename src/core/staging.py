@@ -0,0 +1,246 @@
+import os
+import json
+import shutil
+import time
+import threading
+from typing import Dict, List, Optional
+from core.fastzip import safe_join
+
+# Working folder of the update transactions, next to system/ so renames stay on one volume
+UPDATE_FOLDER = '.update'
+
+STATE_STAGING = 'staging'
+STATE_COMMITTING = 'committing'
+
+class StagedUpdate:
+    """
+    Applies a system update to the client folder as a transaction.
+    New and changed files are written to <client>/.update/stage/ (same layout
+    as the client) and listed in a journal with their checksums. Nothing
+    touches the live files until commit(), which:
+
+      1. hardlinks every live file about to be replaced or deleted into
+         <client>/.update/snapshot/ (the previous version, kept for rollback);
+      2. marks the journal as committing;
+      3. renames every staged file over its live path, the version file last.
+
+    An interrupted staging resumes with the files already staged; an
+    interrupted commit is rolled forward by recover(). rollback() moves the
+    snapshot back, without touching the network.
+    """
+
+    def __init__(self, client_folder: str, version_key: str, keep: List[str] = ()):
+        """
+        :param version_key: Client-relative key of the version file, committed last
+                            so a new version is only reported once all its files are in place.
+        :param keep: Keys of launcher files saved with every snapshot (index, manifest).
+        """
+        self.client_folder = client_folder
+        self.version_key = version_key
+        self.keep = [version_key] + list(keep)
+        self.folder = os.path.join(client_folder, UPDATE_FOLDER)
+        self.stage_folder = os.path.join(self.folder, 'stage')
+        self.snapshot_folder = os.path.join(self.folder, 'snapshot')
+        self.journal_path = os.path.join(self.folder, 'journal.json')
+        self.snapshot_path = os.path.join(self.folder, 'snapshot.json')
+        self.journal = None
+        self._lock = threading.Lock()
+        self._flushed = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.journal is not None
+
+    def begin(self, version: str, previous: Optional[str]) -> bool:
+        """
+        Open the transaction installing version. A staging of the same version
+        over the same previous version, left by an interrupted run or a
+        pre-download, is resumed; any other one is discarded.
+        Returns True when resuming.
+        """
+        self.recover()
+        journal = self.pending(version, previous)
+        if journal:
+            self.journal = journal
+            return True
+        shutil.rmtree(self.stage_folder, ignore_errors=True)
+        self.journal = {'version': version, 'previous': previous, 'state': STATE_STAGING,
+                        'files': {}, 'removed': []}
+        self.flush()
+        return False
+
+    def pending(self, version: str, previous: Optional[str]) -> Optional[Dict]:
+        """The journal of an uncommitted staging of version over previous, None if there is none."""
+        journal = self._load(self.journal_path)
+        if journal and journal.get('state') == STATE_STAGING and journal.get('version') == version \
+                and journal.get('previous') == previous:
+            return journal
+        return None
+
+    def stage_path(self, key: str) -> Optional[str]:
+        """Staging path of a client-relative key."""
+        return safe_join(self.stage_folder, key)
+
+    def live_path(self, key: str) -> Optional[str]:
+        return safe_join(self.client_folder, key)
+
+    def staged(self, key: str, **checksums):
+        """Record a complete staged file (e.g. crc32=... or sha256=...)."""
+        with self._lock:
+            self.journal['files'][key] = checksums
+            if key in self.journal['removed']:
+                self.journal['removed'].remove(key)
+
+    def staged_checksums(self, key: str) -> Optional[Dict]:
+        """Checksums of a file staged earlier in this transaction, None if it is not staged."""
+        with self._lock:
+            checksums = self.journal['files'].get(key) if self.journal else None
+        if checksums is None or not os.path.exists(self.stage_path(key)):
+            return None
+        return checksums
+
+    def note(self, name: str, value):
+        """Keep extra resume data in the journal (e.g. the downloaded pack)."""
+        with self._lock:
+            self.journal[name] = value
+
+    def noted(self, name: str):
+        with self._lock:
+            return self.journal.get(name) if self.journal else None
+
+    def remove(self, key: str):
+        """Delete a live file when the transaction commits."""
+        with self._lock:
+            if key not in self.journal['removed']:
+                self.journal['removed'].append(key)
+
+    def flush(self):
+        """Persist the journal, so the staged files survive a restart."""
+        with self._lock:
+            self._save(self.journal_path, self.journal)
+            self._flushed = time.monotonic()
+
+    def checkpoint(self, interval: float = 1.0):
+        """Persist the journal if it was not saved in the last interval seconds."""
+        if time.monotonic() - self._flushed >= interval:
+            self.flush()
+
+    def commit(self) -> Dict:
+        """
+        Snapshot the current files and move the staged ones into place.
+        Returns the journal: 'files' ({key: checksums} installed) and 'removed'.
+        """
+        journal = self.journal
+        if journal['state'] == STATE_STAGING:
+            self._snapshot(journal)
+            journal['state'] = STATE_COMMITTING
+            self.flush()
+        self._apply(journal)
+        self.journal = None
+        return journal
+
+    def recover(self) -> Optional[Dict]:
+        """
+        Finish a commit interrupted by a crash or power loss.
+        Returns its journal like commit(), None if there was none.
+        """
+        journal = self._load(self.journal_path)
+        if not journal or journal.get('state') != STATE_COMMITTING:
+            return None
+        self._apply(journal)
+        return journal
+
+    def close(self):
+        """Leave the transaction uncommitted; its staged files are kept for resuming."""
+        if self.journal is not None:
+            self.flush()
+            self.journal = None
+
+    def discard(self):
+        """Drop the staged files of an abandoned update."""
+        self.journal = None
+        shutil.rmtree(self.stage_folder, ignore_errors=True)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def snapshot(self) -> Optional[Dict]:
+        """The rollback snapshot ({'version', 'replaced', 'added'}), None without one."""
+        return self._load(self.snapshot_path)
+
+    def rollback(self) -> Optional[Dict]:
+        """
+        Put the snapshot of the previous version back in place.
+        Returns the snapshot description ({'version', 'replaced', 'added'}),
+        None if there is no snapshot.
+        """
+        snapshot = self._load(self.snapshot_path)
+        if not snapshot:
+            return None
+        for key in snapshot.get('added', []):
+            live = self.live_path(key)
+            if live and os.path.exists(live):
+                os.remove(live)
+        # Version file last, like a commit
+        for key in sorted(snapshot.get('replaced', []), key=lambda k: k == self.version_key):
+            saved, live = safe_join(self.snapshot_folder, key), self.live_path(key)
+            if saved and live and os.path.exists(saved):
+                os.makedirs(os.path.dirname(live), exist_ok=True)
+                os.replace(saved, live)
+        shutil.rmtree(self.snapshot_folder, ignore_errors=True)
+        os.remove(self.snapshot_path)
+        return snapshot
+
+    def _snapshot(self, journal: Dict):
+        """Hardlink the live files the commit will replace or delete."""
+        shutil.rmtree(self.snapshot_folder, ignore_errors=True)
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        replaced, added = [], []
+        keys = list(journal['files']) + journal['removed'] + self.keep
+        for key in dict.fromkeys(keys):
+            live, saved = self.live_path(key), safe_join(self.snapshot_folder, key)
+            if not live or not saved:
+                continue
+            if os.path.isfile(live):
+                os.makedirs(os.path.dirname(saved), exist_ok=True)
+                try:
+                    os.link(live, saved)
+                except OSError:
+                    # No hardlinks on this volume (e.g. FAT32): copy instead
+                    shutil.copy2(live, saved)
+                replaced.append(key)
+            elif key in journal['files']:
+                added.append(key)
+        self._save(self.snapshot_path, {'version': journal.get('previous'), 'replaced': replaced, 'added': added})
+
+    def _apply(self, journal: Dict):
+        """Rename the staged files over the live ones; safe to repeat after a crash."""
+        for key in sorted(journal['files'], key=lambda k: k == self.version_key):
+            staged, live = self.stage_path(key), self.live_path(key)
+            if staged and live and os.path.exists(staged):
+                os.makedirs(os.path.dirname(live), exist_ok=True)
+                os.replace(staged, live)
+        for key in journal['removed']:
+            live = self.live_path(key)
+            if live and os.path.exists(live):
+                os.remove(live)
+        shutil.rmtree(self.stage_folder, ignore_errors=True)
+        os.remove(self.journal_path)
+
+    @staticmethod
+    def _load(path: str) -> Optional[Dict]:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    @staticmethod
+    def _save(path: str, data: Dict):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
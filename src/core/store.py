@@ -0,0 +1,274 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+from core import tracing
+
+# Default size limit of the store (bytes); the least recently used objects go first
+STORE_SIZE = 20 * 1024 ** 3
+# Eviction stops once the store is back under this share of its limit
+EVICT_TARGET = 0.9
+# Linux ioctl cloning a file's extents (btrfs, xfs, ...)
+FICLONE = 0x40049409
+# Files the game rewrites in place (its settings): a hardlink would change
+# them in every client folder at once, so they are cloned or copied instead
+REWRITTEN_EXTENSIONS = ('.ini',)
+
+_HASH = re.compile(r'[0-9a-f]{64}')
+
+def default_folder() -> str:
+    """Machine-wide store of the current user, shared by every client folder."""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'L2Launcher', 'store')
+
+def open_store(config: Dict) -> Optional['ContentStore']:
+    """
+    The store configured by ContentStore: a folder, or true for the default
+    one (default_folder()). None when it is not enabled.
+    """
+    setting = config.get('ContentStore')
+    if not setting:
+        return None
+    folder = default_folder() if setting is True else str(setting)
+    return ContentStore(folder, int(config.get('ContentStoreSize', STORE_SIZE)))
+
+def _reflink(source: str, target: str) -> bool:
+    """Copy-on-write clone of source, where the filesystem supports it."""
+    if not sys.platform.startswith('linux'):
+        return False
+    import fcntl
+    try:
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if os.path.exists(target):
+            os.remove(target)
+        return False
+
+def can_hardlink(name: str) -> bool:
+    return not name.lower().endswith(REWRITTEN_EXTENSIONS)
+
+def place(source: str, target: str, hardlink: bool = True) -> str:
+    """
+    Make target hold the bytes of source as cheaply as the filesystem allows:
+    a reflink, a hardlink (if allowed), or a copy. Returns the method used.
+    """
+    if _reflink(source, target):
+        return 'reflink'
+    if hardlink:
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+    return 'copy'
+
+@contextmanager
+def _locked(path: str):
+    """Exclusive lock between the launchers sharing the store."""
+    with open(path, 'a+b') as f:
+        if sys.platform == 'win32':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 s
+                    continue
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if sys.platform == 'win32':
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class ContentStore:
+    """
+    Machine-wide content-addressed store shared by several client folders.
+    Objects are verified files named after their SHA-256; clients are
+    populated from them by reflink or hardlink when store and client share
+    a filesystem, by copy otherwise, so identical bytes are downloaded and
+    kept once. store.json records the size, mtime and last use of every
+    object: an object changed through a hardlink (its mtime moves) is
+    dropped, and save() evicts the least recently used ones beyond max_size.
+    """
+
+    def __init__(self, folder: str, max_size: int = STORE_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self.index_path = os.path.join(folder, 'store.json')
+        self.lock_path = os.path.join(folder, 'store.lock')
+        self.entries = None
+        # Objects added or used by this process since the last save()
+        self._touched = {}
+        self._lock = threading.Lock()
+
+    def path(self, sha256: str) -> Optional[str]:
+        sha256 = sha256.lower()
+        if not _HASH.fullmatch(sha256):
+            return None
+        return os.path.join(self.folder, sha256[:2], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return self._valid(sha256) is not None
+
+    def add(self, source: str, sha256: str, hardlink: bool = True) -> bool:
+        """
+        Store a file already verified to hash to sha256 (the file itself is left in place).
+        :param hardlink: Whether the object may share the file's inode (see can_hardlink).
+        """
+        path = self.path(sha256)
+        if path is None:
+            return False
+        if self._valid(sha256):
+            self._touch(sha256, path)
+            return True
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            place(source, tmp_path, hardlink)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+        self._touch(sha256, path)
+        return True
+
+    def materialize(self, sha256: str, target: str, hardlink: bool = True) -> bool:
+        """Write the object sha256 to target (reflink, hardlink or copy); False if it is not stored."""
+        path = self._valid(sha256)
+        if path is None:
+            return False
+        try:
+            if os.path.exists(target):
+                os.remove(target)
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            with tracing.span('store.materialize') as span:
+                span.set(method=place(path, target, hardlink))
+        except OSError:
+            return False
+        self._touch(sha256, path)
+        return True
+
+    def save(self):
+        """Merge this process's use of the store into store.json and evict beyond max_size."""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with _locked(self.lock_path):
+                entries = self._read()
+                for sha256, record in touched.items():
+                    previous = entries.get(sha256)
+                    if previous is None or previous.get('used', 0) < record['used']:
+                        entries[sha256] = record
+                self._evict(entries)
+                tmp_path = self.index_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.index_path)
+                self.entries = entries
+        except OSError:
+            pass
+
+    def _read(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _record(self, sha256: str) -> Optional[Dict]:
+        with self._lock:
+            if sha256 in self._touched:
+                return self._touched[sha256]
+            if self.entries is None:
+                self.entries = self._read()
+            return self.entries.get(sha256)
+
+    def _valid(self, sha256: str) -> Optional[str]:
+        """Path of an intact object, None if it is missing or was modified after it was stored."""
+        path = self.path(sha256)
+        record = self._record(sha256.lower()) if path else None
+        if record is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not self._matches(stat, record) and not self._recheck(sha256.lower(), path):
+            return None
+        return path
+
+    @staticmethod
+    def _matches(stat: os.stat_result, record: Dict) -> bool:
+        return stat.st_size == record.get('size') and stat.st_mtime_ns == record.get('mtime')
+
+    def _recheck(self, sha256: str, path: str) -> bool:
+        """
+        Check an object against the record in store.json, which another
+        launcher may have rewritten since it was read (the object evicted and
+        stored again). Only an object that disagrees with it too is removed.
+        """
+        try:
+            with _locked(self.lock_path):
+                entries = self._read()
+                record = entries.get(sha256)
+                if record is not None and self._matches(os.stat(path), record):
+                    with self._lock:
+                        self.entries = entries
+                        if sha256 in self._touched:
+                            self._touched[sha256] = dict(record, used=self._touched[sha256]['used'])
+                    return True
+                if record is not None:
+                    # Written in place through a hardlinked copy: no longer what its name says
+                    os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    def _touch(self, sha256: str, path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self._touched[sha256.lower()] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'used': time.time()}
+
+    def _evict(self, entries: Dict[str, Dict]):
+        """Drop records of vanished objects, then the least recently used beyond max_size."""
+        for sha256 in [sha256 for sha256 in entries if not os.path.exists(self.path(sha256) or '')]:
+            del entries[sha256]
+        total = sum(record.get('size', 0) for record in entries.values())
+        if total <= self.max_size:
+            return
+        with tracing.span('store.evict') as span:
+            evicted = 0
+            for sha256 in sorted(entries, key=lambda key: entries[key].get('used', 0)):
+                if total <= self.max_size * EVICT_TARGET:
+                    break
+                try:
+                    os.remove(self.path(sha256))
+                except OSError:
+                    continue
+                total -= entries.pop(sha256).get('size', 0)
+                evicted += 1
+            span.set(evicted=evicted)
@@ -1,12 +1,44 @@
 import os
+import json
+import queue
 import shutil
+import hashlib
 import zipfile
-from typing import Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from core.exceptions import UpdateCancelled
+from core.progress import UpdateControl
+from core.zipstream import StreamingZipExtractor
+from core.fastzip import extract_parallel, safe_join
+from core import pack
+from core.file_index import FileIndex
+from core.staging import StagedUpdate
+from core import tracing
+
+# Files managed by the launcher itself; never listed in a manifest nor deleted by it
+PROTECTED_FILES = ('system_version.txt', 'system_manifest.json', 'system_index.json', 'settings.ini')
+
+def hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
 
 class SystemManager:
     def __init__(self, system_folder: str):
         self.system_folder = system_folder
         self.version_file = os.path.join(system_folder, 'system_version.txt')
+        self.manifest_file = os.path.join(system_folder, 'system_manifest.json')
+        # System archives are laid out relative to the client folder (system/, Textures/, ...)
+        self.client_folder = os.path.dirname(os.path.abspath(system_folder))
+        # Cached size/mtime/checksums of client files, so unchanged files are not re-read
+        self.index = FileIndex(os.path.join(system_folder, 'system_index.json'), self.client_folder)
+        # Updates are staged next to the client and committed at once (see begin_update)
+        self.staging = StagedUpdate(self.client_folder, self.index.key(self.version_file),
+                                    keep=[self.index.key(self.manifest_file), self.index.key(self.index.path)])
 
     def get_local_version(self) -> Optional[str]:
         """Get the local system version, handling potential encoding issues."""
@@ -29,39 +61,534 @@ class SystemManager:
         except Exception as e:
             return False
 
-    def extract_system(self, zip_path: str, password: Optional[bytes] = None) -> bool:
+    def extract_system(self, zip_path: str, password: Optional[bytes] = None,
+                       progress: Optional[Callable[[int, int], None]] = None,
+                       control: Optional[UpdateControl] = None,
+                       workers: Optional[int] = None) -> bool:
         """
-        Extracts system files from a zip archive non-destructively.
-        It overwrites existing files and adds new ones.
+        Extracts system files from a zip archive or an l2pack non-destructively.
+        It overwrites existing files and adds new ones. Entries whose CRC32
+        and size already match the file on disk are skipped; the rest are
+        extracted in parallel across cores. Inside an update transaction the
+        files are staged (entries staged by an interrupted run are kept).
+        :param progress: Optional callable receiving (bytes_extracted, total_bytes).
+        :param control: Optional UpdateControl checked while extracting (pause/cancel).
         """
-        if not os.path.exists(zip_path) or not zipfile.is_zipfile(zip_path):
+        if not os.path.exists(zip_path):
+            return False
+        is_pack = pack.is_pack(zip_path)
+        if not is_pack and not zipfile.is_zipfile(zip_path):
             return False
 
         os.makedirs(self.system_folder, exist_ok=True)
 
         try:
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                # Check for password protection
-                if password:
-                    try:
-                        zip_ref.extractall(pwd=password)
-                    except RuntimeError as e:
-                        if 'bad password' in str(e).lower():
-                            return False
-                        raise
+            with tracing.span('extract', archive=os.path.basename(zip_path)) as span:
+                if is_pack:
+                    with pack.PackReader(zip_path) as reader:
+                        members = reader.infolist()
+                else:
+                    with zipfile.ZipFile(zip_path) as zip_ref:
+                        members = zip_ref.infolist()
+                with tracing.span('extract.compare', entries=len(members)):
+                    changed = self._changed_members(members, workers)
+                root = self.staging.stage_folder if self.staging.active else self.client_folder
+                if is_pack:
+                    extracted = pack.extract_parallel(zip_path, root, workers, progress, control, only=changed)
                 else:
-                    zip_ref.extractall(path=self.system_folder)
-            
+                    extracted = extract_parallel(zip_path, root, password, workers, progress, control, only=changed)
+                span.set(entries=len(extracted), skipped=len(members) - len(extracted))
+                span.add_bytes(sum(info.file_size for info in extracted))
+                for info in extracted:
+                    target = self.member_path(info.filename)
+                    if target and not info.is_dir():
+                        self._written(target, crc32=info.CRC)
+                self._save_written()
             return True
+        except UpdateCancelled:
+            raise
         except Exception as e:
             return False
 
+    def _changed_members(self, members: List[zipfile.ZipInfo], workers: Optional[int] = None) -> Set[str]:
+        """
+        Names of the archive entries that differ from the files on disk.
+        Sizes are compared first; CRCs come from the index when the file is
+        unchanged since it was recorded, and are computed (in parallel) otherwise.
+        """
+        def differs(info: zipfile.ZipInfo) -> bool:
+            if info.is_dir():
+                return True
+            target = self.member_path(info.filename)
+            if target is None:
+                return False
+            try:
+                if os.path.getsize(target) != info.file_size:
+                    return not self._staged_matches(target, info.file_size, crc32=info.CRC)
+            except OSError:
+                return not self._staged_matches(target, info.file_size, crc32=info.CRC)
+            if self.index.crc32(target) != info.CRC:
+                return not self._staged_matches(target, info.file_size, crc32=info.CRC)
+            self.index.record(target, crc32=info.CRC)
+            return False
+
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            flags = list(pool.map(differs, members))
+        return {info.filename for info, changed in zip(members, flags) if changed}
+
+    def verify(self, full: bool = False, workers: Optional[int] = None, limiter=None,
+               progress: Optional[Callable[[int, int], None]] = None,
+               control: Optional[UpdateControl] = None) -> List[str]:
+        """
+        Checks the client files the launcher installed against their known-good state.
+        References are the applied manifest (sha256) and the index (checksums
+        recorded when the files were written). Files whose size and mtime still
+        match the index are trusted; only the others are re-hashed, in parallel
+        (hashlib and zlib release the GIL, so every core is used).
+        :param full: Re-hash every file, ignoring the index.
+        :param limiter: Optional RateLimiter capping the bytes read per second.
+        :param progress: Optional callable receiving (bytes_checked, total_bytes).
+        Returns the index keys (client-relative paths) of missing or damaged files.
+        """
+        references = self._references()
+        total = sum(ref.get('size', 0) for _, ref in references.values())
+        done = [0]
+        lock = threading.Lock()
+
+        def check(item: Tuple[str, Tuple[str, Dict]]) -> bool:
+            key, (path, ref) = item
+            if control:
+                control.checkpoint()
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return False
+            try:
+                if stat.st_size != ref.get('size', stat.st_size):
+                    return False
+                record = None if full else self.index.lookup(path, stat)
+                if record and any(record.get(alg) == ref[alg] for alg in ('sha256', 'crc32') if alg in ref):
+                    return True
+                algorithm = 'sha256' if 'sha256' in ref else 'crc32'
+                if self.index.checksum(path, algorithm, limiter, cached=False, control=control) != ref[algorithm]:
+                    return False
+                self.index.record(path, **{algorithm: ref[algorithm]})
+                return True
+            finally:
+                with lock:
+                    done[0] += ref.get('size', 0)
+                    if progress:
+                        progress(done[0], total)
+
+        items = sorted(references.items())
+        with tracing.span('verify', files=len(items), full=full) as span:
+            with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+                results = list(pool.map(check, items))
+            if items:
+                self.index.save()
+            broken = [key for (key, _), ok in zip(items, results) if not ok]
+            span.set(broken=len(broken))
+        return broken
+
+    def _references(self) -> Dict[str, Tuple[str, Dict]]:
+        """Index key -> (path, {'size', 'sha256'/'crc32'}) of every file with a known-good state."""
+        references = {}
+        for key, record in list(self.index.load().items()):
+            path = self.member_path(key)
+            if path and ('sha256' in record or 'crc32' in record):
+                references[key] = (path, {k: v for k, v in record.items() if k != 'mtime'})
+        for entry in (self.load_manifest() or {}).get('files', []):
+            path = self.local_path(entry.get('path', ''))
+            if path is None or os.path.basename(path) in PROTECTED_FILES:
+                continue
+            try:
+                references[self.index.key(path)] = (path, {'size': int(entry.get('size', -1)),
+                                                           'sha256': entry.get('sha256', '').lower()})
+            except ValueError:
+                continue
+        return references
+
+    def extract_stream(self, chunks: Iterable[bytes], password: Optional[bytes] = None,
+                       control: Optional[UpdateControl] = None) -> bool:
+        """
+        Extracts a system archive while it is still being downloaded.
+        The chunks are parsed and inflated on a separate thread, so the
+        network and the disk work at the same time and the archive itself
+        is never stored. The central directory is verified at the end.
+        """
+        with tracing.span('extract_stream') as span:
+            extracted = self._extract_stream(chunks, password, control)
+            if extracted is None:
+                return False
+            span.set(entries=len(extracted))
+            span.add_bytes(sum(size for _, size in extracted.values()))
+        for name, (crc, size) in extracted.items():
+            target = self.member_path(name)
+            if target:
+                self._written(target, crc32=crc)
+        self._save_written()
+        return True
+
+    def _extract_stream(self, chunks: Iterable[bytes], password: Optional[bytes],
+                        control: Optional[UpdateControl]) -> Optional[Dict[str, Tuple[int, int]]]:
+        """Feeds the chunks to a StreamingZipExtractor; returns name -> (crc, size) or None on failure."""
+        os.makedirs(self.system_folder, exist_ok=True)
+        extractor = StreamingZipExtractor(self._destination, password)
+        pending = queue.Queue(maxsize=64)
+        failure = []
+
+        def consume():
+            try:
+                while True:
+                    data = pending.get()
+                    if data is None:
+                        return
+                    extractor.feed(data)
+            except Exception as e:
+                failure.append(e)
+                # Keep draining so the producer never blocks on a full queue
+                while pending.get() is not None:
+                    pass
+
+        worker = threading.Thread(target=consume, daemon=True)
+        worker.start()
+        try:
+            for data in chunks:
+                if control:
+                    control.checkpoint()
+                if failure:
+                    break
+                pending.put(data)
+        except BaseException:
+            pending.put(None)
+            worker.join()
+            extractor.abort()
+            raise
+        pending.put(None)
+        worker.join()
+
+        if failure:
+            extractor.abort()
+            return None
+        try:
+            return extractor.close()
+        except Exception as e:
+            return None
+
     def set_version(self, version: str) -> bool:
         """Set the system version in the version file"""
         try:
-            os.makedirs(self.system_folder, exist_ok=True)
-            with open(self.version_file, 'w', encoding='utf-8') as f:
-                f.write(version)
+            with tracing.span('set_version', version=version):
+                os.makedirs(self.system_folder, exist_ok=True)
+                # Replaced, not rewritten: a rollback snapshot may hardlink the old file
+                tmp_path = self.version_file + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(version)
+                os.replace(tmp_path, self.version_file)
             return True
         except Exception as e:
-            return False
\ No newline at end of file
+            return False
+
+    def begin_update(self, version: str) -> bool:
+        """
+        Start staging the update to version: until commit_update() every
+        extraction, installed file, deletion and manifest goes to the staging
+        folder instead of the live client. Returns True when resuming the
+        staging of an interrupted run.
+        """
+        return self.staging.begin(version, self.get_local_version())
+
+    def commit_update(self, version: str) -> bool:
+        """
+        Apply the staged update: the files it replaces are kept as a hardlinked
+        snapshot, then the staged files are renamed into place and the
+        version file written last.
+        """
+        try:
+            with tracing.span('commit', version=version) as span:
+                key = self.staging.version_key
+                path = self.staging.stage_path(key)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(version)
+                self.staging.staged(key)
+                self.index.save()
+                journal = self.staging.commit()
+                self._installed(journal)
+                span.set(files=len(journal['files']), removed=len(journal['removed']))
+            return True
+        except Exception as e:
+            return False
+
+    def mark_prestaged(self):
+        """Record that the open staging is complete and only waits for its release time."""
+        self.staging.note('prestaged', True)
+        self.staging.flush()
+
+    def prestaged(self, version: str) -> bool:
+        """Whether version was completely staged ahead of time over the installed version."""
+        journal = self.staging.pending(version, self.get_local_version())
+        return bool(journal and journal.get('prestaged'))
+
+    def end_update(self):
+        """Stop staging without committing (failed or cancelled update); the next run resumes it."""
+        try:
+            self.staging.close()
+        except OSError:
+            self.staging.journal = None
+
+    def discard_update(self):
+        """Drop the staging of an update whose download did not verify; the next run starts it over."""
+        self.staging.discard()
+
+    def recover_update(self) -> bool:
+        """Finish a commit interrupted by a crash; True if there was one."""
+        try:
+            journal = self.staging.recover()
+        except OSError:
+            return False
+        if journal is None:
+            return False
+        self._installed(journal)
+        return True
+
+    def has_snapshot(self) -> bool:
+        """Whether the files of the previous version are kept for rollback()"""
+        return self.staging.snapshot() is not None
+
+    def rollback(self) -> Optional[str]:
+        """
+        Restore the previous version from its snapshot, without downloading anything.
+        Returns the restored version ('' if there was none), None without a snapshot.
+        """
+        try:
+            with tracing.span('rollback') as span:
+                snapshot = self.staging.rollback()
+                if snapshot is None:
+                    return None
+                # The snapshot brought back the index of the restored files
+                self.index.entries = None
+                for key in snapshot.get('added', []):
+                    self._prune(self.member_path(key))
+                span.set(version=snapshot.get('version'), files=len(snapshot.get('replaced', [])))
+            return snapshot.get('version') or ''
+        except OSError:
+            return None
+
+    def stage_pack(self, path: str):
+        """Remember the downloaded pack being applied, so an interrupted run does not fetch it again."""
+        stat = os.stat(path)
+        self.staging.note('pack', {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns})
+        self.staging.flush()
+
+    def staged_pack(self, path: str) -> bool:
+        """Whether path is the complete pack of the update being resumed."""
+        noted = self.staging.noted('pack')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return bool(noted) and noted.get('path') == os.path.abspath(path) and \
+            noted.get('size') == stat.st_size and noted.get('mtime') == stat.st_mtime_ns
+
+    def staged_file(self, rel_path: str, entry: Dict) -> bool:
+        """Whether a manifest entry was already staged intact by an interrupted run."""
+        target = self.local_path(rel_path)
+        try:
+            return bool(target) and self._staged_matches(target, int(entry.get('size', -1)),
+                                                         sha256=entry.get('sha256', '').lower())
+        except ValueError:
+            return False
+
+    def _staged_matches(self, target: str, size: int, **checksums) -> bool:
+        """Whether the staged copy of target has the given size and checksum (journaled or re-read)."""
+        if not self.staging.active:
+            return False
+        key = self.index.key(target)
+        path = self.staging.stage_path(key)
+        try:
+            if not path or os.path.getsize(path) != size:
+                return False
+        except OSError:
+            return False
+        known = self.staging.staged_checksums(key) or {}
+        if all(known.get(alg) == value for alg, value in checksums.items()):
+            return True
+        # Staged before the journal was last saved: check its content
+        algorithm, value = next(iter(checksums.items()))
+        if self.index.checksum(path, algorithm, cached=False) != value:
+            return False
+        self.staging.staged(key, **checksums)
+        return True
+
+    def _destination(self, name: str) -> Optional[str]:
+        """Where an archive member is written: its staging path inside a transaction."""
+        target = self.member_path(name)
+        if target is None or not self.staging.active:
+            return target
+        return self.staging.stage_path(self.index.key(target))
+
+    def _written(self, target: str, **checksums):
+        """Record a file just written for target: journaled when staged, indexed when live."""
+        if self.staging.active:
+            self.staging.staged(self.index.key(target), **checksums)
+        else:
+            self.index.record(target, **checksums)
+
+    def _save_written(self):
+        if self.staging.active:
+            self.staging.flush()
+        else:
+            self.index.save()
+
+    def _installed(self, journal: Dict):
+        """Index the files a commit put in place and forget the ones it deleted."""
+        for key, checksums in journal['files'].items():
+            target = self.member_path(key)
+            if target and checksums:
+                self.index.record(target, **checksums)
+        for key in journal['removed']:
+            target = self.member_path(key)
+            if target:
+                self.index.forget(target)
+                self._prune(target)
+        self.index.save()
+
+    def _prune(self, path: Optional[str]):
+        """Remove the empty folders left above a deleted file, up to the system folder."""
+        if not path:
+            return
+        parent = os.path.dirname(path)
+        try:
+            while os.path.normcase(parent) != os.path.normcase(self.system_folder) and \
+                    parent.startswith(self.client_folder + os.sep) and not os.listdir(parent):
+                os.rmdir(parent)
+                parent = os.path.dirname(parent)
+        except OSError:
+            pass
+
+    def local_path(self, rel_path: str) -> Optional[str]:
+        """
+        Maps a manifest path (always '/' separated) to a path inside the system folder.
+        Returns None for absolute paths or paths escaping the system folder.
+        """
+        return safe_join(self.system_folder, rel_path)
+
+    def member_path(self, name: str) -> Optional[str]:
+        """Maps a system archive member name to its path inside the client folder."""
+        return safe_join(self.client_folder, name)
+
+    def load_manifest(self) -> Optional[Dict]:
+        """Load the manifest of the last applied delta update, if any."""
+        if not os.path.exists(self.manifest_file):
+            return None
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def save_manifest(self, manifest: Dict) -> bool:
+        """Persist the applied manifest so the next update knows which files it owns."""
+        try:
+            path = self.manifest_file
+            if self.staging.active:
+                path = self.staging.stage_path(self.index.key(path))
+                self.staging.staged(self.index.key(self.manifest_file))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, path)
+            return True
+        except Exception as e:
+            return False
+
+    def diff_manifest(self, manifest: Dict) -> Tuple[List[Dict], List[str]]:
+        """
+        Compares a remote manifest against the local system folder.
+        Returns (entries to download, paths to delete). Only files listed by the
+        previously applied manifest are ever deleted, so user files such as
+        settings or screenshots are left alone.
+        """
+        changed = []
+        remote_paths = set()
+        for entry in manifest.get('files', []):
+            rel_path = entry.get('path', '')
+            local = self.local_path(rel_path)
+            if local is None or os.path.basename(local) in PROTECTED_FILES:
+                continue
+            remote_paths.add(rel_path)
+            if not self._matches(local, entry):
+                changed.append(entry)
+
+        removed = []
+        previous = self.load_manifest() or {}
+        for entry in previous.get('files', []):
+            rel_path = entry.get('path', '')
+            if rel_path not in remote_paths and self.local_path(rel_path):
+                removed.append(rel_path)
+        return changed, removed
+
+    def _matches(self, local: str, entry: Dict) -> bool:
+        """Check whether a local file matches a manifest entry (size first, then hash)."""
+        try:
+            if os.path.getsize(local) != int(entry.get('size', -1)):
+                return False
+            expected = entry.get('sha256', '').lower()
+            if self.index.sha256(local) != expected:
+                return False
+            self.index.record(local, sha256=expected)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def install_file(self, rel_path: str, source_path: str, sha256: Optional[str] = None) -> bool:
+        """
+        Move a downloaded file into place, replacing the current one.
+        :param sha256: Verified hash of the file, recorded in the index.
+        """
+        target = self.local_path(rel_path)
+        if target is None:
+            return False
+        try:
+            destination = self.staging.stage_path(self.index.key(target)) if self.staging.active else target
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            try:
+                os.replace(source_path, destination)
+            except OSError:
+                # Source on another drive: fall back to a copy
+                shutil.move(source_path, destination)
+            if self.staging.active:
+                self.staging.staged(self.index.key(target), **({'sha256': sha256.lower()} if sha256 else {}))
+                self.staging.checkpoint()
+            elif sha256:
+                self.index.record(target, sha256=sha256.lower())
+            return True
+        except Exception as e:
+            return False
+
+    def delete_files(self, rel_paths: List[str]) -> bool:
+        """
+        Delete files no longer listed by the manifest, pruning empty folders.
+        Inside an update transaction they are deleted when it commits.
+        """
+        ok = True
+        for rel_path in rel_paths:
+            target = self.local_path(rel_path)
+            if target is None or not os.path.exists(target):
+                continue
+            if self.staging.active:
+                self.staging.remove(self.index.key(target))
+                continue
+            try:
+                os.remove(target)
+                self.index.forget(target)
+                self._prune(target)
+            except OSError:
+                ok = False
+        if self.staging.active:
+            self.staging.flush()
+        else:
+            self.index.save()
+        return ok
@@ -0,0 +1,68 @@
+import os
+import sys
+import subprocess
+import time
+import threading
+from typing import Optional
+
+class RateLimiter:
+    """
+    Token bucket shared by several threads to cap throughput (bytes per second).
+    consume() blocks until the bytes fit in the budget.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else max(rate, 64 * 1024))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int):
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+class ThrottledReader:
+    """Read-only file wrapper consuming a RateLimiter for every read, e.g. around a response body."""
+
+    def __init__(self, raw, limiter: RateLimiter):
+        self.raw = raw
+        self.limiter = limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.limiter.consume(len(data))
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+def background_priority():
+    """
+    Lower the CPU and I/O priority of the current process, so background work
+    does not compete with the game. Best effort: unsupported platforms are left as they are.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        # PROCESS_MODE_BACKGROUND_BEGIN: low CPU, I/O and memory priority
+        ctypes.windll.kernel32.SetPriorityClass(ctypes.windll.kernel32.GetCurrentProcess(), 0x00100000)
+        return
+    try:
+        os.nice(10)
+    except OSError:
+        pass
+    if sys.platform.startswith('linux'):
+        try:
+            # ionice -c 3 (idle I/O class) for this process
+            subprocess.run(['ionice', '-c', '3', '-p', str(os.getpid())], check=False,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            pass
@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import threading
+from typing import Optional
+
+# Trace files rotate once they reach this size; older ones are kept as .1, .2, ...
+MAX_BYTES = 5 * 1024 * 1024
+BACKUPS = 3
+
+_writer = None
+
+class _TraceWriter:
+    """
+    Appends Chrome trace events ('X' complete events) to a file, one per line.
+    The file is a JSON array without its closing bracket, which
+    chrome://tracing and Perfetto accept as is; every line after the first
+    is also a standalone JSON object followed by a comma.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Every session starts a new file
+        self._rotate()
+        self._file = open(path, 'w', encoding='utf-8')
+        self._file.write('[\n')
+        self._file.flush()
+
+    def write(self, event: dict):
+        line = json.dumps(event, ensure_ascii=False) + ',\n'
+        with self._lock:
+            if self._file.tell() + len(line) > self.max_bytes:
+                self._file.close()
+                self._rotate()
+                self._file = open(self.path, 'w', encoding='utf-8')
+                self._file.write('[\n')
+            self._file.write(line)
+            self._file.flush()
+
+    def _rotate(self):
+        if not os.path.exists(self.path):
+            return
+        base, ext = os.path.splitext(self.path)
+        for index in range(self.backups - 1, 0, -1):
+            older = f'{base}.{index}{ext}'
+            if os.path.exists(older):
+                os.replace(older, f'{base}.{index + 1}{ext}')
+        if self.backups > 0:
+            os.replace(self.path, f'{base}.1{ext}')
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class Span:
+    """
+    A timed section of the pipeline. Spans opened inside another span on the
+    same thread show up nested in the trace viewer.
+    """
+    __slots__ = ('name', 'args', '_start', '_bytes')
+
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+        self._bytes = 0
+
+    def add_bytes(self, count: int):
+        """Count bytes processed by this span; reported with the throughput."""
+        self._bytes += count
+
+    def set(self, **args):
+        self.args.update(args)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        writer = _writer
+        if writer is None:
+            return False
+        duration = end - self._start
+        args = self.args
+        if self._bytes:
+            args['bytes'] = self._bytes
+            args['mb_per_s'] = round(self._bytes / (1024 * 1024) / duration, 2) if duration > 0 else None
+        if exc_type is not None:
+            args['error'] = exc_type.__name__
+        writer.write({'name': self.name, 'ph': 'X', 'ts': int(self._start * 1e6), 'dur': int(duration * 1e6),
+                      'pid': writer.pid, 'tid': threading.get_ident(), 'args': args})
+        return False
+
+class _NullSpan:
+    """Returned while tracing is disabled: every method is a no-op."""
+    __slots__ = ()
+
+    def add_bytes(self, count: int):
+        pass
+
+    def set(self, **args):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def configure(path: Optional[str], max_bytes: int = MAX_BYTES, backups: int = BACKUPS):
+    """Start writing spans to path (None disables tracing)."""
+    global _writer
+    previous, _writer = _writer, None
+    if previous:
+        previous.close()
+    if path:
+        _writer = _TraceWriter(path, max_bytes, backups)
+
+def enabled() -> bool:
+    return _writer is not None
+
+def span(name: str, **args):
+    """
+    Context manager timing a pipeline phase:
+
+        with tracing.span('download', url=url) as s:
+            s.add_bytes(len(chunk))
+
+    Costs a global lookup when tracing is disabled.
+    """
+    if _writer is None:
+        return _NULL_SPAN
+    return Span(name, args)
@@ -4,46 +4,141 @@ import shutil
 import zipfile
 import os
 import sys
-from typing import Dict, Optional, Callable
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urljoin, quote
+from typing import TYPE_CHECKING, Dict, List, Optional, Callable
+from core.paths import get_base_path
 from core.system import SystemManager
-from PyQt5 import QtWidgets
-
-def get_base_path():
-    """Get the base path for the application."""
-    if getattr(sys, 'frozen', False):
-        # Running as compiled executable
-        return os.path.dirname(sys.executable)
-    else:
-        # Running as a script
-        return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
- 
+from core.downloader import Downloader
+from core.mega import MegaDownloader, MEGA_API_URL
+from core.mirrors import mirror_urls
+from core.http import get_cache, get_session
+from core.fastzip import extract_member
+from core.throttle import RateLimiter, ThrottledReader
+from core.prestage import (PrestageLock, upcoming_release, window_state, release_block, watch_stop,
+                           WINDOW_OPEN, WINDOW_RELEASED)
+from core import tracing
+from core.exceptions import DownloadError, DigestError, UpdateCancelled
+from core.digest import Digest
+from core.patch import apply_patch
+from core.store import open_store, can_hardlink
+from core.chunks import ChunkSource
+from core.pack import PackReader
+from core.crypto import AesCtr, pack_key
+from core.progress import (ProgressEvent, ProgressTracker, UpdateControl, PHASE_DOWNLOAD, PHASE_EXTRACT,
+                           PHASE_VERIFY)
+
+if TYPE_CHECKING:
+    from core.peers import Peer
+
+# Password of the published system packs (ZipCrypto, or the AES key of 'zip+aes' packs)
+SYSTEM_PASSWORD = b'12345'
+# Pack formats version.json can advertise in system.format
+FORMAT_ZIP = 'zip'
+FORMAT_ZIP_AES = 'zip+aes'
+# Indexed pack with per-entry zstd/lzma compression (core.pack)
+FORMAT_L2PACK = 'l2pack'
+# Exit status of the headless updater (python -m core.updater)
+EXIT_OK = 0
+EXIT_FAILED = 1
+# check: an update of the game files (or of the launcher) is pending
+EXIT_OUTDATED = 3
+
 class Updater:
     def __init__(self, config: Dict):
         self.config = config
         self.status = None
+        self.progress = None
+        self.control = None
+        # Set when a new launcher was downloaded: {'path': ..., 'script': ...}.
+        # The UI thread shows it (dev mode) or runs the replace script and quits.
+        self.launcher_update = None
         base_path = get_base_path()
         system_path = os.path.join(base_path, 'system')
         self.system_manager = SystemManager(system_path)
+        # Partial downloads live here so a restarted launcher can resume them
+        self.download_dir = os.path.join(base_path, 'downloads')
+        # MirrorStallTimeout: seconds without data before a mirror is abandoned mid-download
+        self.downloader = Downloader(connections=int(config.get('DownloadConnections', 4)),
+                                     stall_timeout=int(config.get('MirrorStallTimeout', 10)))
+        # mega.nz links: decrypted and MAC-checked while downloading
+        self.mega = MegaDownloader(connections=int(config.get('DownloadConnections', 4)),
+                                   api_url=config.get('MegaApiUrl', MEGA_API_URL))
+        # Pre-downloading an upcoming release: stage it but do not apply it (see prestage())
+        self.prestaging = False
+        self.limiter = None
+        # Upcoming release open for pre-download, found by the last check_updates
+        self.upcoming = None
+        # LAN peers holding the files of the version being installed (see _lan_peers)
+        self.peers = []
+        # Optional machine-wide store of verified files shared by several client folders
+        self.store = open_store(config)
         
         # Debug: Print paths
         if self.status:
             self.status(f'Ruta base: {base_path}')
             self.status(f'Ruta del sistema: {system_path}')
 
-    def check_updates(self, status_callback: callable) -> bool:
+    def check_updates(self, status_callback: callable, progress_callback: Optional[Callable] = None,
+                      control: Optional[UpdateControl] = None, launcher: bool = True) -> bool:
         """
         Check for launcher and system updates.
+        :param progress_callback: Optional callable receiving ProgressEvent objects.
+        :param control: Optional UpdateControl used to pause or cancel the update.
+        :param launcher: Whether a new launcher is downloaded first (see launcher_update);
+                         the headless updater only keeps the game files up to date.
         Returns True if an update was performed, False otherwise.
         """
         self.status = status_callback
+        self.progress = progress_callback
+        self.control = control
+        with tracing.span('check_updates'):
+            return self._check_updates(launcher)
+
+    def check(self, status_callback: callable) -> Optional[Dict]:
+        """
+        Compare the installed versions with version.json without changing anything.
+        Returns {'launcher': {...}, 'system': {...}, 'upcoming': version or None},
+        where launcher and system hold the 'local' and 'remote' versions and
+        whether an 'update' is pending; None if version.json could not be fetched.
+        """
+        self.status = status_callback
+        with tracing.span('check'):
+            version_data = self._fetch_version_data()
+        if not version_data:
+            return None
+        system = self._system_block(version_data)
+        local_version = self.system_manager.get_local_version()
+        remote_version = system.get('version', '')
+        upcoming = self._pending_release(version_data)
+        return {
+            'launcher': {'local': self.config.get('LauncherVersion', ''),
+                         'remote': version_data.get('launcher', {}).get('version', ''),
+                         'update': self._launcher_outdated(version_data)},
+            'system': {'local': local_version, 'remote': remote_version,
+                       'update': bool(remote_version and remote_version != local_version
+                                      and (mirror_urls(system) or system.get('manifest'))),
+                       'prestaged': bool(remote_version) and self.system_manager.prestaged(remote_version)},
+            'upcoming': upcoming['version'] if upcoming else None,
+        }
+
+    def _check_updates(self, launcher: bool = True) -> bool:
         try:
+            # A background pre-download must leave the staging folder to us
+            PrestageLock().stop()
+            if self.system_manager.recover_update():
+                self.status('Se completó una actualización interrumpida.')
             version_data = self._fetch_version_data()
             if not version_data:
                 self.status('No se pudo verificar la versión remota.')
                 return False
+            self.upcoming = self._pending_release(version_data)
 
             # Check launcher update
-            if self._check_launcher_update(version_data):
+            if launcher and self._check_launcher_update(version_data):
                 return True  # Update was performed
 
             # Check system update
@@ -54,77 +149,364 @@ class Updater:
             self.status('El cliente está actualizado.')
             return False
 
+        except UpdateCancelled:
+            self.status('Actualización cancelada.')
+            return False
         except Exception as e:
             self.status(f'Error al comprobar actualizaciones: {str(e)}')
             return False
 
+    def verify_files(self, status_callback: callable, progress_callback: Optional[Callable] = None,
+                     control: Optional[UpdateControl] = None, repair: bool = True, full: bool = False,
+                     rate_limit: Optional[float] = None) -> Optional[List[str]]:
+        """
+        Verify the installed client files and optionally repair the damaged ones.
+        Only the broken files are fetched again: manifest files one by one,
+        archive entries by reading just those entries from the remote pack.
+        :param full: Re-hash every file instead of trusting unchanged ones.
+        :param rate_limit: Optional cap, in bytes per second, of the disk reads
+                           (used by the idle background verification).
+        Returns the files that are still damaged, or None when the
+        verification was cancelled or failed (reported through the status).
+        """
+        self.status = status_callback
+        self.progress = progress_callback
+        self.control = control
+        try:
+            self.system_manager.recover_update()
+            self.status('Verificando archivos del juego...')
+            broken = self.system_manager.verify(full, workers=self.config.get('ExtractWorkers'),
+                                                limiter=RateLimiter(rate_limit) if rate_limit else None,
+                                                progress=self._tracker(PHASE_VERIFY), control=control)
+            if not broken:
+                self.status('Todos los archivos están correctos.')
+                return []
+            if not repair:
+                self.status(f'Se encontraron {len(broken)} archivos dañados.')
+                return broken
+
+            version_data = self._fetch_version_data()
+            if not version_data:
+                return broken
+            broken = self._repair_files(version_data, broken)
+            if broken:
+                self.status(f'No se pudieron reparar {len(broken)} archivos.')
+            else:
+                self.status('Archivos reparados correctamente.')
+            return broken
+
+        except UpdateCancelled:
+            self.status('Verificación cancelada.')
+            return None
+        except Exception as e:
+            self.status(f'Error al verificar los archivos: {e}')
+            return None
+
+    def rollback(self, status_callback: callable) -> bool:
+        """
+        Restore the system files of the previous version from the snapshot
+        taken by the last update. Works offline.
+        """
+        self.status = status_callback
+        self.system_manager.recover_update()
+        version = self.system_manager.rollback()
+        if version is None:
+            self.status('No hay una versión anterior guardada.')
+            return False
+        self.status(f'Restaurada la versión {version or "anterior"} del sistema.')
+        return True
+
+    def _repair_files(self, version_data: Dict, broken: List[str]) -> List[str]:
+        """Fetch the broken files again; returns the ones that could not be repaired"""
+        system = self._system_block(version_data)
+        remote_version = system.get('version', '')
+        if remote_version and remote_version != self.system_manager.get_local_version():
+            # A new version replaces the files anyway
+            self._check_system_update(version_data)
+            return self.system_manager.verify(workers=self.config.get('ExtractWorkers'), control=self.control)
+
+        # Files owned by the applied manifest
+        manifest = self.system_manager.load_manifest() or {}
+        manifest_url = system.get('manifest', '')
+        owned = {}
+        for entry in manifest.get('files', []):
+            local = self.system_manager.local_path(entry.get('path', ''))
+            if local:
+                owned[self.system_manager.index.key(local)] = entry
+        remaining = []
+        temp_dir = tempfile.mkdtemp()
+        try:
+            base_urls = self._manifest_bases(manifest, manifest_url)
+            chunks = None
+            if manifest.get('chunks') and manifest_url:
+                chunks = self._chunk_source(manifest, manifest_url, list(owned.values()),
+                                            os.path.join(temp_dir, 'chunks'))
+            for index, key in enumerate(broken, 1):
+                entry = owned.get(key)
+                if not entry or not self._file_urls(entry, base_urls):
+                    remaining.append(key)
+                    continue
+                if self.control:
+                    self.control.checkpoint()
+                rel_path = entry['path']
+                self.status(f'Reparando {rel_path}...')
+                temp_path = os.path.join(temp_dir, f'{index}.part')
+                try:
+                    if chunks and 'chunks' in entry:
+                        chunks.assemble(entry, temp_path)
+                    else:
+                        self._download_verified(self._file_urls(entry, base_urls), temp_path, entry)
+                except (requests.RequestException, DownloadError):
+                    remaining.append(key)
+                    continue
+                if not self.system_manager.install_file(rel_path, temp_path, entry.get('sha256')):
+                    remaining.append(key)
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+        update_urls = mirror_urls(system)
+        if remaining and update_urls:
+            remaining = self._repair_from_archive(update_urls, system, remaining)
+        self.system_manager.index.save()
+        return remaining
+
+    def _repair_from_archive(self, update_urls: List[str], system: Dict, broken: List[str]) -> List[str]:
+        """
+        Re-extract broken entries straight from the remote system pack.
+        Only the central directory (or l2pack index) and the needed entries are downloaded; origins
+        without Range support (or Mega) get the whole pack, of which only the
+        changed entries are extracted.
+        """
+        pack_format = system.get('format', FORMAT_ZIP)
+        cipher = None
+        if pack_format == FORMAT_ZIP_AES:
+            cipher = AesCtr(pack_key(SYSTEM_PASSWORD), bytes.fromhex(system.get('nonce', '')))
+        elif pack_format not in (FORMAT_ZIP, FORMAT_L2PACK):
+            return broken
+        password = None if cipher else SYSTEM_PASSWORD
+
+        remote = None
+        for url in self.downloader.rank([url for url in update_urls if 'mega.nz' not in url]):
+            try:
+                remote = self.downloader.open_remote(url, cipher.transform() if cipher else None)
+                break
+            except DownloadError:
+                remote = None
+        if remote is None:
+            self._update_system(update_urls, system.get('version', ''), cipher, Digest.from_block(system))
+            return self.system_manager.verify(workers=self.config.get('ExtractWorkers'), control=self.control)
+
+        remaining = list(broken)
+        manager = self.system_manager
+        is_pack = pack_format == FORMAT_L2PACK
+        with remote, (PackReader(remote) if is_pack else zipfile.ZipFile(remote)) as archive:
+            members = {}
+            for info in archive.infolist():
+                target = manager.member_path(info.filename)
+                if target and not info.is_dir():
+                    members[manager.index.key(target)] = (info, target)
+            for key in broken:
+                if key not in members:
+                    continue
+                if self.control:
+                    self.control.checkpoint()
+                info, target = members[key]
+                self.status(f'Reparando {key}...')
+                try:
+                    if is_pack:
+                        archive.extract(info, target)
+                    else:
+                        extract_member(remote, info, target, password)
+                except Exception as e:
+                    continue
+                manager.index.record(target, crc32=info.CRC)
+                remaining.remove(key)
+        return remaining
+
     def _fetch_version_data(self) -> Optional[Dict]:
         """Fetch version data from remote source"""
         try:
             version_url = self.config.get('VersionJsonUrl', '').strip()
             self.status('Comprobando actualizaciones...')
-            r = requests.get(version_url, timeout=10)
-            r.raise_for_status()
-            return r.json()
+            with tracing.span('fetch_version', url=version_url) as span:
+                # Conditional GET: an unchanged version.json is a bodiless 304
+                r = get_cache().get(version_url, timeout=10, revalidate=True)
+                r.raise_for_status()
+                span.set(cached=r.from_cache)
+                return r.json()
         except Exception as e:
             self.status('No se pudo obtener version.json remoto.')
             return None
 
+    def _launcher_outdated(self, version_data: Dict) -> bool:
+        """Whether version.json publishes another launcher with somewhere to download it"""
+        launcher = version_data.get('launcher', {})
+        return self.config.get('LauncherVersion', '') != launcher.get('version', '') and bool(mirror_urls(launcher))
+
     def _check_launcher_update(self, version_data: Dict) -> bool:
         """Check and update launcher if needed"""
-        local_version = self.config.get('LauncherVersion', '')
-        remote_version = version_data.get('launcher', {}).get('version', '')
-        update_url = version_data.get('launcher', {}).get('url', '')
-
-        if local_version != remote_version and update_url:
-            return self._update_launcher(update_url, remote_version)
+        if self._launcher_outdated(version_data):
+            launcher = version_data['launcher']
+            return self._update_launcher(mirror_urls(launcher), launcher.get('version', ''),
+                                         Digest.from_block(launcher))
         return False
 
+    @staticmethod
+    def _system_block(version_data: Dict) -> Dict:
+        """The system release in effect: the upcoming one once its release time has passed"""
+        system = version_data.get('system', {})
+        upcoming = upcoming_release(system)
+        if upcoming and window_state(upcoming) == WINDOW_RELEASED:
+            return release_block(upcoming)
+        return system
+
+    def _pending_release(self, version_data: Dict) -> Optional[Dict]:
+        """The upcoming release if it can be pre-downloaded now and is not installed or staged yet"""
+        upcoming = upcoming_release(version_data.get('system', {}))
+        if not upcoming or window_state(upcoming) != WINDOW_OPEN:
+            return None
+        version = upcoming['version']
+        if version == self.system_manager.get_local_version() or self.system_manager.prestaged(version):
+            return None
+        return upcoming
+
     def _check_system_update(self, version_data: Dict) -> bool:
         """Check and update system if needed"""
-        remote_version = version_data.get('system', {}).get('version', '')
-        update_url = version_data.get('system', {}).get('url', '')
+        system = self._system_block(version_data)
+        remote_version = system.get('version', '')
+        update_urls = mirror_urls(system)
+        manifest_url = system.get('manifest', '')
+        # A capped background download resumes better from a file than from a stream
+        streaming = system.get('streaming', self.config.get('StreamingExtract', False)) and not self.prestaging
+        pack_format = system.get('format', FORMAT_ZIP)
 
-        if not remote_version or not update_url:
+        if not remote_version or not (update_urls or manifest_url):
             return False
 
         local_version = self.system_manager.get_local_version()
         
         # Update if local version is missing or different from remote
         if local_version != remote_version:
-            return self._update_system(update_url, remote_version)
+            # Pre-downloaded in the background: only the local apply is left
+            if not self.prestaging and self.system_manager.prestaged(remote_version):
+                return self._apply_prestaged(remote_version)
+            # Prefer the per-file delta; the full zip stays as fallback
+            if manifest_url and self._update_system_delta(manifest_url, remote_version):
+                return True
+            if not update_urls:
+                return False
+            if pack_format not in (FORMAT_ZIP, FORMAT_ZIP_AES, FORMAT_L2PACK):
+                self.status(f'Formato de paquete no soportado: {pack_format}')
+                return False
+            cipher = None
+            if pack_format == FORMAT_ZIP_AES:
+                cipher = AesCtr(pack_key(SYSTEM_PASSWORD), bytes.fromhex(system.get('nonce', '')))
+            # Size and hashes of the published archive, checked while it downloads
+            digest = Digest.from_block(system)
+            # The hash of an AES pack is that of the encrypted file, never kept on disk
+            archive_sha = digest.sha256 if digest and pack_format != FORMAT_ZIP_AES else ''
+            peer_urls = []
+            if archive_sha:
+                peer_urls = [peer.url(archive_sha) for peer in self._lan_peers([archive_sha])
+                             if archive_sha in peer.has]
+                if peer_urls:
+                    self.status(f'Equipos de la red local con la actualización: {len(peer_urls)}.')
+                    # Only a downloaded archive can be checked against its hash
+                    streaming = False
+            http_urls = [url for url in update_urls if 'mega.nz' not in url]
+            # The index of an l2pack is at its end, so it cannot be extracted while streaming
+            if streaming and http_urls and pack_format != FORMAT_L2PACK:
+                # A stream cannot switch mirrors, so it uses the best one
+                ranked = self.downloader.rank(http_urls)
+                if ranked and self._update_system_streaming(ranked[0], remote_version, cipher, digest):
+                    return True
+                self.status('Reintentando con la descarga completa...')
+            return self._update_system(update_urls, remote_version, cipher, digest, peer_urls)
             
         return False
 
-    def _update_launcher(self, update_url: str, version: str) -> bool:
-        """Update launcher executable"""
+    def _finish_update(self, version: str) -> bool:
+        """Apply the staged update; when pre-downloading, keep it staged for release time instead"""
+        if self.prestaging:
+            self.system_manager.mark_prestaged()
+            return True
+        return self.system_manager.commit_update(version)
+
+    def _updated(self, version: str, detail: str = ''):
+        if self.prestaging:
+            self.status(f'System v{version} descargado; se instalará cuando se publique.')
+        else:
+            self.status(f"Sistema actualizado a la versión {version}{detail}.")
+
+    def _apply_prestaged(self, version: str) -> bool:
+        """Commit a release pre-downloaded in the background: no download, just renames"""
+        self.status(f'Instalando System v{version} descargado previamente...')
+        try:
+            self.system_manager.begin_update(version)
+            if not self.system_manager.commit_update(version):
+                self.status('Error al guardar la nueva versión del sistema.')
+                return False
+        finally:
+            self.system_manager.end_update()
+        self._updated(version)
+        return True
+
+    def prestage(self, status_callback: callable, progress_callback: Optional[Callable] = None,
+                 control: Optional[UpdateControl] = None, rate_limit: Optional[float] = None) -> bool:
+        """
+        Download and stage the upcoming release announced in version.json
+        (system.upcoming) without applying it, so that at release time the
+        update is only a local commit. Runs while the launcher is idle or from
+        the helper process that outlives it; only one of them at a time.
+        :param rate_limit: Optional cap of the download speed, in bytes per second.
+        Returns True once the upcoming release is completely staged.
+        """
+        self.status = status_callback
+        self.progress = progress_callback
+        self.control = control or UpdateControl()
+        lock = PrestageLock()
+        if not lock.acquire():
+            return False
+        watching = watch_stop(lock, self.control)
+        self.prestaging = True
+        self.limiter = RateLimiter(rate_limit) if rate_limit else None
+        self.downloader.limiter = self.mega.limiter = self.limiter
+        try:
+            with tracing.span('prestage'):
+                version_data = self._fetch_version_data()
+                upcoming = upcoming_release(version_data.get('system', {})) if version_data else None
+                if not upcoming or window_state(upcoming) != WINDOW_OPEN:
+                    return False
+                version = upcoming['version']
+                if version == self.system_manager.get_local_version() or self.system_manager.prestaged(version):
+                    return True
+                self.status(f'Descargando en segundo plano System v{version}...')
+                return self._check_system_update({'system': release_block(upcoming)})
+        except UpdateCancelled:
+            self.status('Descarga en segundo plano detenida.')
+            return False
+        except Exception as e:
+            self.status(f'Error en la descarga en segundo plano: {e}')
+            return False
+        finally:
+            self.prestaging = False
+            self.limiter = self.downloader.limiter = self.mega.limiter = None
+            watching.set()
+            lock.release()
+
+    def _update_launcher(self, update_urls: List[str], version: str, digest: Optional[Digest] = None) -> bool:
+        """Update launcher executable (only swapped in once it matches digest, when published)"""
         try:
             self.status('Actualizando launcher...')
             is_frozen = getattr(sys, 'frozen', False)
-            
-            if not is_frozen:
-                temp_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'temp')
-            else:
-                temp_dir = tempfile.mkdtemp()
-            
+            temp_dir = self.download_dir
             new_launcher_path = os.path.join(temp_dir, 'launcher_new.exe')
             
-            if 'mega.nz' in update_url:
-                from mega_downloader import download_mega_file
-                new_launcher = download_mega_file(update_url, temp_dir)
-                shutil.move(new_launcher, new_launcher_path)
-            else:
-                r = requests.get(update_url, stream=True)
-                with open(new_launcher_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+            self._download(update_urls, new_launcher_path, digest=digest)
 
             if not is_frozen:
                 self.status('Modo desarrollo: El nuevo launcher.exe se ha descargado en la carpeta temporal.')
-                QtWidgets.QMessageBox.information(
-                    None, "Actualización descargada",
-                    f"El nuevo launcher.exe se ha descargado en:\n{new_launcher_path}\n\nCopia manualmente este archivo si deseas probar la actualización."
-                )
+                self.launcher_update = {'path': new_launcher_path, 'script': None}
                 return True
 
             # Production: Create bat for replacement
@@ -132,55 +514,188 @@ class Updater:
             with open(bat_path, 'w') as bat:
                 bat.write(f"timeout /t 2\ndel \"{sys.argv[0]}\"\nmove /Y \"{new_launcher_path}\" \"{sys.argv[0]}\"\nstart \"\" \"{sys.argv[0]}\"\n")
             
-            os.startfile(bat_path)
-            QtWidgets.QApplication.quit()
-            sys.exit()
+            self.launcher_update = {'path': new_launcher_path, 'script': bat_path}
             return True
 
+        except UpdateCancelled:
+            raise
         except Exception as e:
             self.status(f'Error actualizando launcher: {e}')
             return False
 
-    def _update_system(self, update_url: str, version: str) -> bool:
-        """Downloads and extracts the system update using SystemManager."""
-        temp_dir = None
+    def _update_system(self, update_urls: List[str], version: str, cipher: Optional[AesCtr] = None,
+                       digest: Optional[Digest] = None, peer_urls: Optional[List[str]] = None) -> bool:
+        """
+        Downloads and extracts the system update using SystemManager.
+        'zip+aes' packs (cipher given) are decrypted at native speed while they
+        download and then hold a plain zip, so extraction skips ZipCrypto.
+        :param digest: Size and hashes of the archive from version.json; nothing
+                       is extracted unless the download matches them, and a
+                       verified plain archive is kept for the LAN peers.
+        :param peer_urls: Urls of the archive on LAN peers, used with the mirrors.
+        """
+        zip_path = os.path.join(self.download_dir, 'system_update.zip')
+        # What an AES pack leaves on disk is decrypted: not the published file
+        sha256 = digest.sha256 if digest and not cipher else ''
         try:
-            self.status(f"Descargando System v{version}...")
-
-            temp_dir = tempfile.mkdtemp()
-            zip_path = os.path.join(temp_dir, 'system_update.zip')
-
-            # Download the file
-            if 'mega.nz' in update_url:
-                from mega_downloader import download_mega_file
-                # Asumimos que download_mega_file descarga el archivo y lo nombra como el último componente de la URL
-                # y lo deja en temp_dir. Necesitamos moverlo a zip_path.
-                downloaded_file_path = download_mega_file(update_url, temp_dir)
-                if downloaded_file_path:
-                    shutil.move(downloaded_file_path, zip_path)
-                else:
-                    raise Exception("Fallo la descarga desde Mega.nz")
+            # Files go to a staging folder first; an interrupted run resumes there
+            self.system_manager.begin_update(version)
+            if self.system_manager.staged_pack(zip_path):
+                self.status('Reanudando la instalación interrumpida...')
             else:
-                r = requests.get(update_url, stream=True, timeout=60)
-                r.raise_for_status()
-                with open(zip_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
+                self.status(f"Descargando System v{version}...")
+                # Resumes a partial system_update.zip left by a previous run
+                self._download_archive(update_urls, peer_urls or [], zip_path, digest, sha256,
+                                       transform=cipher.transform() if cipher else None)
+                self.system_manager.stage_pack(zip_path)
 
             # Extract the system
             self.status('Descomprimiendo archivos del sistema...')
-            if not self.system_manager.extract_system(zip_path, password=b'12345'):
+            if not self.system_manager.extract_system(zip_path, password=None if cipher else SYSTEM_PASSWORD,
+                                                      progress=self._tracker(PHASE_EXTRACT),
+                                                      control=self.control,
+                                                      workers=self.config.get('ExtractWorkers')):
                 self.status('Error al descomprimir los archivos del sistema.')
                 return False
 
-            # Set the new version
-            if not self.system_manager.set_version(version):
+            # Swap the staged files in and set the new version
+            if not self._finish_update(version):
                 self.status('Error al guardar la nueva versión del sistema.')
                 return False
 
-            self.status(f"Sistema actualizado a la versión {version}.")
+            if sha256 and self.config.get('LanPeers', False):
+                from core.peers import share_archive
+                share_archive(zip_path, sha256)
+            else:
+                os.remove(zip_path)
+            self._updated(version)
             return True
 
+        except UpdateCancelled:
+            raise
+        except DigestError as e:
+            self.status('El paquete descargado no coincide con version.json.')
+            return False
+        except (requests.RequestException, DownloadError) as e:
+            self.status('Error de red al descargar la actualización.')
+            return False
+        except Exception as e:
+            self.status(f'Error inesperado: {e}')
+            return False
+        finally:
+            self.system_manager.end_update()
+            if self.store:
+                self.store.save()
+
+    def _download_archive(self, urls: List[str], peer_urls: List[str], target: str, digest: Optional[Digest],
+                          sha256: str = '', transform: Optional[Callable[[int, bytes], bytes]] = None):
+        """
+        Download the system archive from its mirrors and the LAN peers that
+        hold it, verified against digest while it downloads. A download that
+        does not verify is fetched again from the mirrors alone. With sha256
+        (a plain archive), the archive is shared through the content store
+        (taken from it when another client already has it).
+        """
+        if self.store and sha256 and self.store.materialize(sha256, target):
+            self.status('Paquete del sistema tomado del almacén compartido.')
+            return
+        try:
+            self._download(urls + peer_urls, target, transform=transform, digest=digest)
+        except DigestError:
+            if not peer_urls:
+                raise
+            self.status('El paquete recibido no supera la verificación, descargando desde el servidor...')
+            self._download(urls, target, transform=transform, digest=digest)
+        if self.store and sha256:
+            self.store.add(target, sha256)
+
+    def _lan_peers(self, want: List[str]) -> List['Peer']:
+        """Launchers of the local network answering a discovery (none if LanPeers is off)"""
+        if not self.config.get('LanPeers', False):
+            return []
+        # core.peers brings in the HTTP server: only loaded when peers are used
+        from core.peers import discover
+        return discover(want, timeout=float(self.config.get('LanPeersTimeout', 0.5)))
+
+    def _download(self, urls: List[str], target: str,
+                  transform: Optional[Callable[[int, bytes], bytes]] = None,
+                  digest: Optional[Digest] = None) -> str:
+        """
+        Download an artifact from its mirrors. HTTP mirrors are combined segment
+        by segment; Mega links, which need their own decryption, are tried after them.
+        With a digest, target only appears once the download matches it.
+        """
+        http_urls = [url for url in urls if 'mega.nz' not in url]
+        sources = [(self.downloader, http_urls)] if http_urls else []
+        sources += [(self.mega, url) for url in urls if 'mega.nz' in url]
+        error = None
+        for downloader, source in sources:
+            if error:
+                self.status('Servidor no disponible, probando con otro...')
+            try:
+                return downloader.download(source, target, self._tracker(PHASE_DOWNLOAD), self.control,
+                                           transform=transform, digest=digest)
+            except DownloadError as e:
+                error = e
+        raise error or DownloadError('No hay servidores de descarga')
+
+    def _update_system_streaming(self, update_url: str, version: str, cipher: Optional[AesCtr] = None,
+                                 digest: Optional[Digest] = None) -> bool:
+        """
+        Downloads the system archive and extracts it on the fly, entry by entry,
+        without ever writing the zip itself to disk. With block hashes in
+        digest, only verified blocks reach the extractor; with just the hash of
+        the whole archive, the staged files are dropped unless it matches.
+        """
+        # Only block hashes let staged files be kept before the end of the stream is checked
+        trusted = not digest or bool(digest.blocks)
+        completed = False
+        try:
+            self.status(f"Descargando System v{version}...")
+            self.system_manager.begin_update(version)
+            r = self.downloader.session.get(update_url, stream=True, timeout=60)
+            r.raise_for_status()
+            total = int(r.headers.get('Content-Length') or 0)
+            if digest and digest.size is not None and total and total != digest.size:
+                r.close()
+                raise DigestError(f'El archivo publicado no mide {digest.size} bytes como indica version.json')
+            tracker = self._tracker(PHASE_DOWNLOAD)
+            verifier = digest.verifier(sequential=True) if digest else None
+
+            decrypter = cipher.cipher_at(0) if cipher else None
+
+            def received():
+                done = 0
+                with r:
+                    for chunk in r.iter_content(chunk_size=256 * 1024):
+                        done += len(chunk)
+                        if tracker:
+                            tracker(done, total or done)
+                        yield chunk
+
+            def chunks():
+                # The hashes cover the published (encrypted) bytes
+                for chunk in verifier.stream(received()) if verifier else received():
+                    yield decrypter.decrypt(chunk) if decrypter else chunk
+
+            if not self.system_manager.extract_stream(chunks(), password=None if cipher else SYSTEM_PASSWORD,
+                                                      control=self.control):
+                self.status('Error al descomprimir los archivos del sistema.')
+                return False
+            completed = True
+
+            if not self._finish_update(version):
+                self.status('Error al guardar la nueva versión del sistema.')
+                return False
+
+            self._updated(version)
+            return True
+
+        except UpdateCancelled:
+            raise
+        except DigestError as e:
+            self.status('El paquete recibido no supera la verificación.')
+            return False
         except requests.RequestException as e:
             self.status('Error de red al descargar la actualización.')
             return False
@@ -188,6 +703,323 @@ class Updater:
             self.status(f'Error inesperado: {e}')
             return False
         finally:
-            # Clean up the temporary directory
+            if trusted or completed:
+                self.system_manager.end_update()
+            else:
+                self.system_manager.discard_update()
+
+    def _fetch_manifest(self, manifest_url: str) -> Optional[Dict]:
+        """Fetch the per-file system manifest"""
+        try:
+            with tracing.span('fetch_manifest', url=manifest_url) as span:
+                r = get_cache().get(manifest_url, timeout=30, revalidate=True)
+                r.raise_for_status()
+                span.set(cached=r.from_cache)
+                return r.json()
+        except Exception as e:
+            self.status('No se pudo obtener el manifiesto del sistema.')
+            return None
+
+    def _update_system_delta(self, manifest_url: str, version: str) -> bool:
+        """
+        Updates the system folder file by file from a manifest.
+        Only added or changed files are downloaded; files the manifest
+        no longer lists are deleted.
+        """
+        temp_dir = None
+        try:
+            manifest = self._fetch_manifest(manifest_url)
+            if not manifest:
+                return False
+
+            self.status('Comparando archivos del sistema...')
+            changed, removed = self.system_manager.diff_manifest(manifest)
+            base_urls = self._manifest_bases(manifest, manifest_url)
+            self.system_manager.begin_update(version)
+            # Launchers already on this version hold all of its files and chunks
+            self.peers = [peer for peer in self._lan_peers([]) if peer.version == version]
+            if self.peers:
+                self.status(f'Equipos de la red local con la actualización: {len(self.peers)}.')
+
+            # Same volume as the client, so installing and linking are renames
+            os.makedirs(self.download_dir, exist_ok=True)
+            temp_dir = tempfile.mkdtemp(dir=self.download_dir)
+            total = len(changed)
+            # Entries not already staged by an interrupted run
+            pending = {entry['path'] for entry in changed if not self.system_manager.staged_file(entry['path'], entry)}
+            # Files another client folder already put in the content store
+            stored = {entry['path'] for entry in changed
+                      if self.store and entry['path'] in pending and self.store.has(entry.get('sha256', ''))}
+            tracker = self._tracker(PHASE_DOWNLOAD)
+            chunks = None
+            if manifest.get('chunks'):
+                chunks = self._chunk_source(manifest, manifest_url, changed, os.path.join(temp_dir, 'chunks'))
+                missing = chunks.missing(entry for entry in changed if entry['path'] in pending - stored)
+                if missing:
+                    self.status(f"Descargando System v{version}: {len(missing)} fragmentos nuevos...")
+                    chunks.fetch(missing, tracker)
+                # The files are then assembled from the chunks
+                tracker = self._tracker(PHASE_EXTRACT)
+            total_bytes = sum(int(entry.get('size', 0)) for entry in changed)
+            done_bytes = 0
+            for index, entry in enumerate(changed, 1):
+                if self.control:
+                    self.control.checkpoint()
+                rel_path = entry['path']
+                if rel_path in pending:
+                    temp_path = os.path.join(temp_dir, f'{index}.part')
+                    if rel_path in stored and self.store.materialize(entry['sha256'], temp_path,
+                                                                     can_hardlink(rel_path)):
+                        self.status(f"Instalando System v{version} ({index}/{total}): {rel_path}")
+                    else:
+                        if chunks and 'chunks' in entry:
+                            self.status(f"Instalando System v{version} ({index}/{total}): {rel_path}")
+                            chunks.assemble(entry, temp_path)
+                        else:
+                            self.status(f"Descargando System v{version} ({index}/{total}): {rel_path}")
+                            if not self._patch_verified(entry, manifest_url, temp_path):
+                                self._download_verified(self._file_urls(entry, base_urls), temp_path, entry)
+                        if self.store and entry.get('sha256'):
+                            self.store.add(temp_path, entry['sha256'], can_hardlink(rel_path))
+                    if not self.system_manager.install_file(rel_path, temp_path, entry.get('sha256')):
+                        self.status(f'Error al instalar {rel_path}.')
+                        return False
+                done_bytes += int(entry.get('size', 0))
+                if tracker:
+                    tracker(done_bytes, total_bytes)
+
+            if removed:
+                self.status('Eliminando archivos obsoletos...')
+                self.system_manager.delete_files(removed)
+
+            if not self.system_manager.save_manifest(manifest):
+                self.status('Error al guardar el manifiesto del sistema.')
+                return False
+
+            if not self._finish_update(version):
+                self.status('Error al guardar la nueva versión del sistema.')
+                return False
+
+            self._updated(version, f' ({total} archivos)')
+            return True
+
+        except UpdateCancelled:
+            raise
+        except requests.RequestException as e:
+            self.status('Error de red al descargar la actualización.')
+            return False
+        except Exception as e:
+            self.status(f'Error inesperado: {e}')
+            return False
+        finally:
+            self.peers = []
+            self.system_manager.end_update()
+            if self.store:
+                self.store.save()
             if temp_dir and os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir)
\ No newline at end of file
+                shutil.rmtree(temp_dir)
+
+    def _chunk_source(self, manifest: Dict, manifest_url: str, changed: List[Dict], folder: str) -> ChunkSource:
+        """
+        ChunkSource of a chunked manifest, offering the chunks of the files
+        already installed: those unchanged in the new manifest and those of
+        the previously applied one.
+        """
+        source = ChunkSource(manifest, manifest_url, folder, get_session(),
+                             connections=int(self.config.get('DownloadConnections', 4)), control=self.control,
+                             limiter=self.limiter, peers=self.peers)
+        changed_paths = {entry['path'] for entry in changed}
+        unchanged = [entry for entry in manifest.get('files', []) if entry.get('path') not in changed_paths]
+        previous = self.system_manager.load_manifest() or {}
+        for entries, table in ((unchanged, None), (previous.get('files', []), previous.get('chunks') or {})):
+            for entry in entries:
+                local = self.system_manager.local_path(entry.get('path', ''))
+                try:
+                    if entry.get('chunks') and local and os.path.getsize(local) == int(entry.get('size', -1)):
+                        source.add_local(local, entry['chunks'], table)
+                except (OSError, ValueError):
+                    continue
+        return source
+
+    @staticmethod
+    def _manifest_bases(manifest: Dict, manifest_url: str) -> List[str]:
+        """Base urls of the manifest files: 'base_url' (or files/ next to the manifest), then its 'mirrors'"""
+        base_url = manifest.get('base_url') or (urljoin(manifest_url, 'files/') if manifest_url else '')
+        bases = mirror_urls({'url': base_url, 'mirrors': manifest.get('mirrors')})
+        return [base if base.endswith('/') else base + '/' for base in bases]
+
+    @staticmethod
+    def _file_urls(entry: Dict, base_urls: List[str]) -> List[str]:
+        """Urls of a manifest entry: its own 'url'/'mirrors', or its path on every base url"""
+        urls = mirror_urls(entry)
+        if urls:
+            return urls
+        rel_path = quote(entry['path'].replace('\\', '/'))
+        return [urljoin(base_url, rel_path) for base_url in base_urls]
+
+    def _download_verified(self, urls: List[str], path: str, entry: Dict):
+        """Download a single manifest entry from the first LAN peer or mirror that serves it intact"""
+        for peer in list(self.peers):
+            try:
+                return self._fetch_verified(peer.url(entry.get('sha256', '').lower()), path, entry)
+            except (requests.RequestException, DownloadError):
+                # Not asked again during this update
+                self.peers.remove(peer)
+        error = None
+        for url in urls:
+            try:
+                return self._fetch_verified(url, path, entry)
+            except (requests.RequestException, DownloadError) as e:
+                error = e
+        raise error or DownloadError(f"Sin servidores para {entry['path']}")
+
+    def _patch_verified(self, entry: Dict, manifest_url: str, path: str) -> bool:
+        """
+        Rebuild a manifest entry at path from the local copy and a binary patch.
+        The entry's 'patches' are keyed by the SHA-256 of the file they apply to
+        ('from'); the patch is streamed and applied as it downloads. Returns
+        False when no patch fits the local file or applying it fails, so the
+        caller downloads the full file instead.
+        """
+        patches = entry.get('patches') or []
+        local = self.system_manager.local_path(entry['path'])
+        if not patches or not local or not os.path.isfile(local):
+            return False
+        current = self.system_manager.index.sha256(local)
+        patch = next((p for p in patches if p.get('from', '').lower() == current), None)
+        if patch is None:
+            return False
+        url = patch.get('url') or urljoin(manifest_url, quote(patch.get('path', '')))
+        try:
+            with tracing.span('patch', path=entry['path'], source=patch.get('version')) as span, \
+                    get_session().get(url, stream=True, timeout=60) as r:
+                r.raise_for_status()
+                r.raw.decode_content = True
+                source = ThrottledReader(r.raw, self.limiter) if self.limiter else r.raw
+                apply_patch(local, source, path, entry.get('sha256'), control=self.control)
+                span.add_bytes(int(patch.get('size', 0)))
+            return True
+        except UpdateCancelled:
+            raise
+        except Exception:
+            # Any failure (network, corrupt patch, hash mismatch) falls back to the full file
+            self.status(f"No se pudo aplicar el parche de {entry['path']}, descargando el archivo completo...")
+            return False
+
+    def _fetch_verified(self, url: str, path: str, entry: Dict):
+        """Download a single manifest entry and check its size and hash"""
+        h = hashlib.sha256()
+        size = 0
+        with tracing.span('download_file', path=entry.get('path')) as span, \
+                get_session().get(url, stream=True, timeout=60) as r:
+            r.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in r.iter_content(chunk_size=65536):
+                    if self.limiter:
+                        self.limiter.consume(len(chunk))
+                    f.write(chunk)
+                    h.update(chunk)
+                    size += len(chunk)
+            span.add_bytes(size)
+        if size != int(entry.get('size', size)) or h.hexdigest() != entry.get('sha256', '').lower():
+            raise DownloadError(f"Archivo corrupto: {entry['path']}")
+
+    def _tracker(self, phase: str) -> Optional[Callable[[int, int], None]]:
+        """Return a (done, total) callback reporting ProgressEvents for a phase"""
+        if not self.progress:
+            return None
+        # ProgressRate: maximum progress updates per second sent to the UI
+        rate = float(self.config.get('ProgressRate', 10))
+        return ProgressTracker(self.progress, phase, interval=1.0 / rate if rate > 0 else 0.0).update
+
+def _emit(event: str, **fields):
+    """Write one JSON line: the machine-readable output of the headless updater."""
+    print(json.dumps({'event': event, **fields}, ensure_ascii=False), flush=True)
+
+def _emit_progress(event: ProgressEvent):
+    _emit('progress', phase=event.phase, done=event.done, total=event.total, speed=round(event.speed),
+          eta=round(event.eta, 1) if event.eta is not None else None)
+
+def _run_cancellable(control: UpdateControl, target: Callable, *args, **kwargs):
+    """Run target on a worker thread so that Ctrl+C cancels it cleanly, keeping what was downloaded."""
+    result = []
+    # An interrupted Thread.join() can report the thread as finished while it still runs
+    finished = threading.Event()
+
+    def run():
+        try:
+            result.append(target(*args, **kwargs))
+        finally:
+            finished.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    while not finished.is_set():
+        try:
+            finished.wait(0.2)
+        except KeyboardInterrupt:
+            control.cancel()
+    return result[0] if result else None
+
+def main(argv: List[str]) -> int:
+    """
+    Headless updater for scripts and containers, on the same engine as the
+    launcher and without Qt: every status message, progress report and the
+    final result are written to stdout as JSON lines. Returns the exit status.
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog='python -m core.updater', description='Actualizador sin interfaz')
+    parser.add_argument('command', choices=('check', 'update', 'verify'),
+                        help='comprobar versiones, actualizar o verificar (y reparar) los archivos')
+    parser.add_argument('--client', help='carpeta del cliente (la que contiene system/)')
+    parser.add_argument('--config', help='archivo JSON con claves que sustituyen a las de config.py')
+    parser.add_argument('--launcher', action='store_true',
+                        help='check, update: tener en cuenta también el launcher (update lo descarga)')
+    parser.add_argument('--full', action='store_true', help='verify: volver a leer todos los archivos')
+    parser.add_argument('--no-repair', action='store_true', help='verify: solo informar de los archivos dañados')
+    args = parser.parse_args(argv)
+    if args.client:
+        os.environ['L2_BASE_PATH'] = os.path.abspath(args.client)
+    from config.config import CONFIG
+    config = dict(CONFIG)
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    if config.get('Trace') or os.environ.get('L2_TRACE') == '1':
+        tracing.configure(os.path.join(get_base_path(), 'logs', 'trace.json'))
+
+    started = time.perf_counter()
+    status = lambda message: _emit('status', message=message)
+    updater = Updater(config)
+    control = UpdateControl()
+    if args.command == 'check':
+        state = updater.check(status)
+        if state is None:
+            _emit('result', command='check', ok=False, seconds=round(time.perf_counter() - started, 3))
+            return EXIT_FAILED
+        _emit('result', command='check', ok=True, seconds=round(time.perf_counter() - started, 3), **state)
+        outdated = state['system']['update'] or (args.launcher and state['launcher']['update'])
+        return EXIT_OUTDATED if outdated else EXIT_OK
+    if args.command == 'verify':
+        broken = _run_cancellable(control, updater.verify_files, status, _emit_progress, control,
+                                  repair=not args.no_repair, full=args.full)
+        if broken is None and not control.cancelled:
+            # The verification itself failed: nothing is known about the files
+            _emit('error', command='verify', message='No se pudo completar la verificación.')
+        ok = broken == [] and not control.cancelled
+        _emit('result', command='verify', ok=ok, broken=broken, cancelled=control.cancelled,
+              seconds=round(time.perf_counter() - started, 3))
+        return EXIT_OK if ok else EXIT_FAILED
+    performed = _run_cancellable(control, updater.check_updates, status, _emit_progress, control,
+                                 launcher=args.launcher)
+    # Up to date afterwards, or why not (a failed or cancelled run only reported it in its status)
+    state = None if control.cancelled else updater.check(lambda message: None)
+    ok = bool(state) and not state['system']['update']
+    _emit('result', command='update', ok=ok, updated=bool(performed), cancelled=control.cancelled,
+          version=updater.system_manager.get_local_version(),
+          launcher=updater.launcher_update['path'] if updater.launcher_update else None,
+          seconds=round(time.perf_counter() - started, 3))
+    return EXIT_OK if ok else EXIT_FAILED
+
+if __name__ == '__main__':
+    # python -m core.updater check|update|verify [--client <carpeta>] [--config <archivo.json>]
+    sys.exit(main(sys.argv[1:]))
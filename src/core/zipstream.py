@@ -0,0 +1,378 @@
+import os
+import time
+import zlib
+import struct
+from typing import Callable, Dict, Optional, Tuple
+from core.exceptions import ExtractionError
+
+LOCAL_HEADER_SIG = b'PK\x03\x04'
+CENTRAL_HEADER_SIG = b'PK\x01\x02'
+DESCRIPTOR_SIG = b'PK\x07\x08'
+EOCD_SIG = b'PK\x05\x06'
+
+_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<4sHHHHHHIIIHHHHHII')
+
+FLAG_ENCRYPTED = 0x01
+FLAG_DATA_DESCRIPTOR = 0x08
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+def set_zip_mtime(path: str, info):
+    """Give an extracted file the timestamp stored in the archive (info.date_time)."""
+    try:
+        timestamp = time.mktime(tuple(info.date_time) + (0, 0, -1))
+        os.utime(path, (timestamp, timestamp))
+    except (OverflowError, ValueError, OSError):
+        pass
+
+def _gen_crc_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC_TABLE = _gen_crc_table()
+_KEYSTREAM_TABLE = None
+
+def _keystream_table() -> bytes:
+    """The ZipCrypto keystream byte only depends on the low 16 bits of key2."""
+    global _KEYSTREAM_TABLE
+    if _KEYSTREAM_TABLE is None:
+        _KEYSTREAM_TABLE = bytes((((k | 2) * ((k | 2) ^ 1)) >> 8) & 0xFF for k in range(65536))
+    return _KEYSTREAM_TABLE
+
+class ZipCryptoDecrypter:
+    """Traditional PKWARE (ZipCrypto) stream decrypter."""
+
+    def __init__(self, password: bytes):
+        self.key0, self.key1, self.key2 = 0x12345678, 0x23456789, 0x34567890
+        for c in password:
+            self._update_keys(c)
+
+    def _update_keys(self, c: int):
+        table = _CRC_TABLE
+        self.key0 = (self.key0 >> 8) ^ table[(self.key0 ^ c) & 0xFF]
+        self.key1 = ((self.key1 + (self.key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        self.key2 = (self.key2 >> 8) ^ table[(self.key2 ^ (self.key1 >> 24)) & 0xFF]
+
+    def decrypt(self, data: bytes) -> bytes:
+        # Keys live in locals and the keystream byte is a table lookup: this
+        # loop is the hot path for protected archives
+        table = _CRC_TABLE
+        keystream = _keystream_table()
+        key0, key1, key2 = self.key0, self.key1, self.key2
+        result = bytearray(data)
+        i = 0
+        for c in data:
+            c ^= keystream[key2 & 0xFFFF]
+            result[i] = c
+            i += 1
+            key0 = (key0 >> 8) ^ table[(key0 ^ c) & 0xFF]
+            key1 = ((key1 + (key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+            key2 = (key2 >> 8) ^ table[(key2 ^ (key1 >> 24)) & 0xFF]
+        self.key0, self.key1, self.key2 = key0, key1, key2
+        return bytes(result)
+
+class _Entry:
+    """State of the local entry currently being streamed."""
+
+    def __init__(self, name: str, flags: int, method: int, crc: int, compressed: int,
+                 size: int, dos_time: int, dos_date: int, target: Optional[str]):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.compressed = compressed
+        self.size = size
+        self.dos_time = dos_time
+        self.date_time = ((dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                          dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2)
+        self.target = target
+        self.remaining = compressed
+        # With a data descriptor the local sizes are unreliable (often zero)
+        self.known_size = not flags & FLAG_DATA_DESCRIPTOR
+        self.consumed = 0
+        self.decrypter = None
+        self.header_left = 12 if flags & FLAG_ENCRYPTED else 0
+        self.inflater = zlib.decompressobj(-15) if method == METHOD_DEFLATED else None
+        self.running_crc = 0
+        self.written = 0
+        self.zip64 = False
+        self.file = None
+
+class StreamingZipExtractor:
+    """
+    Extracts a ZIP archive from a forward-only byte stream.
+    Local file headers are parsed as bytes arrive and every entry is inflated
+    straight to disk, so extraction overlaps the download and the archive is
+    never stored. Once the stream ends, the central directory is checked
+    against what was extracted.
+    """
+
+    def __init__(self, resolve: Callable[[str], Optional[str]], password: Optional[bytes] = None):
+        """
+        :param resolve: Maps an archive member name to a destination path (None skips it).
+        :param password: ZipCrypto password for protected archives.
+        """
+        self.resolve = resolve
+        self.password = password
+        self.buffer = bytearray()
+        self.entry = None
+        self.in_central_directory = False
+        self.extracted = {}  # name -> (crc, size)
+
+    def feed(self, data: bytes):
+        """Consume the next chunk of the archive."""
+        self.buffer += data
+        while self._step():
+            pass
+
+    def close(self) -> Dict[str, Tuple[int, int]]:
+        """
+        Finish the stream and verify the central directory.
+        Returns {member name: (crc32, size)} for every extracted entry.
+        """
+        if self.entry is not None or not self.in_central_directory:
+            self.abort()
+            raise ExtractionError('El archivo se interrumpió antes de terminar')
+        self._verify_central_directory(bytes(self.buffer))
+        return self.extracted
+
+    def _step(self) -> bool:
+        """Advance the parser as far as the buffered bytes allow."""
+        if self.in_central_directory:
+            return False
+        if self.entry is None:
+            return self._read_local_header()
+        return self._read_entry_data()
+
+    def _read_local_header(self) -> bool:
+        if len(self.buffer) < 4:
+            return False
+        signature = bytes(self.buffer[:4])
+        if signature in (CENTRAL_HEADER_SIG, EOCD_SIG):
+            # The rest of the stream is the central directory, kept for verification
+            self.in_central_directory = True
+            return False
+        if signature != LOCAL_HEADER_SIG:
+            raise ExtractionError('Cabecera ZIP local inválida')
+        if len(self.buffer) < _LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, mod_time, mod_date, crc, compressed, size,
+         name_len, extra_len) = _LOCAL_HEADER.unpack_from(self.buffer)
+        header_len = _LOCAL_HEADER.size + name_len + extra_len
+        if len(self.buffer) < header_len:
+            return False
+        raw_name = bytes(self.buffer[_LOCAL_HEADER.size:_LOCAL_HEADER.size + name_len])
+        extra = bytes(self.buffer[_LOCAL_HEADER.size + name_len:header_len])
+        del self.buffer[:header_len]
+
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437')
+        zip64 = self._has_zip64(extra)
+        compressed, size = self._zip64_sizes(extra, compressed, size)
+        if method not in (METHOD_STORED, METHOD_DEFLATED):
+            raise ExtractionError(f'Método de compresión no soportado en {name}')
+
+        target = None if name.endswith('/') else self.resolve(name)
+        entry = _Entry(name, flags, method, crc, compressed, size, mod_time, mod_date, target)
+        entry.zip64 = zip64
+        if flags & FLAG_ENCRYPTED:
+            if not self.password:
+                raise ExtractionError(f'{name} requiere contraseña')
+            entry.decrypter = ZipCryptoDecrypter(self.password)
+        if name.endswith('/'):
+            directory = self.resolve(name)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        elif target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            entry.file = open(target + '.tmp', 'wb')
+        self.entry = entry
+        return True
+
+    @staticmethod
+    def _has_zip64(extra: bytes) -> bool:
+        offset = 0
+        while offset + 4 <= len(extra):
+            tag, length = struct.unpack_from('<HH', extra, offset)
+            if tag == 0x0001:
+                return True
+            offset += 4 + length
+        return False
+
+    @staticmethod
+    def _zip64_sizes(extra: bytes, compressed: int, size: int) -> Tuple[int, int]:
+        """Read real sizes from a ZIP64 extra field when the header holds 0xFFFFFFFF."""
+        offset = 0
+        while offset + 4 <= len(extra):
+            tag, length = struct.unpack_from('<HH', extra, offset)
+            if tag == 0x0001:
+                values = list(struct.unpack_from('<%dQ' % (length // 8), extra, offset + 4))
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if compressed == 0xFFFFFFFF and values:
+                    compressed = values.pop(0)
+                break
+            offset += 4 + length
+        return compressed, size
+
+    def _read_entry_data(self) -> bool:
+        entry = self.entry
+        if entry.header_left:
+            if len(self.buffer) < entry.header_left:
+                return False
+            header = entry.decrypter.decrypt(bytes(self.buffer[:12]))
+            del self.buffer[:12]
+            entry.header_left = 0
+            entry.consumed += 12
+            entry.remaining -= 12
+            check = (entry.dos_time >> 8) & 0xFF if entry.flags & FLAG_DATA_DESCRIPTOR else entry.crc >> 24
+            if header[11] != check:
+                self.abort()
+                raise ExtractionError('Contraseña incorrecta')
+            return True
+
+        if entry.known_size:
+            return self._read_sized_data(entry)
+        if entry.inflater:
+            return self._read_deflated_until_eof(entry)
+        return self._read_stored_until_descriptor(entry)
+
+    def _consume(self, entry: _Entry, length: int) -> bytes:
+        """Take raw bytes from the buffer, decrypting them if needed."""
+        raw = bytes(self.buffer[:length])
+        del self.buffer[:length]
+        entry.consumed += len(raw)
+        return entry.decrypter.decrypt(raw) if entry.decrypter else raw
+
+    def _read_sized_data(self, entry: _Entry) -> bool:
+        """Entry whose compressed size is known from the local header."""
+        if entry.remaining > 0:
+            if not self.buffer:
+                return False
+            data = self._consume(entry, entry.remaining)
+            entry.remaining -= len(data)
+            self._write(entry, entry.inflater.decompress(data) if entry.inflater else data)
+            if entry.remaining > 0:
+                return False
+            if entry.inflater:
+                self._write(entry, entry.inflater.flush())
+        self._finish_entry(entry.crc, entry.size)
+        return True
+
+    def _read_deflated_until_eof(self, entry: _Entry) -> bool:
+        """Deflated entry of unknown size: the deflate stream marks its own end."""
+        if not entry.inflater.eof:
+            if not self.buffer:
+                return False
+            raw = bytes(self.buffer)
+            data = entry.decrypter.decrypt(raw) if entry.decrypter else raw
+            self._write(entry, entry.inflater.decompress(data))
+            # Bytes past the end of the deflate stream belong to the descriptor
+            consumed = len(raw) - len(entry.inflater.unused_data)
+            del self.buffer[:consumed]
+            entry.consumed += consumed
+            if not entry.inflater.eof:
+                return False
+        return self._read_descriptor()
+
+    def _read_stored_until_descriptor(self, entry: _Entry) -> bool:
+        """
+        Stored entry of unknown size: the end is the first descriptor signature
+        whose crc and sizes match the data read so far.
+        """
+        while True:
+            position = self.buffer.find(DESCRIPTOR_SIG)
+            if position < 0:
+                # Keep a possible partial signature at the end of the buffer
+                safe = max(0, len(self.buffer) - 3)
+                if safe:
+                    self._write(entry, self._consume(entry, safe))
+                return False
+            if position:
+                self._write(entry, self._consume(entry, position))
+            layout = '<4sIQQ' if entry.zip64 else '<4sIII'
+            if len(self.buffer) < struct.calcsize(layout):
+                return False
+            _, crc, compressed, size = struct.unpack_from(layout, self.buffer)
+            if crc == entry.running_crc and compressed == entry.consumed and size == entry.written:
+                del self.buffer[:struct.calcsize(layout)]
+                self._finish_entry(crc, size)
+                return True
+            # The signature bytes were part of the file data
+            self._write(entry, self._consume(entry, 1))
+
+    def _read_descriptor(self) -> bool:
+        """Read the data descriptor that follows an entry and finish it."""
+        entry = self.entry
+        if len(self.buffer) < 4:
+            return False
+        # Optional signature, then crc and sizes (8 bytes each for ZIP64 entries)
+        offset = 4 if self.buffer[:4] == DESCRIPTOR_SIG else 0
+        layout = '<IQQ' if entry.zip64 else '<III'
+        length = offset + struct.calcsize(layout)
+        if len(self.buffer) < length:
+            return False
+        crc, compressed, size = struct.unpack_from(layout, self.buffer, offset)
+        del self.buffer[:length]
+        self._finish_entry(crc, size)
+        return True
+
+    def _write(self, entry: _Entry, data: bytes):
+        if not data:
+            return
+        entry.running_crc = zlib.crc32(data, entry.running_crc)
+        entry.written += len(data)
+        if entry.file:
+            entry.file.write(data)
+
+    def _finish_entry(self, crc: int, size: int):
+        entry = self.entry
+        self.entry = None
+        if entry.name.endswith('/'):
+            return
+        if entry.file:
+            entry.file.close()
+        if entry.running_crc != crc or entry.written != size:
+            if entry.target:
+                os.remove(entry.target + '.tmp')
+            raise ExtractionError(f'CRC incorrecto en {entry.name}')
+        if entry.target:
+            set_zip_mtime(entry.target + '.tmp', entry)
+            os.replace(entry.target + '.tmp', entry.target)
+        self.extracted[entry.name] = (crc, size)
+
+    def abort(self):
+        """Drop the temporary file of a half-written entry."""
+        entry, self.entry = self.entry, None
+        if entry and entry.file:
+            entry.file.close()
+            os.remove(entry.target + '.tmp')
+
+    def _verify_central_directory(self, data: bytes):
+        """Check the central directory lists exactly the entries that were extracted."""
+        listed = {}
+        offset = 0
+        while data[offset:offset + 4] == CENTRAL_HEADER_SIG:
+            if len(data) < offset + _CENTRAL_HEADER.size:
+                break
+            fields = _CENTRAL_HEADER.unpack_from(data, offset)
+            flags, crc, compressed, size = fields[3], fields[7], fields[8], fields[9]
+            name_len, extra_len, comment_len = fields[10], fields[11], fields[12]
+            start = offset + _CENTRAL_HEADER.size
+            name = data[start:start + name_len].decode('utf-8' if flags & 0x800 else 'cp437')
+            extra = data[start + name_len:start + name_len + extra_len]
+            compressed, size = self._zip64_sizes(extra, compressed, size)
+            if not name.endswith('/'):
+                listed[name] = (crc, size)
+            offset = start + name_len + extra_len + comment_len
+
+        if data.find(EOCD_SIG, offset) < 0:
+            raise ExtractionError('Falta el directorio central del archivo')
+        if listed != self.extracted:
+            raise ExtractionError('El directorio central no coincide con los archivos extraídos')
@@ -1,5 +1,7 @@
 import sys
 import os
+from utils import timing
+import multiprocessing
 from PyQt5 import QtWidgets, QtGui, QtCore, QtSvg
 from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QSplashScreen, QApplication
@@ -14,8 +16,28 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
+# Los procesos de extracción en paralelo vuelven a importar este módulo;
+# solo el proceso principal crea la interfaz
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
+# Proceso auxiliar sin interfaz (launcher --prestage): descarga en segundo
+# plano la próxima versión anunciada mientras se juega y termina
+if __name__ == '__main__' and '--prestage' in sys.argv:
+    from config.config import CONFIG
+    from core.prestage import run_helper
+    sys.exit(run_helper(CONFIG))
+
+# Proceso auxiliar sin interfaz (launcher --learn-startup): observa qué
+# archivos lee el cliente al arrancar para precargarlos la próxima vez
+if __name__ == '__main__' and '--learn-startup' in sys.argv:
+    from config.config import CONFIG
+    from core.prefetch import run_learner
+    sys.exit(run_learner(CONFIG))
+
 # Configuración inicial de la aplicación
-app = QApplication(sys.argv)
+app = QApplication(sys.argv) if __name__ == '__main__' else None
+timing.mark('qt')
 
 # Crear y mostrar el splash screen
 def show_splash():
@@ -48,72 +70,346 @@ def show_splash():
         return None
 
 # Mostrar el splash screen lo antes posible
-splash = show_splash()
+splash = show_splash() if app is not None else None
+timing.mark('splash')
 
-# Importaciones pesadas después de mostrar el splash
-from core.updater import Updater
+# El updater (requests, zip, AES) se importa en su propio hilo al usarse
+from core.progress import PHASE_DOWNLOAD, PHASE_EXTRACT, PHASE_VERIFY
 from config.config import CONFIG
+from core import tracing
+from core.paths import get_base_path
 from services.news import NewsService
 from services.game import GameService
 from utils.locale import LocaleService, LANGS
 from ui.launcher_ui import LauncherUI
+timing.mark('import')
 
 class Launcher(QtWidgets.QWidget):
+    # Emitted from the news refresh thread; delivered queued on the GUI thread
+    news_updated = QtCore.pyqtSignal(bool)
+
     def __init__(self):
         super().__init__()
         self.config = self.load_config()
+        if self.config.get('Trace') or os.environ.get('L2_TRACE') == '1':
+            tracing.configure(os.path.join(get_base_path(), 'logs', 'trace.json'))
         self.locale_service = LocaleService()
         self.lang = self.locale_service.get_language()
         
         self.setWindowTitle(self.config['LauncherTitle'])
         self.setFixedSize(640, 420)
         self.setWindowIcon(QtGui.QIcon(resource_path('assets/icon.png')))
+        self.update_worker = None
+        # Low priority verification of the game files while the launcher sits idle
+        self.idle_worker = None
+        # Background pre-download of an announced release
+        self.prestage_worker = None
+        self.upcoming = None
+        # Page-cache warmup of the files the game reads when it starts
+        self.prefetcher = None
         
         # Setup UI from the dedicated UI class
         self.ui = LauncherUI()
         self.ui.setup_ui(self)
         
-        # Load news and start update check
+        # Show cached news right away and refresh them in the background
+        self.news_service = NewsService(self.config, self.lang)
+        self.news_updated.connect(self.on_news_updated)
         self.load_news()
+        self._painted = False
         QtCore.QTimer.singleShot(500, self.check_updates)
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._painted:
+            self._painted = True
+            timing.mark('first_paint')
+            QtCore.QTimer.singleShot(0, self.on_interactive)
+
+    def on_interactive(self):
+        """First event loop pass after the first paint: start background work."""
+        timing.mark('interactive')
+        if timing.enabled():
+            print(timing.report())
+        self.news_service.refresh_async(self.news_updated.emit)
+
     def log(self, message: str, error: bool = False):
         """Logs a message to the console and the UI status label."""
         prefix = "[ERROR]" if error else "[INFO]"
         print(f"{prefix} {message}")
         self.status.setText(message)
-        QtWidgets.QApplication.processEvents()
 
     def load_config(self):
         """Loads configuration from config.py"""
         return CONFIG
 
     def check_updates(self):
-        """Checks for updates using the Updater service."""
-        updater = Updater(self.config)
-        try:
-            update_performed = updater.check_updates(self.log)
-            
-            if update_performed:
-                self.log("Cliente actualizado con éxito.")
-            else:
-                self.log("No se encontraron actualizaciones. El cliente ya está al día.")
+        """Starts the Updater pipeline on a background worker."""
+        from services.update_worker import UpdateWorker
+        self.update_worker = UpdateWorker(self.config, self)
+        self.update_worker.status.connect(self.log)
+        self.update_worker.progress.connect(self.on_update_progress)
+        self.update_worker.update_finished.connect(self.on_update_finished)
+        self.update_worker.update_failed.connect(self.on_update_failed)
+        self.show_update_controls()
+        self.update_worker.start()
+
+    def show_update_controls(self):
+        self.pause_btn.setText('❚❚')
+        self.pause_btn.setToolTip(LANGS[self.lang]['pause'])
+        self.pause_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(True)
+        self.pause_btn.show()
+        self.cancel_btn.show()
+        self.progress_bar.setValue(0)
+        self.repair_btn.setEnabled(False)
+
+    def on_update_progress(self, event):
+        """Renders a ProgressEvent from the update worker."""
+        if self.update_worker and self.update_worker.control.paused:
+            return
+        label = {PHASE_DOWNLOAD: 'downloading', PHASE_EXTRACT: 'extracting',
+                 PHASE_VERIFY: 'verifying'}.get(event.phase)
+        if not label or not event.total:
+            return
+        self.progress_bar.setValue(int(event.done * 1000 / event.total))
+        self.progress_bar.show()
+        text = f"{LANGS[self.lang][label]}... {int(event.percent)}% · {event.speed / (1024 * 1024):.1f} MB/s"
+        if event.eta is not None and event.done < event.total:
+            minutes, seconds = divmod(int(event.eta), 60)
+            text += f" · {minutes}:{seconds:02d}"
+        self.status.setText(text)
+
+    def on_update_finished(self, update_performed: bool):
+        """Called on the GUI thread once the update worker is done."""
+        self.pause_btn.hide()
+        self.cancel_btn.hide()
+        self.progress_bar.hide()
+        updater = self.update_worker.updater
+        self.upcoming = updater.upcoming
+        if updater.launcher_update:
+            self.apply_launcher_update(updater.launcher_update)
+            return
+
+        if self.update_worker.control.cancelled:
+            self.log(LANGS[self.lang]['cancelled'])
+        elif update_performed:
+            self.log("Cliente actualizado con éxito.")
+        else:
+            self.log("No se encontraron actualizaciones. El cliente ya está al día.")
+
+        # Enable the start button once checks are complete
+        self.start_btn.setEnabled(True)
+        self.ui.set_start_btn_style(self.start_btn, enabled=True, glow=True)
+        self.repair_btn.setEnabled(True)
+        self.status.setText(LANGS[self.lang]['ready'])
+
+        if self.update_worker.control.cancelled:
+            return
+        if self.config.get('LanPeers', False):
+            # Share the installed files with the other launchers of the network
+            from core.peers import start_server
+            start_server(get_base_path(), int(self.config.get('LanPeersPort', 0)))
+        if self.config.get('PrefetchGameFiles', True):
+            self.start_prefetch()
+        if self.upcoming and self.prestage_rate() > 0:
+            # The pre-download goes first; the files are verified on a later start
+            QtCore.QTimer.singleShot(int(self.config.get('IdleVerifyDelay', 5000)), self.start_prestage)
+        elif float(self.config.get('IdleVerifyRate', 8 * 1024 * 1024)) > 0:
+            QtCore.QTimer.singleShot(int(self.config.get('IdleVerifyDelay', 5000)), self.start_idle_verify)
+
+    def start_idle_verify(self):
+        """Verifies the game files in the background, capped to IdleVerifyRate bytes per second."""
+        if (self.update_worker and self.update_worker.isRunning()) or self.idle_worker:
+            return
+        from services.update_worker import UpdateWorker, TASK_VERIFY
+        self.idle_worker = UpdateWorker(self.config, self, TASK_VERIFY, repair=False,
+                                        rate_limit=float(self.config.get('IdleVerifyRate', 8 * 1024 * 1024)))
+        # Console only: the status label keeps showing that the client is ready
+        self.idle_worker.status.connect(lambda message: print(f"[INFO] {message}"))
+        self.idle_worker.verify_finished.connect(self.on_idle_verify_finished)
+        self.idle_worker.start()
+
+    def on_idle_verify_finished(self, broken):
+        if broken and not self.idle_worker.control.cancelled:
+            self.status.setText(f"{LANGS[self.lang]['damaged_files']}: {len(broken)}")
+
+    def stop_idle_verify(self):
+        """Stops the background verification, e.g. before the game starts reading its files."""
+        if self.idle_worker and self.idle_worker.isRunning():
+            self.idle_worker.cancel()
+            self.idle_worker.wait(5000)
+
+    def start_prefetch(self):
+        """Brings the files the game reads at startup into the OS cache while the launcher is idle."""
+        if self.prefetcher:
+            return
+        from core.prefetch import Prefetcher
+        self.prefetcher = Prefetcher(get_base_path(), float(self.config.get('PrefetchMemoryShare', 0.5))).start()
 
-            # Enable the start button once checks are complete
+    def stop_prefetch(self):
+        """Stops the warmup, e.g. before the game files are rewritten."""
+        if self.prefetcher:
+            self.prefetcher.stop()
+            self.prefetcher = None
+
+    def prestage_rate(self) -> float:
+        from core.prestage import PRESTAGE_RATE
+        return float(self.config.get('PrestageRate', PRESTAGE_RATE))
+
+    def start_prestage(self):
+        """Pre-downloads the upcoming release at low priority, capped to PrestageRate bytes per second."""
+        if (self.update_worker and self.update_worker.isRunning()) or self.prestage_worker:
+            return
+        from services.update_worker import UpdateWorker, TASK_PRESTAGE
+        self.prestage_worker = UpdateWorker(self.config, self, TASK_PRESTAGE, rate_limit=self.prestage_rate())
+        # Console only: the status label keeps showing that the client is ready
+        self.prestage_worker.status.connect(lambda message: print(f"[INFO] {message}"))
+        self.prestage_worker.update_finished.connect(self.on_prestage_finished)
+        self.prestage_worker.start(QtCore.QThread.IdlePriority)
+
+    def on_prestage_finished(self, staged: bool):
+        if staged:
+            self.upcoming = None
+
+    def stop_prestage(self):
+        """Stops the background pre-download; what it fetched is kept for the next run."""
+        if self.prestage_worker and self.prestage_worker.isRunning():
+            self.prestage_worker.cancel()
+            self.prestage_worker.wait(15000)
+
+    def repair_files(self):
+        """Verifies every game file and fetches the damaged ones again."""
+        if self.update_worker and self.update_worker.isRunning():
+            return
+        self.stop_idle_verify()
+        self.stop_prestage()
+        self.stop_prefetch()
+        from services.update_worker import UpdateWorker, TASK_VERIFY
+        self.start_btn.setEnabled(False)
+        self.ui.set_start_btn_style(self.start_btn, enabled=False, glow=False)
+        self.update_worker = UpdateWorker(self.config, self, TASK_VERIFY, repair=True)
+        self.update_worker.status.connect(self.log)
+        self.update_worker.progress.connect(self.on_update_progress)
+        self.update_worker.verify_finished.connect(self.on_repair_finished)
+        self.update_worker.update_failed.connect(self.on_update_failed)
+        self.show_update_controls()
+        self.update_worker.start()
+
+    def show_repair_menu(self, pos):
+        """Context menu of the repair button: roll back to the version before the last update."""
+        if self.update_worker and self.update_worker.isRunning():
+            return
+        from core.staging import UPDATE_FOLDER
+        menu = QtWidgets.QMenu(self)
+        action = menu.addAction(LANGS[self.lang]['rollback'])
+        action.setEnabled(os.path.exists(os.path.join(get_base_path(), UPDATE_FOLDER, 'snapshot.json')))
+        if menu.exec_(self.repair_btn.mapToGlobal(pos)) == action:
+            self.rollback_update()
+
+    def rollback_update(self):
+        """Restores the previous system version from its snapshot (no download)."""
+        self.stop_idle_verify()
+        self.stop_prestage()
+        self.stop_prefetch()
+        from services.update_worker import UpdateWorker, TASK_ROLLBACK
+        self.start_btn.setEnabled(False)
+        self.ui.set_start_btn_style(self.start_btn, enabled=False, glow=False)
+        self.repair_btn.setEnabled(False)
+        self.update_worker = UpdateWorker(self.config, self, TASK_ROLLBACK)
+        self.update_worker.status.connect(self.log)
+        self.update_worker.update_finished.connect(self.on_rollback_finished)
+        self.update_worker.update_failed.connect(self.on_update_failed)
+        self.update_worker.start()
+
+    def on_rollback_finished(self, restored: bool):
+        if restored:
+            self.log(LANGS[self.lang]['rolled_back'])
+        else:
+            self.log(LANGS[self.lang]['rollback_failed'], error=True)
+        self.start_btn.setEnabled(True)
+        self.ui.set_start_btn_style(self.start_btn, enabled=True, glow=True)
+        self.repair_btn.setEnabled(True)
+
+    def on_repair_finished(self, broken):
+        self.pause_btn.hide()
+        self.cancel_btn.hide()
+        self.progress_bar.hide()
+        if self.update_worker.control.cancelled:
+            self.log(LANGS[self.lang]['cancelled'])
+        elif broken is None:
+            self.log(LANGS[self.lang]['verify_failed'], error=True)
+        elif broken:
+            self.log(f"{LANGS[self.lang]['repair_failed']}: {len(broken)}", error=True)
+        else:
+            self.log(LANGS[self.lang]['repaired'])
+        self.start_btn.setEnabled(True)
+        self.ui.set_start_btn_style(self.start_btn, enabled=True, glow=True)
+        self.repair_btn.setEnabled(True)
+
+    def on_update_failed(self, error: str):
+        self.pause_btn.hide()
+        self.cancel_btn.hide()
+        self.progress_bar.hide()
+        self.log(f"Error fatal en el proceso de actualización: {error}", error=True)
+        self.status.setText(LANGS[self.lang]['update_failed'])
+        self.repair_btn.setEnabled(True)
+
+    def apply_launcher_update(self, launcher_update):
+        """Swaps in a downloaded launcher (production) or points to it (development)."""
+        if not launcher_update['script']:
+            QtWidgets.QMessageBox.information(
+                self, "Actualización descargada",
+                f"El nuevo launcher.exe se ha descargado en:\n{launcher_update['path']}\n\nCopia manualmente este archivo si deseas probar la actualización."
+            )
             self.start_btn.setEnabled(True)
             self.ui.set_start_btn_style(self.start_btn, enabled=True, glow=True)
-            self.status.setText(LANGS[self.lang]['ready'])
+            return
+        os.startfile(launcher_update['script'])
+        QtCore.QCoreApplication.quit()
 
-        except Exception as e:
-            self.log(f"Error fatal en el proceso de actualización: {e}", error=True)
-            self.status.setText(LANGS[self.lang]['update_failed'])
+    def toggle_pause(self):
+        """Pauses or resumes the running update."""
+        if not self.update_worker:
+            return
+        if self.update_worker.control.paused:
+            self.update_worker.resume()
+            self.pause_btn.setText('❚❚')
+            self.pause_btn.setToolTip(LANGS[self.lang]['pause'])
+        else:
+            self.update_worker.pause()
+            self.pause_btn.setText('▶')
+            self.pause_btn.setToolTip(LANGS[self.lang]['resume'])
+            self.status.setText(LANGS[self.lang]['paused'])
+
+    def cancel_update(self):
+        """Cancels the running update; partial downloads are kept for the next start."""
+        if self.update_worker:
+            self.update_worker.cancel()
+            self.pause_btn.setEnabled(False)
+            self.cancel_btn.setEnabled(False)
+
+    def closeEvent(self, event):
+        """Stops a running update before the window closes."""
+        self.stop_idle_verify()
+        self.stop_prestage()
+        self.stop_prefetch()
+        if self.update_worker and self.update_worker.isRunning():
+            self.update_worker.cancel()
+            self.update_worker.wait(5000)
+        super().closeEvent(event)
 
     def load_news(self):
-        """Loads news by using the NewsService."""
-        news_service = NewsService(self.config, self.lang)
-        news_html = news_service.get_news_html()
+        """Shows the cached news in the current language (no network)."""
+        with tracing.span('news.load', lang=self.lang):
+            news_html = self.news_service.get_news_html(self.lang)
         self.news_area.setHtml(news_html)
 
+    def on_news_updated(self, changed: bool):
+        """Re-renders the news once a background refresh brought new content."""
+        if changed:
+            self.load_news()
+
     def switch_language(self):
         """Switches the UI language and saves the setting."""
         self.lang = 'en' if self.lang == 'es' else 'es'
@@ -143,6 +439,9 @@ class Launcher(QtWidgets.QWidget):
     def update_ui_language(self):
         """Updates all localizable UI elements to the current language."""
         self.start_btn.setText(LANGS[self.lang]['start'])
+        self.pause_btn.setToolTip(LANGS[self.lang]['resume' if self.update_worker and self.update_worker.control.paused else 'pause'])
+        self.cancel_btn.setToolTip(LANGS[self.lang]['cancel'])
+        self.repair_btn.setToolTip(LANGS[self.lang]['repair'])
         
         if self.status.text() in (LANGS['es']['checking'], LANGS['en']['checking']):
             self.status.setText(LANGS[self.lang]['checking'])
@@ -153,8 +452,19 @@ class Launcher(QtWidgets.QWidget):
 
     def start_game(self):
         """Initializes GameService and starts the game."""
+        self.stop_idle_verify()
+        self.stop_prestage()
         game_service = GameService(self.config, self.log)
         if game_service.start():
+            from core.prestage import spawn_helper
+            if self.upcoming and self.prestage_rate() > 0:
+                # Keep pre-downloading while the game runs, once the launcher is closed
+                spawn_helper()
+            if self.config.get('PrefetchGameFiles', True):
+                from core.prefetch import needs_learning
+                if needs_learning():
+                    # Learn what this client version reads at startup, for the next warmup
+                    spawn_helper('--learn-startup')
             QtCore.QCoreApplication.quit()
 
 
@@ -1,6 +1,7 @@
 import os
 import subprocess
 from typing import Dict, Callable
+from core import tracing
 
 class GameService:
     def __init__(self, config: Dict, status_callback: Callable):
@@ -17,6 +18,12 @@ class GameService:
         Validates the game executable path and launches the game.
         Reports errors via the status callback.
         """
+        with tracing.span('game.start') as span:
+            started = self._start()
+            span.set(started=started)
+            return started
+
+    def _start(self):
         exe_name = self.config.get('StartFile')
         if not exe_name:
             self.status_callback("Error: No se ha configurado el ejecutable (StartFile).", error=True)
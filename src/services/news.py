@@ -1,51 +1,143 @@
-import requests
+import os
 import csv
+import json
+import time
+import threading
 from io import StringIO
-from typing import Dict
+from typing import Callable, Dict, List, Optional
+from core.paths import cache_dir
+from core import tracing
+
+# Column of each language in the news sheet
+LANG_COLUMNS = {'es': 0, 'en': 1}
 
 class NewsService:
-    def __init__(self, config: Dict, lang: str):
+    """
+    Server news from a Google Sheet CSV with one column per language.
+    The sheet is parsed once for every language and kept in memory and on
+    disk, so news render instantly (also after a language switch) while
+    refresh_async() fetches the latest sheet in the background
+    (stale-while-revalidate).
+    """
+    # News url -> {'columns': [[...], ...], 'fetched': timestamp}, shared by all instances
+    _memory: Dict[str, Dict] = {}
+    _memory_lock = threading.Lock()
+
+    def __init__(self, config: Dict, lang: str = 'es', cache_path: Optional[str] = None):
         self.news_url = config.get('NewsUrl', '').strip()
         self.lang = lang
+        self.cache_path = cache_path or os.path.join(cache_dir(), 'news.json')
+        # HTML shown when there are no cached news and the last refresh failed
+        self.error = None
+        self._refreshing = None
 
-    def get_news_html(self) -> str:
+    def get_news_html(self, lang: Optional[str] = None) -> str:
         """
-        Fetches news from a Google Sheet CSV and formats it as HTML.
-        Returns the HTML string for the news content.
+        Formats the cached news of a language as HTML. Never touches the network.
         """
         if not self.news_url:
             return '<i>No se ha configurado una URL de noticias.</i>'
+        news = self._cached()
+        if news is None:
+            return self.error or '<i>Cargando noticias...</i>'
 
-        lang_col = 0 if self.lang == 'es' else 1
+        lang_col = LANG_COLUMNS.get(lang or self.lang, 0)
+        columns = news['columns']
+        noticias = columns[lang_col] if lang_col < len(columns) else []
+        if not noticias:
+            return '<i>No hay novedades del servidor en este momento.</i>'
+        html = ''
+        apertura = noticias[0]
+        html += f'<b>{apertura}</b><br><br>'
+        for noticia in reversed(noticias[1:]):
+            html += f'- {noticia}<br>'
+        return html
 
+    def refresh(self) -> bool:
+        """
+        Fetches the sheet and updates the caches for every language.
+        Returns True if what get_news_html shows has changed.
+        """
+        if not self.news_url:
+            return False
+        # Imported here: requests is slow to import and not needed to show cached news
+        import requests
+        from core.http import get_cache
         try:
-            resp = requests.get(self.news_url, timeout=5)
-            if resp.status_code == 200:
-                resp.encoding = 'utf-8'
-                csvfile = StringIO(resp.text)
-                reader = csv.reader(csvfile)
-                rows = list(reader)
-
-                if rows and len(rows) > 1:
-                    noticias = []
-                    for r in rows[1:]:
-                        if len(r) > lang_col and r[lang_col].strip():
-                            noticias.append(r[lang_col].strip())
-                    
-                    if noticias:
-                        html = ''
-                        apertura = noticias[0]
-                        html += f'<b>{apertura}</b><br><br>'
-                        for noticia in reversed(noticias[1:]):
-                            html += f'- {noticia}<br>'
-                        return html
-                    else:
-                        return '<i>No hay novedades del servidor en este momento.</i>'
-                else:
-                    return '<i>No hay novedades del servidor en este momento.</i>'
-            else:
-                return '<i>No se pudo conectar para comprobar novedades.</i>'
+            with tracing.span('news.refresh', url=self.news_url) as span:
+                resp = get_cache().get(self.news_url, timeout=5)
+                span.set(status=resp.status_code, cached=resp.from_cache)
+                span.add_bytes(len(resp.content))
+            if resp.status_code != 200:
+                return self._fail('<i>No se pudo conectar para comprobar novedades.</i>')
+            rows = list(csv.reader(StringIO(resp.text)))
+            columns = self._parse(rows)
         except requests.RequestException:
-            return '<i>No se pudo conectar para comprobar novedades.</i>'
+            return self._fail('<i>No se pudo conectar para comprobar novedades.</i>')
         except Exception:
-            return '<i>Error al procesar las noticias.</i>'
\ No newline at end of file
+            return self._fail('<i>Error al procesar las noticias.</i>')
+
+        previous = self._cached()
+        self.error = None
+        news = {'url': self.news_url, 'fetched': time.time(), 'columns': columns}
+        with self._memory_lock:
+            self._memory[self.news_url] = news
+        self._save(news)
+        return previous is None or previous['columns'] != columns
+
+    def refresh_async(self, callback: Optional[Callable[[bool], None]] = None):
+        """
+        Runs refresh() on a background thread; callback receives its result
+        on that thread. A refresh already in progress is not started twice.
+        """
+        if self._refreshing and self._refreshing.is_alive():
+            return
+
+        def run():
+            changed = self.refresh()
+            if callback:
+                callback(changed)
+
+        self._refreshing = threading.Thread(target=run, daemon=True)
+        self._refreshing.start()
+
+    @staticmethod
+    def _parse(rows: List[List[str]]) -> List[List[str]]:
+        """Non-empty cells of every column, header row skipped."""
+        width = max((len(r) for r in rows), default=0)
+        return [[r[col].strip() for r in rows[1:] if len(r) > col and r[col].strip()]
+                for col in range(width)]
+
+    def _fail(self, message: str) -> bool:
+        """Keep showing stale news; without any, show the error."""
+        if self._cached() is not None:
+            return False
+        changed = self.error != message
+        self.error = message
+        return changed
+
+    def _cached(self) -> Optional[Dict]:
+        """Parsed news from memory, loading the on-disk cache the first time."""
+        with self._memory_lock:
+            news = self._memory.get(self.news_url)
+        if news is not None:
+            return news
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                news = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if news.get('url') != self.news_url or not isinstance(news.get('columns'), list):
+            return None
+        with self._memory_lock:
+            return self._memory.setdefault(self.news_url, news)
+
+    def _save(self, news: Dict):
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = self.cache_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(news, f, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
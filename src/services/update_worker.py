@@ -0,0 +1,66 @@
+from typing import Dict
+from PyQt5 import QtCore
+from core.progress import UpdateControl
+
+# What an UpdateWorker runs
+TASK_UPDATE = 'update'
+TASK_VERIFY = 'verify'
+TASK_ROLLBACK = 'rollback'
+TASK_PRESTAGE = 'prestage'
+
+class UpdateWorker(QtCore.QThread):
+    """
+    Runs the Updater pipeline off the GUI thread.
+    Status messages and ProgressEvents are delivered through queued signals,
+    so slots always run on the GUI thread.
+    """
+    status = QtCore.pyqtSignal(str)
+    progress = QtCore.pyqtSignal(object)  # core.progress.ProgressEvent
+    update_finished = QtCore.pyqtSignal(bool)
+    verify_finished = QtCore.pyqtSignal(object)  # list of files still damaged, None if it failed
+    update_failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, config: Dict, parent=None, task: str = TASK_UPDATE, **options):
+        """
+        :param task: TASK_UPDATE to check for and install updates,
+                     TASK_VERIFY to verify (and repair) the game files,
+                     TASK_ROLLBACK to restore the previous system version, or
+                     TASK_PRESTAGE to pre-download the upcoming release.
+                     TASK_ROLLBACK and TASK_PRESTAGE report through update_finished.
+        :param options: Keyword arguments for Updater.verify_files (repair, full, rate_limit)
+                        or Updater.prestage (rate_limit).
+        """
+        super().__init__(parent)
+        self.config = config
+        # Created on the worker thread: importing the update pipeline is slow
+        self.updater = None
+        self.control = UpdateControl()
+        self.task = task
+        self.options = options
+
+    def run(self):
+        try:
+            from core.updater import Updater
+            self.updater = Updater(self.config)
+            if self.task == TASK_VERIFY:
+                broken = self.updater.verify_files(self.status.emit, self.progress.emit, self.control, **self.options)
+                self.verify_finished.emit(broken)
+            elif self.task == TASK_ROLLBACK:
+                self.update_finished.emit(self.updater.rollback(self.status.emit))
+            elif self.task == TASK_PRESTAGE:
+                staged = self.updater.prestage(self.status.emit, self.progress.emit, self.control, **self.options)
+                self.update_finished.emit(staged)
+            else:
+                performed = self.updater.check_updates(self.status.emit, self.progress.emit, self.control)
+                self.update_finished.emit(performed)
+        except Exception as e:
+            self.update_failed.emit(str(e))
+
+    def pause(self):
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    def cancel(self):
+        self.control.cancel()
@@ -1,5 +1,6 @@
 from PyQt5 import QtWidgets, QtGui, QtCore
 from utils.locale import LANGS
+from utils.pixmaps import scaled_pixmap
 
 def resource_path(relative_path):
     """Helper to get absolute path to resource, works for dev and for PyInstaller"""
@@ -21,19 +22,19 @@ class LauncherUI:
         
         # Banner
         main_window.banner = QtWidgets.QLabel(main_window)
-        main_window.banner.setPixmap(QtGui.QPixmap(resource_path('assets/banner.png')).scaled(640, 80, QtCore.Qt.KeepAspectRatioByExpanding, QtCore.Qt.SmoothTransformation))
+        main_window.banner.setPixmap(scaled_pixmap(resource_path('assets/banner.png'), 640, 80, QtCore.Qt.KeepAspectRatioByExpanding, QtCore.Qt.SmoothTransformation))
         main_window.banner.setGeometry(0, 0, 640, 80)
         main_window.banner.setAlignment(QtCore.Qt.AlignCenter)
 
         # Background
         main_window.bg = QtWidgets.QLabel(main_window)
-        main_window.bg.setPixmap(QtGui.QPixmap(resource_path('assets/bg.png')).scaled(640, 340))
+        main_window.bg.setPixmap(scaled_pixmap(resource_path('assets/bg.png'), 640, 340))
         main_window.bg.setGeometry(0, 80, 640, 340)
         main_window.bg.lower()
 
         # Language Button
         main_window.lang_btn = QtWidgets.QPushButton(main_window)
-        main_window.lang_btn.setIcon(QtGui.QIcon(resource_path('assets/flag.png')))
+        main_window.lang_btn.setIcon(QtGui.QIcon(scaled_pixmap(resource_path('assets/flag.png'), 32, 32, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)))
         main_window.lang_btn.setIconSize(QtCore.QSize(32, 32))
         main_window.lang_btn.setGeometry(590, 10, 32, 32)
         main_window.lang_btn.setStyleSheet('''
@@ -43,6 +44,22 @@ class LauncherUI:
         main_window.lang_btn.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
         main_window.lang_btn.clicked.connect(main_window.switch_language)
 
+        # Verify/Repair Button (enabled once the update check is done)
+        main_window.repair_btn = QtWidgets.QPushButton('🔧', main_window)
+        main_window.repair_btn.setGeometry(550, 10, 32, 32)
+        main_window.repair_btn.setToolTip(LANGS[main_window.lang]['repair'])
+        main_window.repair_btn.setStyleSheet('''
+            QPushButton { background: transparent; border: none; color: #ffcc66; font-size: 18px; }
+            QPushButton:hover { background: rgba(255, 204, 102, 0.18); border-radius: 8px; border: 1px solid #ffcc66; }
+            QPushButton:disabled { color: #666; }
+        ''')
+        main_window.repair_btn.setCursor(QtGui.QCursor(QtCore.Qt.PointingHandCursor))
+        main_window.repair_btn.setEnabled(False)
+        main_window.repair_btn.clicked.connect(main_window.repair_files)
+        # Right click: restore the previous version kept by the last update
+        main_window.repair_btn.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
+        main_window.repair_btn.customContextMenuRequested.connect(main_window.show_repair_menu)
+
         # Start Button
         main_window.start_btn = QtWidgets.QPushButton(LANGS[main_window.lang]['start'], main_window)
         main_window.start_btn.setGeometry(470, 340, 150, 50)
@@ -69,10 +86,40 @@ class LauncherUI:
 
         # Status Label
         main_window.status = QtWidgets.QLabel(LANGS[main_window.lang]['checking'], main_window)
-        main_window.status.setGeometry(30, 350, 400, 30)
+        main_window.status.setGeometry(30, 350, 330, 30)
         main_window.status.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignVCenter)
         main_window.status.setStyleSheet('color: #fff; font-size: 16px; background: rgba(0,0,0,0.5); font-weight: bold; border-radius: 6px; padding-left: 8px;')
 
+        # Update controls (only visible while an update is running)
+        update_btn_style = '''
+            QPushButton { background-color: rgba(0,0,0,0.5); color: #ffcc66; font-size: 14px; font-weight: bold; border-radius: 6px; border: 1px solid #ffcc66; }
+            QPushButton:hover { background-color: rgba(255, 204, 102, 0.18); }
+        '''
+        main_window.pause_btn = QtWidgets.QPushButton('❚❚', main_window)
+        main_window.pause_btn.setGeometry(370, 350, 40, 30)
+        main_window.pause_btn.setToolTip(LANGS[main_window.lang]['pause'])
+        main_window.pause_btn.setStyleSheet(update_btn_style)
+        main_window.pause_btn.clicked.connect(main_window.toggle_pause)
+        main_window.pause_btn.hide()
+
+        main_window.cancel_btn = QtWidgets.QPushButton('✕', main_window)
+        main_window.cancel_btn.setGeometry(416, 350, 40, 30)
+        main_window.cancel_btn.setToolTip(LANGS[main_window.lang]['cancel'])
+        main_window.cancel_btn.setStyleSheet(update_btn_style)
+        main_window.cancel_btn.clicked.connect(main_window.cancel_update)
+        main_window.cancel_btn.hide()
+
+        # Progress Bar (below the status label while downloading/extracting)
+        main_window.progress_bar = QtWidgets.QProgressBar(main_window)
+        main_window.progress_bar.setGeometry(30, 384, 426, 6)
+        main_window.progress_bar.setRange(0, 1000)
+        main_window.progress_bar.setTextVisible(False)
+        main_window.progress_bar.setStyleSheet('''
+            QProgressBar { background: rgba(0,0,0,0.5); border: none; border-radius: 3px; }
+            QProgressBar::chunk { background-color: #ffcc66; border-radius: 3px; }
+        ''')
+        main_window.progress_bar.hide()
+
     def set_start_btn_style(self, button, enabled, glow):
         shadow_effect = QtWidgets.QGraphicsDropShadowEffect(button)
         
@@ -10,7 +10,23 @@ LANGS = {
         'ready': 'Listo para jugar',
         'update_failed': 'No se pudo conectar con el servidor de actualizaciones.',
         'client_updated': 'Cliente Actualizado',
-        'downloading_system': 'Descargando System version'
+        'downloading_system': 'Descargando System version',
+        'downloading': 'Descargando',
+        'extracting': 'Descomprimiendo',
+        'pause': 'Pausar',
+        'resume': 'Reanudar',
+        'cancel': 'Cancelar',
+        'paused': 'Actualización en pausa',
+        'cancelled': 'Actualización cancelada',
+        'verifying': 'Verificando',
+        'repair': 'Verificar y reparar archivos',
+        'repaired': 'Archivos reparados',
+        'repair_failed': 'Archivos sin reparar',
+        'verify_failed': 'No se pudo completar la verificación',
+        'damaged_files': 'Archivos dañados',
+        'rollback': 'Volver a la versión anterior',
+        'rolled_back': 'Versión anterior restaurada',
+        'rollback_failed': 'No hay una versión anterior guardada'
     },
     'en': {
         'start': 'PLAY',
@@ -19,7 +35,23 @@ LANGS = {
         'ready': 'Ready to play',
         'update_failed': 'Could not connect to the update server.',
         'client_updated': 'Client Updated',
-        'downloading_system': 'Downloading System version'
+        'downloading_system': 'Downloading System version',
+        'downloading': 'Downloading',
+        'extracting': 'Extracting',
+        'pause': 'Pause',
+        'resume': 'Resume',
+        'cancel': 'Cancel',
+        'paused': 'Update paused',
+        'cancelled': 'Update cancelled',
+        'verifying': 'Verifying',
+        'repair': 'Verify and repair files',
+        'repaired': 'Files repaired',
+        'repair_failed': 'Files not repaired',
+        'verify_failed': 'The verification could not be completed',
+        'damaged_files': 'Damaged files',
+        'rollback': 'Restore previous version',
+        'rolled_back': 'Previous version restored',
+        'rollback_failed': 'No previous version saved'
     }
 }
 
@@ -0,0 +1,41 @@
+import os
+import hashlib
+from PyQt5 import QtGui, QtCore
+from core.paths import cache_dir
+
+def scaled_pixmap(path: str, width: int, height: int,
+                  aspect_mode=QtCore.Qt.IgnoreAspectRatio,
+                  transform_mode=QtCore.Qt.FastTransformation) -> QtGui.QPixmap:
+    """
+    Load an image scaled to width x height, reusing a pre-scaled copy from disk.
+    Copies live in cache/pixmaps/ and are keyed by the hash of the asset and
+    the scaling parameters, so a new asset never shows a stale copy. The
+    copy is stored as uncompressed PNG, which decodes much faster than
+    decoding and scaling the full-size asset.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return QtGui.QPixmap()
+    key = hashlib.sha1(data).hexdigest()[:20]
+    cached_path = os.path.join(cache_dir(), 'pixmaps',
+                               f'{key}_{width}x{height}_{int(aspect_mode)}{int(transform_mode)}.png')
+    pixmap = QtGui.QPixmap(cached_path) if os.path.exists(cached_path) else QtGui.QPixmap()
+    if not pixmap.isNull():
+        return pixmap
+
+    source = QtGui.QPixmap()
+    source.loadFromData(data)
+    if source.isNull():
+        return source
+    pixmap = source.scaled(width, height, aspect_mode, transform_mode)
+    try:
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        tmp_path = cached_path + '.tmp'
+        # Quality 100: no compression, fastest to load next time
+        if pixmap.save(tmp_path, 'PNG', 100):
+            os.replace(tmp_path, cached_path)
+    except OSError:
+        pass
+    return pixmap
@@ -0,0 +1,26 @@
+import os
+import sys
+import time
+from typing import Dict
+
+# Reference point of every mark: when this module was first imported,
+# which main.py does before anything else
+_START = time.perf_counter()
+_marks: Dict[str, float] = {}
+
+def mark(name: str):
+    """Record the time since start of a startup milestone (first call wins)."""
+    _marks.setdefault(name, time.perf_counter() - _START)
+
+def marks() -> Dict[str, float]:
+    """Milestones recorded so far, in seconds since start."""
+    return dict(_marks)
+
+def enabled() -> bool:
+    """Timings are reported with --timing or L2_TIMING=1."""
+    return '--timing' in sys.argv or os.environ.get('L2_TIMING') == '1'
+
+def report() -> str:
+    """One line per milestone, in milliseconds."""
+    return '\n'.join(f'{name:<12} {seconds * 1000:8.1f} ms'
+                     for name, seconds in sorted(_marks.items(), key=lambda item: item[1]))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The launcher runs from src/ (python src/main.py, python -m core.X)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
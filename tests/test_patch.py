@@ -0,0 +1,43 @@
+import os
+import random
+import hashlib
+import pytest
+from core.patch import make_patch, apply_patch
+from core.exceptions import PatchError
+
+def files(tmp_path):
+    """An old file and a new version with a changed record, an insertion and a removal."""
+    rng = random.Random(7)
+    old = bytearray(rng.randbytes(256 * 1024))
+    new = bytearray(old)
+    new[1000:1100] = rng.randbytes(100)
+    new[50000:50000] = rng.randbytes(3000)
+    del new[120000:125000]
+    paths = {}
+    for name, data in (('old', old), ('new', new)):
+        paths[name] = str(tmp_path / name)
+        with open(paths[name], 'wb') as f:
+            f.write(data)
+    paths['patch'] = str(tmp_path / 'new.patch')
+    return paths, bytes(new)
+
+def test_patch_round_trip(tmp_path):
+    paths, new = files(tmp_path)
+    size = make_patch(paths['old'], paths['new'], paths['patch'])
+    assert size is not None and size < len(new) // 4
+    target = str(tmp_path / 'rebuilt')
+    expected = hashlib.sha256(new).hexdigest()
+    assert apply_patch(paths['old'], paths['patch'], target, expected) == expected
+    with open(target, 'rb') as f:
+        assert f.read() == new
+
+@pytest.mark.parametrize('wrong_from', [b'\0' * (256 * 1024), b'other size'])
+def test_patch_from_wrong_file_is_rejected(tmp_path, wrong_from):
+    paths, _ = files(tmp_path)
+    make_patch(paths['old'], paths['new'], paths['patch'])
+    with open(paths['old'], 'wb') as f:
+        f.write(wrong_from)
+    target = str(tmp_path / 'rebuilt')
+    with pytest.raises(PatchError):
+        apply_patch(paths['old'], paths['patch'], target)
+    assert not os.path.exists(target)
@@ -0,0 +1,77 @@
+import os
+from core.staging import StagedUpdate, STATE_COMMITTING
+
+VERSION = 'system/system_version.txt'
+
+def write(root, key, data):
+    path = os.path.join(root, *key.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(data)
+
+def read(root, key):
+    path = os.path.join(root, *key.split('/'))
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def client(tmp_path):
+    root = str(tmp_path)
+    write(root, VERSION, '1')
+    write(root, 'system/a.dat', 'a1')
+    write(root, 'system/old.dat', 'old')
+    return root
+
+def stage(root):
+    """Stage version 2: a.dat changed, b.dat added, old.dat removed."""
+    update = StagedUpdate(root, VERSION)
+    assert not update.begin('2', '1')
+    for key, data in ((VERSION, '2'), ('system/a.dat', 'a2'), ('system/b.dat', 'b2')):
+        write(update.stage_folder, key, data)
+        update.staged(key)
+    update.remove('system/old.dat')
+    update.flush()
+    return update
+
+def test_commit_moves_staged_files_into_place(tmp_path):
+    root = client(tmp_path)
+    update = stage(root)
+    assert read(root, 'system/a.dat') == 'a1'
+    update.commit()
+    assert read(root, VERSION) == '2'
+    assert read(root, 'system/a.dat') == 'a2'
+    assert read(root, 'system/b.dat') == 'b2'
+    assert read(root, 'system/old.dat') is None
+    assert not os.path.exists(update.journal_path)
+    assert not os.path.exists(update.stage_folder)
+
+def test_recover_finishes_an_interrupted_commit(tmp_path):
+    root = client(tmp_path)
+    update = stage(root)
+    # Crash after the snapshot and the first rename, before the version file
+    update._snapshot(update.journal)
+    update.journal['state'] = STATE_COMMITTING
+    update.flush()
+    os.replace(update.stage_path('system/a.dat'), update.live_path('system/a.dat'))
+    assert read(root, VERSION) == '1'
+
+    journal = StagedUpdate(root, VERSION).recover()
+    assert journal is not None and journal['version'] == '2'
+    assert read(root, VERSION) == '2'
+    assert read(root, 'system/a.dat') == 'a2'
+    assert read(root, 'system/b.dat') == 'b2'
+    assert read(root, 'system/old.dat') is None
+    assert StagedUpdate(root, VERSION).recover() is None
+
+def test_rollback_restores_replaced_and_deleted_files(tmp_path):
+    root = client(tmp_path)
+    stage(root).commit()
+
+    snapshot = StagedUpdate(root, VERSION).rollback()
+    assert snapshot['version'] == '1'
+    assert read(root, VERSION) == '1'
+    assert read(root, 'system/a.dat') == 'a1'
+    assert read(root, 'system/old.dat') == 'old'
+    assert read(root, 'system/b.dat') is None
+    assert StagedUpdate(root, VERSION).rollback() is None